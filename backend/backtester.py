@@ -1,15 +1,106 @@
-import ccxt
 import pandas as pd
 import numpy as np
-from datetime import datetime, timedelta
 import time
-from concurrent.futures import ThreadPoolExecutor, as_completed
+import os
+import itertools
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
 
 # --- NOVAS IMPORTAÇÕES V6.8 ---
 from indicators import add_indicators
 from paper_trading import ASSET_PARAMS
 from notification import notify_backtest_report
 from strategy import check_entry_strategy # O Cérebro Unificado
+from ohlcv_archive import ohlcv_archive
+from rate_limiter import create_exchange, PRIORITY_BACKTEST
+from single_flight import SingleFlight
+from btc_regime import BTC_STATUS_LABELS, BTC_BEAR, classify_regime
+from equity_curve import EquityCurve
+
+# Colunas numéricas usadas pela simulação (além do timestamp em epoch ms)
+SIM_COLUMNS = ('open', 'high', 'low', 'close', 'volume', 'rsi', 'bb_upper', 'bb_lower', 'ema200', 'atr', 'fibo_high', 'fibo_low')
+
+# Downloads de histórico compartilhados entre backtests que começam juntos
+HISTORY_CACHE_TTL = 60
+history_flight = SingleFlight('history', ttl=HISTORY_CACHE_TTL, max_entries=32)
+
+COOLDOWN_MS = 4 * 60 * 60 * 1000 # Modo Inverno: 4 horas
+
+# Parâmetros de ASSET_PARAMS que podem variar no modo Sweep
+SWEEP_PARAM_KEYS = ('rsi_buy', 'stop_atr_mult', 'tp_risk_mult')
+MAX_SWEEP_COMBINATIONS = 500
+SIM_CHECK_EVERY = 2048  # Candles entre checkpoints da simulação (progresso/cancelamento)
+
+class SimulationCancelled(Exception):
+    pass
+
+def format_sim_time(ts_ms):
+    # Mesmo formato de str(pd.Timestamp) usado no log de trades
+    return str(pd.Timestamp(ts_ms, unit='ms'))
+
+# --- MEMÓRIA COMPARTILHADA DO SWEEP ---
+# Os arrays do mercado são copiados UMA vez para um bloco SharedMemory;
+# cada processo do pool monta views NumPy sobre o mesmo bloco (sem pickle dos dados).
+
+def _market_array_items(market):
+    yield ("time",), market["time"]
+    yield ("btc_status",), market["btc_status"]
+    for sym in market["symbols"]:
+        yield ("local_idx", sym), market["local_idx"][sym]
+        yield ("valid", sym), market["valid"][sym]
+        for col, arr in market["columns"][sym].items():
+            yield ("columns", sym, col), arr
+
+def share_market(market):
+    """Copia os arrays para SharedMemory e retorna (bloco, layout picklable)."""
+    items = [(path, np.ascontiguousarray(arr)) for path, arr in _market_array_items(market)]
+    total = sum(arr.nbytes for _, arr in items) or 1
+    shm = shared_memory.SharedMemory(create=True, size=total)
+    entries, offset = [], 0
+    for path, arr in items:
+        view = np.ndarray(arr.shape, dtype=arr.dtype, buffer=shm.buf, offset=offset)
+        view[...] = arr
+        entries.append((path, arr.dtype.str, arr.shape, offset))
+        offset += arr.nbytes
+    return shm, {"name": shm.name, "symbols": market["symbols"], "entries": entries}
+
+def attach_market(layout):
+    """Reconstrói o dict de mercado como views sobre o SharedMemory (zero-copy)."""
+    shm = shared_memory.SharedMemory(name=layout["name"])
+    market = {"symbols": layout["symbols"], "local_idx": {}, "valid": {}, "columns": {}}
+    for path, dtype, shape, offset in layout["entries"]:
+        arr = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+        if len(path) == 1: market[path[0]] = arr
+        elif path[0] == "columns": market["columns"].setdefault(path[1], {})[path[2]] = arr
+        else: market[path[0]][path[1]] = arr
+    return shm, market
+
+_SWEEP_STATE = {}
+
+def _sweep_init(layout, cancel_event):
+    shm, market = attach_market(layout)
+    _SWEEP_STATE["cancel"] = cancel_event
+    _SWEEP_STATE["shm"] = shm # Mantém o bloco aberto enquanto o processo viver
+    _SWEEP_STATE["market"] = market
+    # Lê as views do bloco direto: converter para listas duplicaria o mercado inteiro em cada processo
+    _SWEEP_STATE["prepared"] = BacktesterEngine.prepare_sim_inputs(market, as_lists=False)
+
+def _sweep_checkpoint(_):
+    # Sweep cancelado: a combinação em andamento para no próximo checkpoint
+    if _SWEEP_STATE["cancel"].is_set(): raise SimulationCancelled()
+
+def _sweep_worker(task):
+    combo, initial_balance, risk_pct, ignore_trend = task
+    market = _SWEEP_STATE["market"]
+    params_by_symbol = {sym: {**ASSET_PARAMS.get(sym, ASSET_PARAMS["DEFAULT"]), **combo} for sym in market["symbols"]}
+    sim = BacktesterEngine.simulate(market, params_by_symbol, initial_balance, risk_pct, ignore_trend, prepared=_SWEEP_STATE["prepared"], checkpoint=_sweep_checkpoint)
+    stats = BacktesterEngine.compile_stats(sim, market["time"], initial_balance)
+    return {
+        "params": combo, "roi_pct": stats["roi_pct"], "win_rate": stats["win_rate"],
+        "max_drawdown": stats["max_drawdown"], "total_trades": stats["total_trades"],
+        "final_balance": stats["final_balance"]
+    }
 
 class BacktesterEngine:
     
@@ -26,11 +117,20 @@ class BacktesterEngine:
     def fetch_data_worker(args):
         """
         Worker que baixa dados da Binance. 
-        CORREÇÃO V6.9: Aumento drástico do Warmup para estabilizar EMA200.
+        Backtests simultâneos pedindo o mesmo (symbol, timeframe, days) dividem um único download
+        e reaproveitam o resultado por HISTORY_CACHE_TTL segundos (DataFrame somente leitura).
         """
         symbol, timeframe, days_target = args
+        return history_flight.do((symbol, timeframe, days_target), lambda: BacktesterEngine._download_history(symbol, timeframe, days_target))
+
+    @staticmethod
+    def _download_history(symbol, timeframe, days_target):
+        """
+        CORREÇÃO V6.9: Aumento drástico do Warmup para estabilizar EMA200.
+        Usa o arquivo local OHLCV (memmap) e baixa apenas os candles que faltam.
+        """
         try:
-            exchange = ccxt.binance({'enableRateLimit': True, 'options': {'defaultType': 'spot'}})
+            exchange = create_exchange(priority=PRIORITY_BACKTEST, client='backtest')
             now = exchange.milliseconds()
             ms_per_candle = BacktesterEngine.timeframe_to_ms(timeframe)
             
@@ -42,35 +142,17 @@ class BacktesterEngine:
             duration_ms = days_target * 24 * 60 * 60 * 1000
             since = now - duration_ms - warmup_ms
             
-            all_ohlcv = []
-            while since < now:
-                ohlcv = exchange.fetch_ohlcv(symbol, timeframe, since=since, limit=1000)
-                if not ohlcv: break
-                
-                # Evita duplicatas na paginação
-                if all_ohlcv and ohlcv[0][0] == all_ohlcv[-1][0]: 
-                    ohlcv = ohlcv[1:]
-                    
-                all_ohlcv.extend(ohlcv)
-                
-                # Avança o cursor de tempo
-                since = ohlcv[-1][0] + 1
-                
-                # Se a exchange retornou menos que o limite, chegamos ao fim (ou aos dias atuais)
-                if len(ohlcv) < 1000: 
-                    # IMPORTANTE: Não breakamos imediatamente se ainda não cobrimos o tempo, 
-                    # mas em 'since < now' o loop resolve. 
-                    # Adicionamos um sleep para garantir rate limit
-                    time.sleep(0.1)
+            # Arquivo local: só baixa o que falta (antes do início e depois do último candle salvo)
+            records, _ = ohlcv_archive.sync(exchange, symbol, timeframe, since, now, ms_per_candle)
             
             # Se tivermos poucos dados, aborta
-            if len(all_ohlcv) < 200: return None 
+            if len(records) < 200: return None 
             
-            df = pd.DataFrame(all_ohlcv, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-            df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms')
-            
-            # Limpeza de dados
-            df = df.drop_duplicates(subset=['timestamp'], keep='last').sort_values('timestamp')
+            # Só candles fechados: anexar o candle em formação copiaria todas as colunas, e ele seria
+            # simulado como se já tivesse fechado (OHLC ainda mudando).
+            # Cada coluna é uma view do memmap (sem cópia); o arquivo já vem ordenado e sem duplicatas.
+            # Timestamps em epoch ms (UTC) do início ao fim da simulação.
+            df = pd.DataFrame({name: records[name] for name in records.dtype.names}, copy=False)
             
             # --- INDICADORES ---
             # Calculamos os indicadores COM o histórico de warmup
@@ -79,8 +161,9 @@ class BacktesterEngine:
             # --- CORTE DO WARMUP ---
             # Agora cortamos os dados "velhos" e entregamos apenas o período que o usuário pediu.
             # Como a EMA foi calculada antes do corte, ela estará perfeita no primeiro candle da simulação.
-            cutoff_date = datetime.now() - timedelta(days=days_target)
-            df = df[df['timestamp'] >= cutoff_date]
+            # (mesma base de tempo da exchange, em ms — sem misturar com o fuso local)
+            start = int(np.searchsorted(df['timestamp'].to_numpy(), now - duration_ms, side='left'))
+            df = df.iloc[start:]
             
             return (symbol, df)
         except Exception as e:
@@ -91,7 +174,7 @@ class BacktesterEngine:
     def prepare_btc_macro_data(timeframe, days):
         """
         Baixa e processa o BTC para servir de 'Sentinela' no backtest.
-        Gera um dicionário {timestamp: status} ('BULL', 'BEAR', 'CRASH')
+        Gera os arrays (timestamps_ms, códigos de status) com códigos de BTC_STATUS_LABELS.
         """
         # Sempre baixamos BTC no H1 ou no timeframe selecionado? 
         # Para fidelidade com o bot real (que usa H1 para macro), idealmente usaríamos H1.
@@ -100,124 +183,128 @@ class BacktesterEngine:
         
         print("🔎 Baixando dados do BITCOIN para Correlação Macro...")
         res = BacktesterEngine.fetch_data_worker(("BTC/USDT", timeframe, days))
-        if not res: return {}
+        if not res: return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int8)
         
         _, df = res
-        btc_map = {}
-        
-        for index, row in df.iterrows():
-            ts = row['timestamp']
-            price = row['close']
-            ema200 = row['ema200']
-            rsi = row['rsi']
-            
-            status = "BULL"
-            reason = "Normal"
-            
-            # Lógica idêntica ao get_bitcoin_health do market_data.py
-            if rsi < 25:
-                status = "CRASH"
-            elif price < ema200:
-                status = "BEAR"
-            else:
-                status = "BULL"
-                
-            btc_map[ts] = status
-            
-        return btc_map
+        price = df['close'].to_numpy(dtype=np.float64)
+        ema200 = df['ema200'].to_numpy(dtype=np.float64)
+        rsi = df['rsi'].to_numpy(dtype=np.float64)
+
+        # Mesma regra do bot ao vivo (BtcRegimeService), aplicada ao array inteiro
+        codes = classify_regime(price, ema200, rsi)
+        return BacktesterEngine._to_epoch_ms(df['timestamp']), codes
 
     @staticmethod
-    def run_portfolio(symbols_list, timeframe="5m", days=7, initial_balance=1000.0, risk_pct=10, chat_id=None, ignore_trend=False, progress_callback=None):
+    def _to_epoch_ms(ts_series):
+        # Pode ser uma view com stride do memmap do arquivo OHLCV: searchsorted/tolist não exigem cópia contígua
+        return ts_series.to_numpy(dtype=np.int64)
+
+    @staticmethod
+    def build_market_arrays(data_feed, btc_macro):
         """
-        Executa simulação Async com suporte a Strategy Unificada, BTC Correlation e Modo Inverno.
+        Converte os DataFrames em arrays NumPy (views, sem cópia) alinhados num eixo de tempo int64 (epoch ms).
+        Substitui os dicts {Timestamp: idx} por um array de índice local (-1 = candle ausente).
         """
-        
-        # --- 1. DOWNLOAD DE DADOS (COM BARRA DE PROGRESSO) ---
-        if progress_callback: progress_callback(5, "Baixando Histórico BTC (Macro)...")
-        
-        # A. Prepara o Mapa do Bitcoin (Sentinela)
-        btc_macro_map = BacktesterEngine.prepare_btc_macro_data(timeframe, days)
-        
-        if progress_callback: progress_callback(10, "Baixando Altcoins...")
-        
-        data_feed = {}
-        total_assets = len(symbols_list)
-        completed_downloads = 0
-        
-        # B. Download Paralelo das Altcoins
-        with ThreadPoolExecutor(max_workers=5) as executor:
-            tasks = [(sym, timeframe, days) for sym in symbols_list]
-            future_to_symbol = {executor.submit(BacktesterEngine.fetch_data_worker, task): task[0] for task in tasks} 
-            
-            for future in as_completed(future_to_symbol):
-                res = future.result()
-                completed_downloads += 1
-                
-                if progress_callback:
-                    # Progresso visual de 10% a 85%
-                    pct = 10 + int((completed_downloads / total_assets) * 75)
-                    progress_callback(pct, f"Baixando: {completed_downloads}/{total_assets}")
+        symbols = list(data_feed.keys())
+        series_ts = {sym: BacktesterEngine._to_epoch_ms(df['timestamp']) for sym, df in data_feed.items()}
+        time_axis = np.unique(np.concatenate(list(series_ts.values()))) if series_ts else np.empty(0, dtype=np.int64)
+
+        local_idx, columns, valid = {}, {}, {}
+        for sym, df in data_feed.items():
+            ts = series_ts[sym]
+            pos = np.searchsorted(ts, time_axis).clip(max=len(ts) - 1)
+            local_idx[sym] = np.where(ts[pos] == time_axis, pos, -1).astype(np.int64)
+            columns[sym] = {'timestamp': ts}
+            for col in SIM_COLUMNS:
+                columns[sym][col] = df[col].to_numpy(dtype=np.float64)
+            # Candles sem EMA200/RSI não passam pela estratégia
+            valid[sym] = ~(np.isnan(columns[sym]['ema200']) | np.isnan(columns[sym]['rsi']))
+
+        # Status do BTC alinhado ao eixo; minuto sem dado do BTC = BEAR (segurança)
+        btc_ts, btc_codes = btc_macro
+        btc_status = np.full(len(time_axis), BTC_BEAR, dtype=np.int8)
+        if len(btc_ts):
+            pos = np.searchsorted(btc_ts, time_axis).clip(max=len(btc_ts) - 1)
+            hit = btc_ts[pos] == time_axis
+            btc_status[hit] = btc_codes[pos[hit]]
+
+        return {"time": time_axis, "symbols": symbols, "local_idx": local_idx,
+                "columns": columns, "valid": valid, "btc_status": btc_status}
 
-                if res: 
-                    sym, df = res
-                    if not df.empty: data_feed[sym] = df
+    @staticmethod
+    def prepare_sim_inputs(market, as_lists=True):
+        """
+        Converte os arrays em listas Python uma vez (acesso escalar por índice é mais rápido em lista).
+        Com as_lists=False devolve os próprios arrays (ex: views do SharedMemory no Sweep), sem cópia.
+        """
+        symbols = market["symbols"]
+        convert = (lambda a: a.tolist()) if as_lists else (lambda a: a)
+        return {
+            "time": convert(market["time"]),
+            "local_idx": {sym: convert(market["local_idx"][sym]) for sym in symbols},
+            "valid": {sym: convert(market["valid"][sym]) for sym in symbols},
+            "cols": {sym: {c: convert(a) for c, a in market["columns"][sym].items()} for sym in symbols},
+            "btc_status": convert(market["btc_status"]),
+        }
 
-        if not data_feed: return {"success": False, "message": "Falha total no download dos dados."}
-        
-        # --- 2. SINCRONIZAÇÃO DE TIMEFRAMES ---
-        if progress_callback: progress_callback(85, "Alinhando Dados...")
-        valid_dfs = list(data_feed.values())
-        all_timestamps = set()
-        for df in valid_dfs: all_timestamps.update(set(df['timestamp']))
-        timestamps = sorted(list(all_timestamps))
-        
-        if not timestamps: return {"success": False, "message": "Sem dados comuns entre os ativos."}
-        
-        # Mapa de acesso rápido para performance O(1)
-        time_index_map = {sym: {t: i for i, t in enumerate(df['timestamp'])} for sym, df in data_feed.items()}
+    @staticmethod
+    def simulate(market, params_by_symbol, initial_balance, risk_pct, ignore_trend, prepared=None, checkpoint=None):
+        """
+        Loop cronológico com estado de posição e Modo Inverno sobre arrays e escalares.
+        Nenhum acesso a pandas dentro do loop: cada candle é lido por índice inteiro.
+        `prepared` permite reaproveitar prepare_sim_inputs entre várias simulações (Sweep).
+        `checkpoint(fração concluída)` é chamado a cada SIM_CHECK_EVERY candles; uma exceção
+        lançada por ele (ex: JobCancelled) interrompe a simulação.
+        """
+        prepared = prepared or BacktesterEngine.prepare_sim_inputs(market)
+        time_axis = prepared["time"]
+        symbols = market["symbols"]
+        local_idx, valid, cols = prepared["local_idx"], prepared["valid"], prepared["cols"]
+        btc_codes = prepared["btc_status"]
+        scan_order = [(sym, local_idx[sym], valid[sym], cols[sym], params_by_symbol[sym]) for sym in symbols]
+        row_keys = ('timestamp',) + SIM_COLUMNS
 
-        # --- 3. SIMULAÇÃO (CORE LOOP) ---
-        if progress_callback: progress_callback(90, "Executando Estratégia V6.8...")
-        
         wallet_cash = float(initial_balance) 
         position = None 
         trades_log = []
-        equity_curve = [] 
+        equity_time, equity_value = [], []
         ignored_count = 0
         peak_equity = float(initial_balance)
         max_drawdown_pct = 0.0              
+        current_total_equity = wallet_cash
 
         # Variáveis do MODO INVERNO (Cool Down)
         consecutive_losses = 0
-        cooldown_until_ts = None # Timestamp de desbloqueio
+        cooldown_until_ts = None # Timestamp (ms) de desbloqueio
 
         # Loop Cronológico (Candle a Candle)
-        for current_time in timestamps:
+        total_candles = len(time_axis)
+        for i, current_time in enumerate(time_axis):
+            if checkpoint and i % SIM_CHECK_EVERY == 0: checkpoint(i / total_candles)
             
             # [REGRA 1] MODO INVERNO: Se estiver de castigo, pula o candle
-            if cooldown_until_ts and current_time < cooldown_until_ts:
-                # Mantém o equity anterior no gráfico (linha reta)
-                equity_curve.append({"time": int(current_time.timestamp() * 1000), "value": round(wallet_cash, 2)})
-                continue
-            elif cooldown_until_ts and current_time >= cooldown_until_ts:
+            if cooldown_until_ts is not None:
+                if current_time < cooldown_until_ts:
+                    # Mantém o equity anterior no gráfico (linha reta)
+                    equity_time.append(current_time); equity_value.append(round(wallet_cash, 2))
+                    continue
                 # Saiu do castigo
                 cooldown_until_ts = None
 
             current_total_equity = wallet_cash
             
             # Status do Bitcoin neste minuto
-            btc_status = btc_macro_map.get(current_time, "BEAR")
+            btc_status = BTC_STATUS_LABELS[btc_codes[i]]
 
             # A. GESTÃO DE POSIÇÃO (EXIT)
             if position:
                 sym = position['symbol']
-                df = data_feed.get(sym)
-                idx = time_index_map.get(sym, {}).get(current_time)
+                idx = local_idx[sym][i]
                 
-                if df is not None and idx is not None:
-                    candle = df.iloc[idx]
-                    current_price = candle['close']
-                    high, low = candle['high'], candle['low']
+                if idx >= 0:
+                    c = cols[sym]
+                    current_price = c['close'][idx]
+                    high, low = c['high'][idx], c['low'][idx]
                     
                     # Atualiza valor da posição para Equity Curve
                     position_value = position['amount'] * current_price
@@ -227,7 +314,6 @@ class BacktesterEngine:
                     pnl_realized = 0
                     result_type = ""
 
-                    # Verifica SL e TP
                     # Prioridade 1: Stop Loss (Low tocou no SL?)
                     if low <= position['sl']:
                         exit_price = position['sl'] 
@@ -257,13 +343,13 @@ class BacktesterEngine:
                             consecutive_losses += 1 # Derrota aumenta stress
                             if consecutive_losses >= 3:
                                 # Ativa bloqueio de 4 horas
-                                cooldown_until_ts = current_time + timedelta(hours=4)
+                                cooldown_until_ts = current_time + COOLDOWN_MS
                                 consecutive_losses = 0 # Reseta para próximo ciclo
                         # ----------------------------------
 
                         current_total_equity = wallet_cash
                         trades_log.append({
-                            'time': str(current_time), 'symbol': sym, 'side': 'SELL', 
+                            'time': format_sim_time(current_time), 'symbol': sym, 'side': 'SELL', 
                             'res': result_type, 'pnl': pnl_realized, 'balance': wallet_cash,
                             'reason': f"Hit {result_type} (LossStreak: {consecutive_losses})"
                         })
@@ -271,26 +357,17 @@ class BacktesterEngine:
 
             # B. SCANNER (ENTRY) - Só se não estiver posicionado
             if not position:
-                for sym in data_feed.keys():
-                    df = data_feed[sym]
-                    idx = time_index_map[sym].get(current_time)
-                    if idx is None: continue 
+                for sym, sym_idx, sym_valid, c, params in scan_order:
+                    idx = sym_idx[i]
+                    if idx < 0 or not sym_valid[idx]: continue 
                     
-                   # Linha atual
-                    candle_row = df.iloc[idx]
-                    
-                    # --- NOVO: Linha Anterior ---
-                    # Se for o primeiro candle, não tem anterior (None)
-                    prev_row = df.iloc[idx - 1] if idx > 0 else None
-                    
-                    if pd.isna(candle_row['ema200']) or pd.isna(candle_row['rsi']): continue
+                    # Linha atual e anterior (do próprio ativo) como dicts de escalares
+                    candle_row = {k: c[k][idx] for k in row_keys}
+                    prev_row = {k: c[k][idx - 1] for k in row_keys} if idx > 0 else None
 
-                    params = ASSET_PARAMS.get(sym, ASSET_PARAMS["DEFAULT"])
-                    
-                    # CHAMADA À ESTRATÉGIA (Passando prev_row)
                     should_buy, reason, meta = check_entry_strategy(
                         candle_row, 
-                        prev_row,  # <--- Passamos o anterior aqui
+                        prev_row,
                         params, 
                         btc_status=btc_status, 
                         ignore_trend=ignore_trend
@@ -323,7 +400,7 @@ class BacktesterEngine:
                         }
                         
                         trades_log.append({
-                            'time': str(current_time), 
+                            'time': format_sim_time(current_time), 
                             'symbol': sym, 
                             'side': 'BUY', 
                             'res': 'ENTRY', 
@@ -342,364 +419,160 @@ class BacktesterEngine:
             if drawdown < max_drawdown_pct: max_drawdown_pct = drawdown
 
             # Equity Curve
-            equity_curve.append({"time": int(current_time.timestamp() * 1000), "value": round(current_total_equity, 2)})
+            equity_time.append(current_time); equity_value.append(round(current_total_equity, 2))
 
-        # --- 4. RELATÓRIO FINAL ---
-        if progress_callback: progress_callback(98, "Compilando Estatísticas...")
-        
-        final_balance = current_total_equity
+        return {
+            "final_balance": current_total_equity, "trades": trades_log, "ignored": ignored_count,
+            "max_drawdown_pct": max_drawdown_pct, "equity_time": equity_time, "equity_value": equity_value
+        }
+
+    @staticmethod
+    def compile_stats(sim, time_axis, initial_balance):
+        final_balance = sim["final_balance"]
+        trades_log = sim["trades"]
         profit_total = final_balance - initial_balance
         wins = len([t for t in trades_log if t['res'] == 'WIN'])
         losses = len([t for t in trades_log if t['res'] == 'LOSS'])
         total_closed = wins + losses
         
-        start_date_str = timestamps[0].strftime('%d/%m/%Y %H:%M') if timestamps else "N/A"
-        end_date_str = timestamps[-1].strftime('%d/%m/%Y %H:%M') if timestamps else "N/A"
-        delta = timestamps[-1] - timestamps[0] if timestamps else None
-        duration_str = f"{delta.days}d {delta.seconds//3600}h" if delta else "0d"
+        has_time = len(time_axis) > 0
+        start_date_str = pd.Timestamp(int(time_axis[0]), unit='ms').strftime('%d/%m/%Y %H:%M') if has_time else "N/A"
+        end_date_str = pd.Timestamp(int(time_axis[-1]), unit='ms').strftime('%d/%m/%Y %H:%M') if has_time else "N/A"
+        delta_s = (int(time_axis[-1]) - int(time_axis[0])) // 1000 if has_time else 0
+        duration_str = f"{delta_s // 86400}d {(delta_s % 86400) // 3600}h" if delta_s else "0d"
 
-        stats = {
+        return {
             "initial_balance": initial_balance, "final_balance": final_balance, "profit_total": profit_total,
             "roi_pct": (profit_total / initial_balance) * 100 if initial_balance > 0 else 0,
             "total_trades": total_closed, "wins": wins, "losses": losses,
             "win_rate": (wins / total_closed * 100) if total_closed > 0 else 0,
-            "ignored": ignored_count, "start_date": start_date_str, "end_date": end_date_str,
-            "duration": duration_str, "max_drawdown": max_drawdown_pct * 100 
+            "ignored": sim["ignored"], "start_date": start_date_str, "end_date": end_date_str,
+            "duration": duration_str, "max_drawdown": sim["max_drawdown_pct"] * 100 
         }
 
-        if chat_id:
-            try:
-                asset_label = "PORTFOLIO (Multi)" if len(symbols_list) > 1 else symbols_list[0]
-                notify_backtest_report(chat_id, asset_label, timeframe, days, stats)
-            except Exception as e: print(f"⚠️ Erro Telegram Backtest: {e}")
-
-        return {"success": True, "stats": stats, "trades": trades_log, "equity_curve": equity_curve}
+    @staticmethod
+    def load_market(symbols_list, timeframe, days, progress_callback=None):
+        """Baixa BTC (macro) + ativos e devolve (market, mensagem de erro)."""
+        # --- 1. DOWNLOAD DE DADOS (COM BARRA DE PROGRESSO) ---
+        if progress_callback: progress_callback(5, "Baixando Histórico BTC (Macro)...")
         
-       
-        # 3. SIMULAÇÃO LOOP
-        if progress_callback: progress_callback(90, "Executando Estratégia V6.8 (Com Modo Inverno)...")
+        # A. Prepara o Mapa do Bitcoin (Sentinela)
+        btc_macro = BacktesterEngine.prepare_btc_macro_data(timeframe, days)
         
-        wallet_cash = float(initial_balance) 
-        position = None 
-        trades_log = []
-        equity_curve = [] 
-        ignored_count = 0
-        peak_equity = float(initial_balance)
-        max_drawdown_pct = 0.0              
-
-        # --- VARIÁVEIS DO MODO INVERNO (NOVO NO BACKTEST) ---
-        consecutive_losses = 0
-        cooldown_until_ts = None # Timestamp (datetime) de desbloqueio
-
-        # Loop Cronológico (Candle a Candle)
-        for current_time in timestamps:
-            
-            # 1. CHECAGEM DE COOL DOWN (Se estiver de castigo, pula o candle)
-            if cooldown_until_ts and current_time < cooldown_until_ts:
-                # Opcional: Adicionar no log de equity que está parado?
-                # Por enquanto, apenas mantém o equity anterior e pula
-                equity_curve.append({"time": int(current_time.timestamp() * 1000), "value": round(wallet_cash, 2)})
-                continue
-
-            current_total_equity = wallet_cash
+        if progress_callback: progress_callback(10, "Baixando Altcoins...")
+        
+        data_feed = {}
+        total_assets = len(symbols_list)
+        completed_downloads = 0
+        
+        # B. Download Paralelo das Altcoins
+        with ThreadPoolExecutor(max_workers=5) as executor:
+            tasks = [(sym, timeframe, days) for sym in symbols_list]
+            future_to_symbol = {executor.submit(BacktesterEngine.fetch_data_worker, task): task[0] for task in tasks} 
             
-            # Status do Bitcoin (Já implementado)
-            btc_status = btc_macro_map.get(current_time, "NEUTRAL")
-
-            # A. GESTÃO DE POSIÇÃO
-            if position:
-                sym = position['symbol']
-                df = data_feed.get(sym)
-                idx = time_index_map.get(sym, {}).get(current_time)
+            for future in as_completed(future_to_symbol):
+                res = future.result()
+                completed_downloads += 1
                 
-                if df is not None and idx is not None:
-                    candle = df.iloc[idx]
-                    current_price = candle['close']
-                    high, low = candle['high'], candle['low']
-                    
-                    position_value = position['amount'] * current_price
-                    current_total_equity = wallet_cash + position_value
-                    
-                    trade_closed = False
-                    pnl_realized = 0
-                    result_type = ""
-
-                    # Verifica SL e TP
-                    if low <= position['sl']:
-                        exit_price = position['sl'] 
-                        if btc_status == "CRASH": exit_price = exit_price * 0.998 # Slippage em Crash
-                        
-                        exit_value = position['amount'] * exit_price
-                        pnl_realized = exit_value - position['invested']
-                        wallet_cash += exit_value
-                        result_type = "LOSS"
-                        trade_closed = True
-                        
-                    elif high >= position['tp']:
-                        exit_price = position['tp']
-                        exit_value = position['amount'] * exit_price
-                        pnl_realized = exit_value - position['invested']
-                        wallet_cash += exit_value
-                        result_type = "WIN"
-                        trade_closed = True
-
-                    if trade_closed:
-                        # --- LÓGICA DO MODO INVERNO APÓS FECHAMENTO ---
-                        if pnl_realized > 0:
-                            consecutive_losses = 0 # Reset na vitória
-                        else:
-                            consecutive_losses += 1
-                            if consecutive_losses >= 3:
-                                # Ativa bloqueio de 4 horas
-                                cooldown_until_ts = current_time + timedelta(hours=4)
-                                consecutive_losses = 0 # Reseta contagem para próximo ciclo
-                        # -----------------------------------------------
-
-                        current_total_equity = wallet_cash
-                        trades_log.append({
-                            'time': str(current_time), 'symbol': sym, 'side': 'SELL', 
-                            'res': result_type, 'pnl': pnl_realized, 'balance': wallet_cash,
-                            'reason': f"Hit {result_type} (CoolDown Status: {consecutive_losses}/3)"
-                        })
-                        position = None
-
-            # B. SCANNER (Só roda se não estiver posicionado E não estiver em Cool Down)
-            # A checagem de Cool Down já foi feita no início do loop, então aqui é seguro.
-            if not position:
-                for sym in data_feed.keys():
-                    df = data_feed[sym]
-                    idx = time_index_map[sym].get(current_time)
-                    if idx is None: continue 
-                    
-                    candle_row = df.iloc[idx]
-                    if pd.isna(candle_row['ema200']) or pd.isna(candle_row['rsi']): continue
-
-                    params = ASSET_PARAMS.get(sym, ASSET_PARAMS["DEFAULT"])
-                    
-                    should_buy, reason, meta = check_entry_strategy(
-                        candle_row, params, btc_status=btc_status, ignore_trend=ignore_trend
-                    )
-
-                    if should_buy:
-                        invest_amount = current_total_equity * (risk_pct / 100.0)
-                        if invest_amount < 10.0 and current_total_equity >= 11.0: invest_amount = 11.0
-                        elif invest_amount < 10.0: continue 
-
-                        entry_p = float(candle_row['close'])
-                        amount = invest_amount / entry_p
-                        wallet_cash -= invest_amount 
-                        
-                        position = {
-                            'symbol': sym, 'entry_price': entry_p, 'amount': amount, 
-                            'invested': invest_amount, 'sl': meta['sl'], 'tp': meta['tp'], 
-                            'tp1': 0, 'partial': False
-                        }
-                        
-                        trades_log.append({
-                            'time': str(current_time), 'symbol': sym, 'side': 'BUY', 
-                            'res': 'ENTRY', 'pnl': 0, 'balance': wallet_cash,
-                            'reason': f"{meta.get('trigger', 'Signal')} | BTC:{btc_status}"
-                        })
-                        break 
-                    
-                    elif "BLOQUEIO" in reason or "FALLING" in reason:
-                        ignored_count += 1
-
-            if current_total_equity > peak_equity: peak_equity = current_total_equity
-            drawdown = (current_total_equity - peak_equity) / peak_equity
-            if drawdown < max_drawdown_pct: max_drawdown_pct = drawdown
+                if progress_callback:
+                    # Progresso visual de 10% a 85%
+                    pct = 10 + int((completed_downloads / total_assets) * 75)
+                    progress_callback(pct, f"Baixando: {completed_downloads}/{total_assets}")
 
-            equity_curve.append({"time": int(current_time.timestamp() * 1000), "value": round(current_total_equity, 2)})
+                if res: 
+                    sym, df = res
+                    if not df.empty: data_feed[sym] = df
 
-        # FINALIZAÇÃO (MANTÉM IGUAL)
-        # ... (retorno das estatísticas) ...
-        # (Para facilitar, se precisar do bloco final avise, mas ele é igual ao anterior)
+        if not data_feed: return None, "Falha total no download dos dados."
         
-        # ... [Bloco Final de Estatísticas aqui] ...
+        # --- 2. SINCRONIZAÇÃO DE TIMEFRAMES (ARRAYS ALINHADOS) ---
+        if progress_callback: progress_callback(85, "Alinhando Dados...")
+        market = BacktesterEngine.build_market_arrays(data_feed, btc_macro)
         
-        return {"success": True, "stats": stats, "trades": trades_log, "equity_curve": equity_curve}
+        if len(market["time"]) == 0: return None, "Sem dados comuns entre os ativos."
+        return market, None
+
+    @staticmethod
+    def run_portfolio(symbols_list, timeframe="5m", days=7, initial_balance=1000.0, risk_pct=10, chat_id=None, ignore_trend=False, progress_callback=None):
         """
-        Executa simulação Async com suporte a Strategy Unificada e BTC Correlation.
+        Executa simulação Async com suporte a Strategy Unificada, BTC Correlation e Modo Inverno.
         """
-        
-        
+        market, error = BacktesterEngine.load_market(symbols_list, timeframe, days, progress_callback)
+        if error: return {"success": False, "message": error}
 
-        # 3. SIMULAÇÃO LOOP
+        # --- 3. SIMULAÇÃO (CORE LOOP) ---
         if progress_callback: progress_callback(90, "Executando Estratégia V6.8...")
-        
-        wallet_cash = float(initial_balance) 
-        position = None 
-        trades_log = []
-        equity_curve = [] 
-        ignored_count = 0
-        peak_equity = float(initial_balance)
-        max_drawdown_pct = 0.0              
-
-        # Loop Cronológico (Candle a Candle)
-        for current_time in timestamps:
-            current_total_equity = wallet_cash
-            
-            # --- STATUS DO BITCOIN NESTE MOMENTO ---
-            # Se não tiver dados do BTC para esse minuto, assumimos 'NEUTRAL' (sem bloqueio) ou 'BEAR' (segurança)
-            # Para backtest fiel, se faltar dados do BTC, melhor assumir NEUTRAL para não distorcer.
-            btc_status = btc_macro_map.get(current_time, "NEUTRAL")
-
-            # A. GESTÃO DE POSIÇÃO (Se já estiver comprado)
-            if position:
-                sym = position['symbol']
-                df = data_feed.get(sym)
-                idx = time_index_map.get(sym, {}).get(current_time)
-                
-                if df is not None and idx is not None:
-                    candle = df.iloc[idx]
-                    current_price = candle['close']
-                    high, low = candle['high'], candle['low']
-                    
-                    # Atualiza Equity Virtual
-                    position_value = position['amount'] * current_price
-                    current_total_equity = wallet_cash + position_value
-                    
-                    trade_closed = False
-                    pnl_realized = 0
-                    result_type = ""
+        params_by_symbol = {sym: ASSET_PARAMS.get(sym, ASSET_PARAMS["DEFAULT"]) for sym in market["symbols"]}
+        checkpoint = None
+        if progress_callback:
+            # Progresso de 90% a 98% durante o loop; o callback do JobScheduler lança JobCancelled se cancelado
+            checkpoint = lambda frac: progress_callback(90 + int(frac * 8), "Executando Estratégia V6.8...")
+        sim = BacktesterEngine.simulate(market, params_by_symbol, initial_balance, risk_pct, ignore_trend, checkpoint=checkpoint)
 
-                    # Verifica SL e TP (Simulação de Execução)
-                    # Prioridade: O candle tocou no SL? (Low <= SL)
-                    if low <= position['sl']:
-                        exit_price = position['sl'] 
-                        # Slippage simulado em crashes (-0.2%)
-                        if btc_status == "CRASH": exit_price = exit_price * 0.998
-                        
-                        exit_value = position['amount'] * exit_price
-                        pnl_realized = exit_value - position['invested']
-                        wallet_cash += exit_value
-                        result_type = "LOSS"
-                        trade_closed = True
-                        
-                    # Prioridade: O candle tocou no TP? (High >= TP)
-                    elif high >= position['tp']:
-                        exit_price = position['tp']
-                        exit_value = position['amount'] * exit_price
-                        pnl_realized = exit_value - position['invested']
-                        wallet_cash += exit_value
-                        result_type = "WIN"
-                        trade_closed = True
-                        
-                    # Parciais (Se ativado na estratégia)
-                    # Não implementado no strategy.py simples, mas a estrutura suporta
-
-                    if trade_closed:
-                        current_total_equity = wallet_cash
-                        trades_log.append({
-                            'time': str(current_time), 'symbol': sym, 'side': 'SELL', 
-                            'res': result_type, 'pnl': pnl_realized, 'balance': wallet_cash,
-                            'reason': f"Hit {result_type}"
-                        })
-                        position = None
-
-            # B. SCANNER (Se estiver líquido)
-            if not position:
-                # Itera sobre ativos disponíveis
-                for sym in data_feed.keys():
-                    df = data_feed[sym]
-                    idx = time_index_map[sym].get(current_time)
-                    if idx is None: continue 
-                    
-                    # Linha atual (Candle + Indicadores)
-                    candle_row = df.iloc[idx]
-                    
-                    # Checagens de integridade
-                    if pd.isna(candle_row['ema200']) or pd.isna(candle_row['rsi']): continue
-
-                    params = ASSET_PARAMS.get(sym, ASSET_PARAMS["DEFAULT"])
-                    
-                    # --- CHAMADA AO CÉREBRO UNIFICADO (strategy.py) ---
-                    # Aqui está a mágica: O Backtest usa a MESMA função do Robô Real
-                    # Passamos o btc_status recuperado lá em cima
-                    should_buy, reason, meta = check_entry_strategy(
-                        candle_row, 
-                        params, 
-                        btc_status=btc_status, 
-                        ignore_trend=ignore_trend
-                    )
-
-                    if should_buy:
-                        # Gestão de Risco (Position Sizing)
-                        invest_amount = current_total_equity * (risk_pct / 100.0)
-                        
-                        # Trava de Mínimo (Binance ~$6)
-                        if invest_amount < 10.0 and current_total_equity >= 11.0:
-                            invest_amount = 11.0
-                        elif invest_amount < 10.0:
-                            continue # Saldo insuficiente para operar
-
-                        entry_p = float(candle_row['close'])
-                        amount = invest_amount / entry_p
-                        
-                        wallet_cash -= invest_amount 
-                        
-                        # Cria a posição usando os Metadados da Strategy
-                        position = {
-                            'symbol': sym, 
-                            'entry_price': entry_p, 
-                            'amount': amount, 
-                            'invested': invest_amount, 
-                            'sl': meta['sl'], # Stop Loss calculado pela Strategy
-                            'tp': meta['tp'], # Take Profit calculado pela Strategy
-                            'tp1': 0, 
-                            'partial': False
-                        }
-                        
-                        trades_log.append({
-                            'time': str(current_time), 
-                            'symbol': sym, 
-                            'side': 'BUY', 
-                            'res': 'ENTRY', 
-                            'pnl': 0, 
-                            'balance': wallet_cash,
-                            'reason': f"{meta.get('trigger', 'Signal')} | BTC:{btc_status}"
-                        })
-                        break # Entrou em um, encerra busca neste candle (Single Position)
-                    
-                    elif "BLOQUEIO" in reason or "FALLING" in reason:
-                        ignored_count += 1
-
-            # Drawdown Calculation
-            if current_total_equity > peak_equity: peak_equity = current_total_equity
-            drawdown = (current_total_equity - peak_equity) / peak_equity
-            if drawdown < max_drawdown_pct: max_drawdown_pct = drawdown
-
-            # Equity Curve Log
-            equity_curve.append({"time": int(current_time.timestamp() * 1000), "value": round(current_total_equity, 2)})
-
-        # FINALIZAÇÃO E RELATÓRIO
+        # --- 4. RELATÓRIO FINAL ---
         if progress_callback: progress_callback(98, "Compilando Estatísticas...")
-        
-        final_balance = current_total_equity
-        profit_total = final_balance - initial_balance
-        wins = len([t for t in trades_log if t['res'] == 'WIN'])
-        losses = len([t for t in trades_log if t['res'] == 'LOSS'])
-        total_closed = wins + losses
-        
-        start_date_str = timestamps[0].strftime('%d/%m/%Y %H:%M') if timestamps else "N/A"
-        end_date_str = timestamps[-1].strftime('%d/%m/%Y %H:%M') if timestamps else "N/A"
-        delta = timestamps[-1] - timestamps[0] if timestamps else None
-        duration_str = f"{delta.days}d {delta.seconds//3600}h" if delta else "0d"
+        stats = BacktesterEngine.compile_stats(sim, market["time"], initial_balance)
+        # Curva completa em arrays compactos (dezenas de milhares de pontos): a API envia uma versão
+        # reduzida (LTTB) no status e janelas em resolução total sob demanda
+        equity_curve = EquityCurve(sim["equity_time"], sim["equity_value"])
 
-        stats = {
-            "initial_balance": initial_balance, "final_balance": final_balance, "profit_total": profit_total,
-            "roi_pct": (profit_total / initial_balance) * 100 if initial_balance > 0 else 0,
-            "total_trades": total_closed, "wins": wins, "losses": losses,
-            "win_rate": (wins / total_closed * 100) if total_closed > 0 else 0,
-            "ignored": ignored_count, "start_date": start_date_str, "end_date": end_date_str,
-            "duration": duration_str, "max_drawdown": max_drawdown_pct * 100 
-        }
-
-        # Notifica Telegram se solicitado
         if chat_id:
             try:
                 asset_label = "PORTFOLIO (Multi)" if len(symbols_list) > 1 else symbols_list[0]
                 notify_backtest_report(chat_id, asset_label, timeframe, days, stats)
             except Exception as e: print(f"⚠️ Erro Telegram Backtest: {e}")
 
-        return {"success": True, "stats": stats, "trades": trades_log, "equity_curve": equity_curve}
\ No newline at end of file
+        return {"success": True, "stats": stats, "trades": sim["trades"], "equity_curve": equity_curve}
+
+    @staticmethod
+    def build_sweep_grid(grid):
+        """Valida a grade {param: [valores]} e gera a lista de combinações."""
+        if not isinstance(grid, dict) or not grid: raise ValueError("Grade de parâmetros vazia.")
+        unknown = set(grid) - set(SWEEP_PARAM_KEYS)
+        if unknown: raise ValueError(f"Parâmetros não suportados: {', '.join(sorted(unknown))}")
+        keys = sorted(grid)
+        values = [[float(v) for v in (grid[k] if isinstance(grid[k], list) else [grid[k]])] for k in keys]
+        combos = [dict(zip(keys, combo)) for combo in itertools.product(*values)]
+        if not combos: raise ValueError("Grade de parâmetros vazia.")
+        if len(combos) > MAX_SWEEP_COMBINATIONS: raise ValueError(f"Grade grande demais ({len(combos)} > {MAX_SWEEP_COMBINATIONS}).")
+        return combos
+
+    @staticmethod
+    def run_sweep(symbols_list, grid, timeframe="5m", days=7, initial_balance=1000.0, risk_pct=10, ignore_trend=False, progress_callback=None, max_workers=None):
+        """
+        Modo Sweep: roda todas as combinações de ASSET_PARAMS da grade sobre os MESMOS dados.
+        Os arrays são baixados uma vez, publicados em SharedMemory e distribuídos num pool de processos.
+        Retorna o ranking por ROI com win rate e drawdown máximo de cada combinação.
+        """
+        combos = BacktesterEngine.build_sweep_grid(grid)
+        market, error = BacktesterEngine.load_market(symbols_list, timeframe, days, progress_callback)
+        if error: return {"success": False, "message": error}
+
+        if progress_callback: progress_callback(88, f"Sweep: {len(combos)} combinações...")
+        shm, layout = share_market(market)
+        cancel_event = multiprocessing.Event() # Interrompe também as combinações que já estão rodando
+        results = []
+        try:
+            # Deixa um núcleo livre para o loop de trading ao vivo
+            workers = max(1, min(max_workers or (os.cpu_count() or 2) - 1, len(combos)))
+            with ProcessPoolExecutor(max_workers=workers, initializer=_sweep_init, initargs=(layout, cancel_event)) as executor:
+                futures = [executor.submit(_sweep_worker, (combo, initial_balance, risk_pct, ignore_trend)) for combo in combos]
+                try:
+                    for done, future in enumerate(as_completed(futures), start=1):
+                        results.append(future.result())
+                        if progress_callback:
+                            # Progresso visual de 88% a 98%
+                            progress_callback(88 + int((done / len(combos)) * 10), f"Sweep: {done}/{len(combos)}")
+                except BaseException:
+                    # Cancelamento/erro: descarta as combinações que ainda não começaram
+                    # e interrompe as que estão no meio da simulação
+                    cancel_event.set()
+                    for future in futures: future.cancel()
+                    raise
+        finally:
+            shm.close()
+            shm.unlink()
+
+        results.sort(key=lambda r: (r["roi_pct"], -abs(r["max_drawdown"])), reverse=True)
+        for rank, row in enumerate(results, start=1): row["rank"] = rank
+        return {"success": True, "combinations": len(combos), "workers": workers, "ranking": results}
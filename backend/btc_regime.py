@@ -0,0 +1,93 @@
+import threading
+import time
+import numpy as np
+from indicators import INDICATOR_COLUMNS
+from metrics import metrics
+
+# Códigos de regime (mesma ordem usada nos arrays do backtester)
+BTC_STATUS_LABELS = ("BEAR", "BULL", "CRASH")
+BTC_BEAR, BTC_BULL, BTC_CRASH = 0, 1, 2
+
+BTC_SYMBOL = "BTC/USDT"
+BTC_TIMEFRAME = "1h"
+BTC_CRASH_RSI = 25
+H1_MS = 60 * 60 * 1000
+
+_RSI_IDX = INDICATOR_COLUMNS.index('rsi')
+_EMA_IDX = INDICATOR_COLUMNS.index('ema200')
+
+def classify_regime(price, ema200, rsi):
+    """
+    Regra 'Sentinela' do BTC (única para o bot ao vivo, scanner e backtester).
+    Aceita escalares ou arrays NumPy e devolve códigos de BTC_STATUS_LABELS.
+    Indicadores ausentes (NaN) nunca disparam CRASH/BEAR.
+    """
+    return np.where(np.asarray(rsi) < BTC_CRASH_RSI, BTC_CRASH,
+                    np.where(np.asarray(price) < np.asarray(ema200), BTC_BEAR, BTC_BULL)).astype(np.int8)
+
+def describe_regime(code, rsi):
+    if code == BTC_CRASH: return "CRASH", f"BTC Oversold Extremo ({rsi:.1f})"
+    if code == BTC_BEAR: return "BEAR", "BTC abaixo da EMA200 (H1)"
+    return "BULL", "BTC Saudável"
+
+
+class BtcRegimeService:
+    """
+    Regime macro do BTC (H1) compartilhado por todos os consumidores.
+
+    O resultado só é recalculado quando:
+    - o candle H1 em formação fecha (novo candle);
+    - o preço do BTC observado se move mais que `move_threshold` desde a última avaliação;
+    - passam `max_age` segundos (atualiza o candle em formação mesmo sem ninguém observar o preço).
+    O histórico vem do CandleStore (incremental): cada recálculo busca só o candle atual.
+    """
+    def __init__(self, store, move_threshold=0.005, max_age=60):
+        self.store = store
+        self.move_threshold = move_threshold
+        self.max_age = max_age
+        self._cached = None        # (status, motivo)
+        self._eval_price = None    # Preço do BTC na última avaliação
+        self._candle_ts = None     # Timestamp (ms) do candle H1 avaliado
+        self._evaluated_at = 0
+        self._stale = True
+        self._lock = threading.Lock()
+
+    def observe_price(self, price):
+        """Preço do BTC vindo de outra fonte (loop ao vivo/scanner): invalida o cache se o movimento for relevante."""
+        ref = self._eval_price
+        if price and ref and abs(price / ref - 1) >= self.move_threshold: self._stale = True
+
+    def invalidate(self):
+        self._stale = True
+
+    def _needs_refresh(self, now):
+        if self._cached is None or self._stale: return True
+        if now - self._evaluated_at >= self.max_age: return True
+        return self._candle_ts is not None and now * 1000 >= self._candle_ts + H1_MS
+
+    def get(self):
+        """Retorna (status, motivo), com status em CRASH/BEAR/BULL (ou NEUTRAL sem dados)."""
+        now = time.time()
+        if not self._needs_refresh(now): return self._cached
+
+        with self._lock:
+            # Outro thread pode ter atualizado enquanto esperávamos o lock
+            if not self._needs_refresh(time.time()): return self._cached
+            try:
+                with metrics.timer('sniper_stage_seconds', stage='btc_health', symbol=BTC_SYMBOL, timeframe=BTC_TIMEFRAME):
+                    candles, indicators = self.store.get_candles(BTC_SYMBOL, BTC_TIMEFRAME, limit=250)
+                if not candles or not indicators:
+                    return self._cached or ("NEUTRAL", "BTC Dados Indisponíveis")
+
+                price = float(candles[-1][4])
+                rsi, ema200 = indicators[-1][_RSI_IDX], indicators[-1][_EMA_IDX]
+                code = int(classify_regime(price, ema200, rsi))
+                self._cached = describe_regime(code, rsi)
+                self._eval_price = price
+                self._candle_ts = candles[-1][0]
+                self._evaluated_at = time.time()
+                self._stale = False
+            except Exception as e:
+                print(f"Erro ao ler BTC: {e}")
+                return self._cached or ("NEUTRAL", "Erro Leitura")
+            return self._cached
@@ -0,0 +1,175 @@
+import threading
+import time
+
+# Limite da API da Binance por chamada de klines
+API_PAGE_LIMIT = 1000
+
+# Timeframes montados localmente a partir do timeframe base (buckets alinhados em epoch UTC, como na Binance)
+DERIVED_TIMEFRAMES = {'15m': 15 * 60 * 1000, '1h': 60 * 60 * 1000, '4h': 4 * 60 * 60 * 1000}
+DERIVED_BASE_LIMIT = 1000  # Candles base mínimos quando o par só é pedido num timeframe derivado
+BASE_MAX_AGE = 1.0         # Base sincronizada há menos que isso (s) é usada sem nova chamada à API
+
+class CandleSeries:
+    """Histórico em memória de um par (symbol, timeframe)."""
+    def __init__(self, symbol, timeframe):
+        self.symbol = symbol
+        self.timeframe = timeframe
+        self.rows = []  # [[ts, open, high, low, close, volume], ...] em ordem cronológica
+        self.loaded_limit = 0  # Maior limite já baixado por completo (evita refetch de pares novos com pouco histórico)
+        self.engine = None  # Motor de indicadores incremental (opcional)
+        self.indicators = []  # Tupla de indicadores alinhada com self.rows
+        self.synced_at = 0  # Última sincronização com a exchange (time.time())
+        self.lock = threading.Lock()
+
+    @property
+    def last_ts(self):
+        return self.rows[-1][0] if self.rows else None
+
+
+class CandleStore:
+    """
+    Cache incremental de OHLCV por (symbol, timeframe).
+
+    O primeiro acesso faz o download completo (com paginação para o Warmup da EMA200).
+    Nos ticks seguintes pedimos à exchange apenas os candles a partir do último timestamp
+    guardado: o candle ainda em formação é substituído no lugar e os novos são anexados.
+    Com `indicator_factory`, cada série mantém também seus indicadores atualizados em O(1) por candle.
+
+    Com `base_timeframe`, os DERIVED_TIMEFRAMES (15m/1h/4h) não consultam mais a exchange a cada tick:
+    o histórico longo (warmup) é baixado uma única vez e o candle atual é agregado dos candles base.
+    """
+    def __init__(self, exchange, max_candles=3000, indicator_factory=None, base_timeframe=None):
+        self.exchange = exchange
+        self.max_candles = max_candles
+        self.indicator_factory = indicator_factory
+        self.base_timeframe = base_timeframe
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def _get_series(self, symbol, timeframe):
+        key = (symbol, timeframe)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = CandleSeries(symbol, timeframe)
+                self._series[key] = series
+            return series
+
+    def _full_fetch(self, symbol, timeframe, limit):
+        # 1. Busca os candles mais recentes (Limite API padrão é 1000)
+        candles = self.exchange.fetch_ohlcv(symbol, timeframe, limit=min(limit, API_PAGE_LIMIT))
+        if not candles: return []
+
+        # 2. Paginação para trás até completar o limite pedido
+        while len(candles) < limit:
+            remaining = min(limit - len(candles), API_PAGE_LIMIT)
+            # params={'endTime': ...} é específico da Binance para paginação reversa
+            prev_candles = self.exchange.fetch_ohlcv(
+                symbol, timeframe, limit=remaining,
+                params={'endTime': candles[0][0] - 1}
+            )
+            if not prev_candles: break
+            # Concatena: Antigos + Recentes
+            candles = prev_candles + candles
+            if len(prev_candles) < remaining: break
+
+        return [list(c) for c in candles]
+
+    def _reload(self, series, limit):
+        series.rows = self._full_fetch(series.symbol, series.timeframe, limit)
+        series.loaded_limit = limit
+        if self.indicator_factory:
+            # Warmup único: passa o histórico inteiro pelo motor incremental
+            series.engine = self.indicator_factory()
+            series.indicators = [series.engine.update(*row[:5]) for row in series.rows]
+
+    def _merge(self, series, new_candles):
+        """Aplica candles novos: substitui o candle em formação e anexa os fechados."""
+        rows, engine = series.rows, series.engine
+        for c in new_candles:
+            ts = c[0]
+            if ts == rows[-1][0]:
+                rows[-1] = list(c)
+                if engine: series.indicators[-1] = engine.update(*c[:5])
+            elif ts > rows[-1][0]:
+                rows.append(list(c))
+                if engine: series.indicators.append(engine.update(*c[:5]))
+        if len(rows) > self.max_candles:
+            excess = len(rows) - self.max_candles
+            del rows[:excess]
+            if engine: del series.indicators[:excess]
+
+    def _sync(self, series, limit):
+        if not series.rows or series.loaded_limit < limit:
+            self._reload(series, limit)
+        else:
+            new_candles = self.exchange.fetch_ohlcv(series.symbol, series.timeframe, since=series.last_ts, limit=API_PAGE_LIMIT)
+            if new_candles and (new_candles[0][0] > series.last_ts or len(new_candles) >= API_PAGE_LIMIT):
+                # Buraco no histórico (ex: bot ficou parado): recarrega tudo
+                self._reload(series, limit)
+            elif new_candles:
+                self._merge(series, new_candles)
+        series.synced_at = time.time()
+
+    def _is_derived(self, timeframe):
+        return (self.base_timeframe is not None and timeframe in DERIVED_TIMEFRAMES
+                and timeframe != self.base_timeframe)
+
+    def _aggregate(self, series, base):
+        """
+        Recalcula os candles derivados a partir do último já existente (o candle em formação),
+        agrupando os candles base por bucket. Retorna False se a base não cobre esse trecho.
+        """
+        period = DERIVED_TIMEFRAMES[series.timeframe]
+        start_ts = series.last_ts
+        if not base.rows or base.rows[0][0] > start_ts: return False
+
+        # Volta só até o início do candle derivado atual (no máximo período/base candles)
+        i = len(base.rows)
+        while i > 0 and base.rows[i - 1][0] >= start_ts: i -= 1
+
+        bars = []
+        for ts, o, h, l, c, v in base.rows[i:]:
+            bucket = ts - ts % period
+            if bars and bars[-1][0] == bucket:
+                bar = bars[-1]
+                bar[2] = max(bar[2], h); bar[3] = min(bar[3], l); bar[4] = c; bar[5] += v
+            else:
+                bars.append([bucket, o, h, l, c, v])
+        if bars: self._merge(series, bars)
+        return True
+
+    def _get_derived(self, series, limit):
+        base = self._get_series(series.symbol, self.base_timeframe)
+        if not series.rows or series.loaded_limit < limit:
+            # Warmup longo (ex: 1500 candles H1) só na primeira vez; depois tudo vem da base
+            self._reload(series, limit)
+        with base.lock:
+            if time.time() - base.synced_at > BASE_MAX_AGE:
+                self._sync(base, max(base.loaded_limit, DERIVED_BASE_LIMIT))
+            covered = self._aggregate(series, base)
+        if not covered:
+            # Base não alcança o candle derivado atual (ex: bot parado por dias): recarrega da exchange
+            self._reload(series, limit)
+
+    def get_candles(self, symbol, timeframe, limit=1000):
+        """
+        Retorna (candles, indicadores) com os últimos `limit` itens sincronizados com a exchange.
+        Só faz download completo quando o histórico local é insuficiente ou ficou defasado.
+        `indicadores` é None quando o store não tem indicator_factory.
+        """
+        series = self._get_series(symbol, timeframe)
+        with series.lock:
+            if self._is_derived(timeframe): self._get_derived(series, limit)
+            else: self._sync(series, limit)
+            indicators = series.indicators[-limit:] if series.engine else None
+            return series.rows[-limit:], indicators
+
+    def invalidate(self, symbol=None, timeframe=None):
+        with self._lock:
+            if symbol is None:
+                self._series.clear()
+                return
+            for key in list(self._series.keys()):
+                if key[0] == symbol and (timeframe is None or key[1] == timeframe):
+                    self._series.pop(key, None)
@@ -0,0 +1,82 @@
+import argparse
+import sys
+
+import numpy as np
+import pandas as pd
+
+from indicators import add_indicators, StreamingIndicators, INDICATOR_COLUMNS
+
+# Regressão: StreamingIndicators (loop ao vivo) x add_indicators (backtester) sobre a mesma série.
+# Alimenta o streaming com revisões do candle em formação, como o websocket faz, e compara o valor
+# da ÚLTIMA revisão de cada candle com a linha do pandas. Rodar depois de mexer em qualquer um dos dois:
+#   python check_indicators.py [--rows 1500] [--revisions 4] [--seed 7]
+# Sai com código 1 se algum indicador divergir além da tolerância.
+
+# Erro relativo ao preço (RSI: à escala 0-100). RSI/EMA/ATR e a Donchian batem bit a bit com o pandas;
+# as Bollinger usam soma/soma dos quadrados incremental e ficam ~1e-12 do rolling().std()
+TOLERANCES = {'rsi': 1e-9, 'bb_upper': 1e-9, 'bb_lower': 1e-9, 'ema200': 1e-9, 'atr': 1e-9,
+              'fibo_high': 0.0, 'fibo_low': 0.0}
+
+def synthetic_ohlc(rows, revisions, seed):
+    """
+    Random walk de candles fechados + as revisões intermediárias de cada um.
+    Retorna (df dos candles finais, lista de (timestamp, open, high, low, close) na ordem de chegada).
+    """
+    rng = np.random.default_rng(seed)
+    closes = 100 * np.exp(np.cumsum(rng.normal(0, 0.004, rows)))
+    closes[rows // 3: rows // 3 + 30] = closes[rows // 3]  # Trecho lateral: variância ~0 nas Bollinger
+    opens = np.concatenate(([closes[0]], closes[:-1]))
+    highs = np.maximum(opens, closes) * (1 + rng.uniform(0, 0.003, rows))
+    lows = np.minimum(opens, closes) * (1 - rng.uniform(0, 0.003, rows))
+    timestamps = np.arange(rows, dtype=np.int64) * 300_000
+
+    updates = []
+    for i in range(rows):
+        # Revisões com preços intermediários em volta da abertura, sempre terminando no candle final
+        for _ in range(rng.integers(0, revisions + 1)):
+            partial = opens[i] + (closes[i] - opens[i]) * rng.uniform(-1, 1)
+            high, low = max(opens[i], partial), min(opens[i], partial)
+            updates.append((timestamps[i], opens[i], high, low, partial))
+        updates.append((timestamps[i], opens[i], highs[i], lows[i], closes[i]))
+
+    df = pd.DataFrame({'timestamp': timestamps, 'open': opens, 'high': highs, 'low': lows, 'close': closes})
+    return df, updates
+
+def compare(df, updates):
+    """Retorna {coluna: (pior erro relativo, candles divergentes)}."""
+    streaming = StreamingIndicators()
+    final = {}
+    for ts, open_, high, low, close in updates:
+        final[ts] = streaming.update(ts, open_, high, low, close)
+    live = np.array([final[ts] for ts in df['timestamp']], dtype=np.float64)
+    expected = add_indicators(df.copy())
+
+    report = {}
+    scale = df['close'].to_numpy()
+    for j, col in enumerate(INDICATOR_COLUMNS):
+        ref = expected[col].to_numpy(dtype=np.float64)
+        got = live[:, j]
+        nan_mismatch = np.isnan(ref) != np.isnan(got)
+        both = ~np.isnan(ref) & ~np.isnan(got)
+        base = np.full_like(ref, 100.0) if col == 'rsi' else scale
+        error = np.zeros_like(ref)
+        error[both] = np.abs(ref[both] - got[both]) / base[both]
+        bad = nan_mismatch | (error > TOLERANCES[col])
+        report[col] = (float(error.max()), int(bad.sum()))
+    return report
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Compara StreamingIndicators com add_indicators")
+    parser.add_argument("--rows", type=int, default=1500)
+    parser.add_argument("--revisions", type=int, default=4, help="Máximo de revisões do candle em formação")
+    parser.add_argument("--seed", type=int, default=7)
+    args = parser.parse_args()
+
+    df, updates = synthetic_ohlc(args.rows, args.revisions, args.seed)
+    report = compare(df, updates)
+    failed = False
+    for col, (worst, bad) in report.items():
+        failed |= bad > 0
+        print(f"{'✅' if not bad else '❌'} {col:<10} erro máx {worst:.2e} (tolerância {TOLERANCES[col]:.0e}) | {bad} divergente(s)")
+    print(f"{len(df)} candles, {len(updates)} atualizações")
+    sys.exit(1 if failed else 0)
@@ -0,0 +1,34 @@
+import numpy as np
+
+# Formato colunar das respostas (candles, curva de patrimônio, trades do backtest):
+# em vez de uma lista de dicts (as mesmas chaves repetidas em cada linha), cada campo vira
+# um array paralelo: {"length": n, "columns": {"timestamp": [...], "open": [...], ...}}.
+# No formato colunar os timestamps seguem em epoch ms (números), sem formatação de texto.
+COLUMNAR_MIME = 'application/vnd.sniper.columnar+json'
+
+def wants_columnar(req):
+    """Negociação: ?format=columnar ou Accept: application/vnd.sniper.columnar+json."""
+    if req.args.get('format') == 'columnar': return True
+    return any(value == COLUMNAR_MIME for value in req.accept_mimetypes.values())
+
+def to_columns(rows, fields=None):
+    """Lista de dicts -> colunas. `fields` fixa a ordem/recorte (padrão: chaves da primeira linha)."""
+    rows = rows or []
+    if fields is None: fields = list(rows[0].keys()) if rows else []
+    return {"length": len(rows), "columns": {f: [r.get(f) for r in rows] for f in fields}}
+
+def from_arrays(**arrays):
+    """Colunas direto de arrays alinhados (NumPy ou listas), sem passar por dicts."""
+    columns = {k: (v.tolist() if isinstance(v, np.ndarray) else list(v)) for k, v in arrays.items()}
+    length = len(next(iter(columns.values()))) if columns else 0
+    return {"length": length, "columns": columns}
+
+def to_rows(table):
+    """Colunas -> lista de dicts (formato antigo, para clientes que não pedem colunar)."""
+    if not is_columnar(table): return table
+    columns = table["columns"]
+    fields = list(columns.keys())
+    return [dict(zip(fields, values)) for values in zip(*(columns[f] for f in fields))]
+
+def is_columnar(value):
+    return isinstance(value, dict) and "columns" in value and "length" in value
@@ -1,12 +1,23 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_bcrypt import Bcrypt
 from cryptography.fernet import Fernet
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+import sqlite3
 import re
 import uuid
 
 db = SQLAlchemy()
 bcrypt = Bcrypt()
 
+@event.listens_for(Engine, "connect")
+def _enable_sqlite_wal(dbapi_connection, connection_record):
+    """SQLite em WAL: leituras do dashboard não bloqueiam checkpoints/trades (e vice-versa)."""
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA journal_mode=WAL")
+        cursor.close()
+
 # --- CHAVE MESTRA DO SISTEMA ---
 SYSTEM_SECRET_KEY = b"YOUR_API_KEY_HERE"
 cipher_suite = Fernet(SYSTEM_SECRET_KEY)
@@ -77,6 +88,8 @@ class BotState(db.Model):
 
 class Trade(db.Model):
     """Histórico imutável de operações"""
+    # Paginação por cursor (id decrescente), com ou sem filtro de ativo
+    __table_args__ = (db.Index('ix_trade_symbol_id', 'symbol', 'id'),)
     id = db.Column(db.Integer, primary_key=True)
     exit_time = db.Column(db.String(30))
     symbol = db.Column(db.String(20))
@@ -85,4 +98,8 @@ class Trade(db.Model):
     profit_usd = db.Column(db.Float)
     profit_pct = db.Column(db.Float)
     result = db.Column(db.String(10)) # WIN/LOSS
-    reason = db.Column(db.String(50))
\ No newline at end of file
+    reason = db.Column(db.String(50))
+
+def ensure_indexes():
+    """create_all não cria índices novos em tabelas que já existem (bancos de versões anteriores)."""
+    for index in Trade.__table__.indexes: index.create(db.engine, checkfirst=True)
@@ -0,0 +1,69 @@
+import threading
+import numpy as np
+from columnar import from_arrays
+
+DEFAULT_POINTS = 1000  # ~largura do gráfico em pixels
+MIN_POINTS = 3
+MAX_POINTS = 5000
+
+def lttb_indices(x, y, threshold):
+    """
+    Largest-Triangle-Three-Buckets: índices dos `threshold` pontos que preservam a forma da série.
+    Primeiro e último ponto sempre entram; cada balde intermediário contribui com o ponto que forma
+    o maior triângulo com o ponto escolhido antes e a média do balde seguinte.
+    """
+    n = len(x)
+    if threshold >= n or threshold < MIN_POINTS: return np.arange(n)
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    # threshold - 2 baldes entre o primeiro e o último ponto
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    out = np.empty(threshold, dtype=np.int64)
+    out[0], out[-1] = 0, n - 1
+    a = 0
+    for i in range(threshold - 2):
+        lo, hi = edges[i], edges[i + 1]
+        nlo, nhi = hi, (edges[i + 2] if i + 2 < len(edges) else n)
+        avg_x, avg_y = x[nlo:nhi].mean(), y[nlo:nhi].mean()
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(np.argmax(area))
+        out[i + 1] = a
+    return out
+
+
+class EquityCurve:
+    """
+    Curva de patrimônio completa do backtest em arrays compactos (tempo int64 em ms + valor float64),
+    em vez de um dict por candle. O status leva só uma versão reduzida (LTTB); o zoom pede janelas
+    em resolução total via `window`.
+    """
+    def __init__(self, time, value):
+        self.time = np.asarray(time, dtype=np.int64)
+        self.value = np.asarray(value, dtype=np.float64)
+        self._downsampled = (None, None)  # (pontos, colunas) do último pedido: o status repete o mesmo valor
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.time)
+
+    @property
+    def nbytes(self):
+        return self.time.nbytes + self.value.nbytes
+
+    def downsample(self, points=DEFAULT_POINTS):
+        """Versão LTTB com até `points` pontos, em colunas."""
+        points = max(MIN_POINTS, min(int(points), MAX_POINTS))
+        with self._lock:
+            cached_points, table = self._downsampled
+            if cached_points != points:
+                # Só a última resolução fica guardada: `points` vem do cliente e não pode acumular entradas
+                idx = lttb_indices(self.time, self.value, points)
+                table = from_arrays(time=self.time[idx], value=self.value[idx])
+                self._downsampled = (points, table)
+            return table
+
+    def window(self, start=None, end=None):
+        """Pontos com start <= tempo <= end (epoch ms), em resolução total e em colunas."""
+        lo = 0 if start is None else int(np.searchsorted(self.time, start, side='left'))
+        hi = len(self.time) if end is None else int(np.searchsorted(self.time, end, side='right'))
+        return from_arrays(time=self.time[lo:hi], value=self.value[lo:hi])
@@ -1,76 +1,114 @@
 import time
 from logger import log_exec, log_error
+from metrics import metrics, timed_stage
+
+# Binance: resposta da ordem já com os fills (preço/quantidade/taxa) — dispensa consulta posterior
+FULL_RESPONSE = {'newOrderRespType': 'FULL'}
+MIN_NOTIONAL_FALLBACK = 5.0
 
 class ExecutionManager:
     def __init__(self, exchange_instance):
         self.exchange = exchange_instance
+        self._markets_ready = False
+        self.warm_up()
+
+    def warm_up(self):
+        """Carrega mercados (precisão e limites) uma única vez, fora do caminho crítico da ordem."""
+        if self._markets_ready or not self.exchange: return
+        try:
+            self.exchange.load_markets()
+            self._markets_ready = True
+        except Exception as e:
+            log_error.error(f"⚠️ Falha ao carregar mercados: {e}")
+
+    def _min_cost(self, symbol):
+        try: min_cost = self.exchange.market(symbol)['limits']['cost']['min']
+        except Exception: min_cost = None
+        # Margem de 10% acima do mínimo da exchange (ex: $5 -> $5.50)
+        return (min_cost or MIN_NOTIONAL_FALLBACK) * 1.1
 
-    def place_market_buy(self, symbol, amount_usdt):
+    @staticmethod
+    def _parse_fills(order, symbol):
+        """Preço médio, quantidade executada e taxa paga na própria moeda (a partir da resposta FULL)."""
+        base = symbol.split('/')[0]
+        fills = (order.get('info') or {}).get('fills') or []
+        qty = sum(float(f['qty']) for f in fills)
+        if qty > 0:
+            avg = sum(float(f['price']) * float(f['qty']) for f in fills) / qty
+            base_fee = sum(float(f['commission']) for f in fills if f.get('commissionAsset') == base)
+            return avg, qty, base_fee
+        avg = float(order['average']) if order.get('average') else None
+        qty = float(order['filled']) if order.get('filled') else None
+        return avg, qty, 0.0
+
+    @staticmethod
+    def _record_ack(side, symbol, tick_start):
+        if tick_start is None: return
+        elapsed = time.perf_counter() - tick_start
+        metrics.observe('sniper_order_ack_seconds', elapsed, side=side, symbol=symbol)
+        log_exec.info(f"⏱️ Tick -> ACK ({side}): {elapsed*1000:.0f} ms")
+
+    @timed_stage('order_buy')
+    def place_market_buy(self, symbol, amount_usdt, ref_price=None, tick_start=None):
         """
         EXECUÇÃO AGRESSIVA (INSTITUCIONAL V1):
-        Entra a Mercado para garantir a posição. 
+        Entra a Mercado para garantir a posição.
         Evita o risco de 'ficar chupando dedo' em pumps rápidos.
+
+        `ref_price`: último preço já em cache (evita um fetch_ticker antes da ordem).
+        `tick_start`: perf_counter do início do tick, para medir tick -> ACK.
         """
-        if not self.exchange: 
+        if not self.exchange:
             return {"success": False, "message": "Sem conexão Exchange"}
 
         try:
-            # 1. Obter preço atual para calibração de quantidade
-            ticker = self.exchange.fetch_ticker(symbol)
-            price = ticker['last']
-            
-            # 2. Calcular quantidade baseada em USDT
+            self.warm_up()
+            # 1. Preço de referência para calibração de quantidade (ticker só se não houver cache)
+            price = ref_price or self.exchange.fetch_ticker(symbol)['last']
+
+            # 2. Calcular quantidade baseada em USDT (precisão do cache de mercados)
             amount_raw = amount_usdt / price
             amount = self.exchange.amount_to_precision(symbol, amount_raw)
 
             # --- PROTEÇÃO MIN NOTIONAL ---
             cost = float(amount) * price
-            if cost < 5.5: # Margem segura acima dos $5
-                 return {"success": False, "message": f"Valor muito baixo (${cost:.2f}). Mínimo $6."}
+            min_cost = self._min_cost(symbol)
+            if cost < min_cost:
+                 return {"success": False, "message": f"Valor muito baixo (${cost:.2f}). Mínimo ${min_cost:.2f}."}
 
             log_exec.info(f"🔫 SNIPER MARKET BUY: {amount} {symbol} (~${cost:.2f})")
 
             # 3. Envia Ordem a Mercado
             try:
                 # Na Binance Spot, create_order 'market' usa a quantidade da moeda, não USDT
-                order = self.exchange.create_order(symbol, 'market', 'buy', amount)
+                order = self.exchange.create_order(symbol, 'market', 'buy', amount, params=FULL_RESPONSE)
             except Exception as e:
                 msg = str(e)
                 if "Insufficient funds" in msg:
                     return {"success": False, "message": "Erro Binance: Saldo Insuficiente."}
                 raise e
+            self._record_ack('buy', symbol, tick_start)
 
-            # 4. Captura Preço Médio de Execução Real
-            # Ordens a mercado geralmente retornam preenchidas imediatamente, 
-            # mas vamos garantir buscando os detalhes.
-            fill_price = price # Fallback
-            filled_qty = float(amount)
-
-            if 'average' in order and order['average']:
-                fill_price = float(order['average'])
-            else:
-                # Busca trade recente da ordem para saber preço exato
-                time.sleep(1) # Breve delay para a exchange processar
-                try:
-                    trades = self.exchange.fetch_my_trades(symbol, limit=1, params={'orderId': order['id']})
-                    if trades:
-                        fill_price = trades[0]['price']
-                except:
-                    pass # Mantém o preço do ticker como estimativa se falhar
+            # 4. Preço médio e quantidade reais direto dos fills da resposta (sem sleep/consulta extra)
+            avg, filled, base_fee = self._parse_fills(order, symbol)
+            fill_price = avg or price # Fallback: preço de referência como estimativa
+            # Taxa cobrada na própria moeda reduz o saldo disponível para o Stop
+            filled_qty = (filled or float(amount)) - base_fee
 
             log_exec.info(f"✅ EXECUTADO (MARKET) a ${fill_price}")
-            
+
             return {
-                "success": True, 
-                "price": float(fill_price), 
-                "amount": float(amount),
-                "cost": float(amount) * float(fill_price)
+                "success": True,
+                "price": float(fill_price),
+                "amount": float(filled_qty),
+                "cost": float(filled or amount) * float(fill_price)
             }
 
         except Exception as e:
             log_error.error(f"❌ Falha Market Buy: {e}")
             return {"success": False, "message": str(e)}
 
+    @timed_stage('order_stop')
     def place_hard_stop(self, symbol, amount, stop_price):
         """
         SEGURANÇA DE REDUNDÂNCIA:
@@ -79,8 +117,8 @@ class ExecutionManager:
         """
         try:
             # O preço limite de venda deve ser ligeiramente abaixo do gatilho para garantir execução
-            limit_price = stop_price * 0.998 
-            
+            limit_price = stop_price * 0.998
+
             amount_prec = self.exchange.amount_to_precision(symbol, amount)
             stop_price_prec = self.exchange.price_to_precision(symbol, stop_price)
             limit_price_prec = self.exchange.price_to_precision(symbol, limit_price)
@@ -89,13 +127,13 @@ class ExecutionManager:
 
             # Parâmetros para Binance (Stop Limit)
             params = {'stopPrice': stop_price_prec}
-            
+
             order = self.exchange.create_order(
-                symbol, 
-                'limit', 
-                'sell', 
-                amount_prec, 
-                limit_price_prec, 
+                symbol,
+                'limit',
+                'sell',
+                amount_prec,
+                limit_price_prec,
                 params=params
             )
             return {"success": True, "id": order['id']}
@@ -103,7 +141,8 @@ class ExecutionManager:
             log_error.error(f"⚠️ FALHA AO CRIAR HARD STOP NA BINANCE: {e}")
             return {"success": False, "message": str(e)}
 
-    def place_market_sell(self, symbol, amount_coin):
+    @timed_stage('order_sell')
+    def place_market_sell(self, symbol, amount_coin, tick_start=None):
         """
         Venda a Mercado (Market) para garantir saída rápida.
         """
@@ -115,16 +154,17 @@ class ExecutionManager:
 
             amount = self.exchange.amount_to_precision(symbol, amount_coin)
             log_exec.info(f"🔻 VENDENDO {amount} {symbol} (Market)")
-            
-            order = self.exchange.create_order(symbol, 'market', 'sell', amount)
-            
-            if 'average' in order and order['average']:
-                return {"success": True, "price": float(order['average'])}
-            
-            time.sleep(1)
+
+            order = self.exchange.create_order(symbol, 'market', 'sell', amount, params=FULL_RESPONSE)
+            self._record_ack('sell', symbol, tick_start)
+
+            avg, _, _ = self._parse_fills(order, symbol)
+            if avg: return {"success": True, "price": avg}
+
+            # Resposta sem fills (raro): consulta única, sem espera
             updated = self.exchange.fetch_order(order['id'], symbol)
-            return {"success": True, "price": float(updated.get('average', 0))}
-            
+            return {"success": True, "price": float(updated.get('average') or 0)}
+
         except Exception as e:
             log_error.error(f"Erro na venda: {e}")
-            return {"success": False, "message": str(e)}
\ No newline at end of file
+            return {"success": False, "message": str(e)}
@@ -1,9 +1,14 @@
 import pandas as pd
 import numpy as np
+import math
+from collections import deque
 
 import pandas as pd
 import numpy as np
 
+# Ordem das colunas produzidas por add_indicators / StreamingIndicators
+INDICATOR_COLUMNS = ['rsi', 'bb_upper', 'bb_lower', 'ema200', 'atr', 'fibo_high', 'fibo_low']
+
 def add_indicators(df):
     
     try:
@@ -48,6 +53,123 @@ def add_indicators(df):
         print(f"⚠️ Erro crítico em indicators.py: {e}")
         return df
 
+class StreamingIndicators:
+    """
+    Versão incremental (O(1) por candle) de add_indicators.
+
+    Mantém o estado recursivo de cada indicador apenas com candles FECHADOS.
+    O candle em formação é avaliado a partir desse estado sem alterá-lo, então
+    revisões do último candle (mesmo timestamp) custam o mesmo que um candle novo.
+    Os valores batem com a versão pandas (ewm adjust=False, rolling) dentro da tolerância de float.
+    """
+    RSI_ALPHA = 1 / 14
+    EMA_ALPHA = 2 / (200 + 1)
+    ATR_ALPHA = 1 / 14
+    ATR_MIN_PERIODS = 14
+    BB_WINDOW = 20
+    FIBO_WINDOW = 50
+
+    def __init__(self):
+        self.count = 0            # Candles fechados já incorporados ao estado
+        self.prev_close = None
+        self.rsi_up = None
+        self.rsi_down = None
+        self.ema = None
+        self.atr = None
+        # Janelas com os (N-1) candles fechados mais recentes; o candle atual completa a janela
+        self.bb_closes = deque(maxlen=self.BB_WINDOW - 1)
+        self.bb_sum = 0.0
+        self.bb_sumsq = 0.0
+        self.max_highs = deque()  # Monotônica decrescente de (idx, high)
+        self.min_lows = deque()   # Monotônica crescente de (idx, low)
+        self.pending = None       # (timestamp, candle, estado avaliado) do candle em formação
+
+    def _evaluate(self, high, low, close):
+        nan = float('nan')
+        n = self.count
+        pc = self.prev_close
+
+        # --- RSI 14 ---
+        rsi, rsi_up, rsi_down = nan, self.rsi_up, self.rsi_down
+        if pc is not None:
+            delta = close - pc
+            up, down = max(delta, 0.0), max(-delta, 0.0)
+            if rsi_up is None: rsi_up, rsi_down = up, down
+            else:
+                rsi_up = (1 - self.RSI_ALPHA) * rsi_up + self.RSI_ALPHA * up
+                rsi_down = (1 - self.RSI_ALPHA) * rsi_down + self.RSI_ALPHA * down
+            if rsi_down == 0: rs = math.inf if rsi_up > 0 else nan
+            else: rs = rsi_up / rsi_down
+            rsi = 100 - (100 / (1 + rs))
+
+        # --- Bollinger Bands (20, 2) ---
+        bb_upper = bb_lower = nan
+        if len(self.bb_closes) == self.BB_WINDOW - 1:
+            w = self.BB_WINDOW
+            total = self.bb_sum + close
+            mean = total / w
+            var = (self.bb_sumsq + close * close - total * mean) / (w - 1)
+            std = math.sqrt(var) if var > 0 else 0.0
+            bb_upper, bb_lower = mean + std * 2, mean - std * 2
+
+        # --- EMA 200 ---
+        ema = close if self.ema is None else (1 - self.EMA_ALPHA) * self.ema + self.EMA_ALPHA * close
+
+        # --- ATR 14 ---
+        tr = high - low
+        if pc is not None: tr = max(tr, abs(high - pc), abs(low - pc))
+        atr_state = tr if self.atr is None else (1 - self.ATR_ALPHA) * self.atr + self.ATR_ALPHA * tr
+        atr = atr_state if n + 1 >= self.ATR_MIN_PERIODS else nan
+
+        # --- FIBONACCI (DONCHIAN 50) ---
+        fibo_high = fibo_low = nan
+        if n + 1 >= self.FIBO_WINDOW:
+            fibo_high = max(self.max_highs[0][1], high) if self.max_highs else high
+            fibo_low = min(self.min_lows[0][1], low) if self.min_lows else low
+
+        values = (rsi, bb_upper, bb_lower, ema, atr, fibo_high, fibo_low)
+        return values, (rsi_up, rsi_down, ema, atr_state)
+
+    def _commit(self, candle, state):
+        high, low, close = candle
+        idx = self.count
+        self.rsi_up, self.rsi_down, self.ema, self.atr = state
+        self.prev_close = close
+
+        if len(self.bb_closes) == self.bb_closes.maxlen:
+            old = self.bb_closes[0]
+            self.bb_sum -= old; self.bb_sumsq -= old * old
+        self.bb_closes.append(close)
+        self.bb_sum += close; self.bb_sumsq += close * close
+        # Ressincroniza as somas a cada volta da janela para não acumular erro de float
+        if idx % self.bb_closes.maxlen == 0:
+            self.bb_sum = sum(self.bb_closes)
+            self.bb_sumsq = sum(c * c for c in self.bb_closes)
+
+        while self.max_highs and self.max_highs[-1][1] <= high: self.max_highs.pop()
+        self.max_highs.append((idx, high))
+        while self.min_lows and self.min_lows[-1][1] >= low: self.min_lows.pop()
+        self.min_lows.append((idx, low))
+        oldest_valid = idx + 1 - (self.FIBO_WINDOW - 1)
+        while self.max_highs[0][0] < oldest_valid: self.max_highs.popleft()
+        while self.min_lows[0][0] < oldest_valid: self.min_lows.popleft()
+
+        self.count = idx + 1
+
+    def update(self, timestamp, open_, high, low, close):
+        """
+        Incorpora um candle e retorna a tupla de indicadores (ordem de INDICATOR_COLUMNS).
+        Mesmo timestamp do candle pendente = revisão do candle em formação.
+        """
+        high, low, close = float(high), float(low), float(close)
+        if self.pending is not None:
+            pending_ts, pending_candle, pending_state = self.pending
+            if timestamp < pending_ts: raise ValueError("Candle fora de ordem")
+            if timestamp > pending_ts: self._commit(pending_candle, pending_state)
+        values, state = self._evaluate(high, low, close)
+        self.pending = (timestamp, (high, low, close), state)
+        return values
+
 def check_trend_m5(df):
     
     if df is None or df.empty: return False, "SEM DADOS"
@@ -0,0 +1,151 @@
+import heapq
+import itertools
+import threading
+import time
+import uuid
+from collections import deque
+from logger import log_error
+
+# Prioridades (menor = roda primeiro)
+PRIORITY_HIGH = 0    # Backtest de um ativo
+PRIORITY_NORMAL = 1  # Portfólio
+PRIORITY_LOW = 2     # Sweep de parâmetros
+
+class JobCancelled(Exception):
+    pass
+
+class JobScheduler:
+    """
+    Fila de jobs (backtests) com pool FIXO de workers.
+
+    - Fila com prioridade e limite de jobs ativos por usuário
+    - Cancelamento cooperativo (checado a cada atualização de progresso, inclusive dentro do loop da simulação)
+    - Jobs finalizados são removidos após `ttl` segundos por uma thread de limpeza,
+      sem depender de alguém consultar o status
+    - Posição na fila e ETA estimados pela duração média dos últimos jobs
+    """
+    def __init__(self, workers=1, max_per_user=2, max_queue=50, ttl=600):
+        self.workers = workers
+        self.max_per_user = max_per_user
+        self.max_queue = max_queue
+        self.ttl = ttl
+        self.jobs = {}
+        self._heap = []
+        self._seq = itertools.count()
+        self._durations = deque(maxlen=20)
+        self._cond = threading.Condition()
+        for i in range(workers):
+            threading.Thread(target=self._worker_loop, name=f"job-worker-{i}", daemon=True).start()
+        threading.Thread(target=self._janitor_loop, name="job-janitor", daemon=True).start()
+
+    def submit(self, owner, fn, priority=PRIORITY_NORMAL, label=""):
+        """
+        Enfileira fn(progress_callback) -> resultado.
+        Retorna (job_id, None) ou (None, motivo da recusa).
+        """
+        with self._cond:
+            active = [j for j in self.jobs.values() if j['state'] in ('queued', 'running')]
+            if sum(1 for j in active if j['owner'] == owner) >= self.max_per_user:
+                return None, f"Limite de {self.max_per_user} backtests simultâneos por usuário."
+            if sum(1 for j in active if j['state'] == 'queued') >= self.max_queue:
+                return None, "Fila de backtests cheia. Tente novamente em instantes."
+
+            job_id = uuid.uuid4().hex
+            self.jobs[job_id] = {
+                'owner': owner, 'label': label, 'priority': priority, 'state': 'queued',
+                'progress': 0, 'message': 'Na fila...', 'result': None, 'error': None,
+                'start_time': time.time(), 'started_at': None, 'finished_at': None,
+                'cancel': False, 'fn': fn
+            }
+            heapq.heappush(self._heap, (priority, next(self._seq), job_id))
+            self._cond.notify()
+            return job_id, None
+
+    def cancel(self, job_id, owner):
+        with self._cond:
+            job = self.jobs.get(job_id)
+            if not job or job['owner'] != owner: return False, "Job não encontrado"
+            if job['state'] == 'queued':
+                self._finish(job, 'cancelled', message="Cancelado.")
+            elif job['state'] == 'running':
+                job['cancel'] = True
+                job['message'] = "Cancelando..."
+            else:
+                return False, "Job já finalizado"
+            return True, "Cancelamento solicitado"
+
+    def _avg_duration(self):
+        return (sum(self._durations) / len(self._durations)) if self._durations else None
+
+    def _queue_position(self, job_id):
+        ordered = sorted(item for item in self._heap if self.jobs.get(item[2], {}).get('state') == 'queued')
+        for pos, item in enumerate(ordered, start=1):
+            if item[2] == job_id: return pos
+        return 0
+
+    def status(self, job_id, owner=None):
+        """Visão pública do job (mesmo formato antigo + estado, fila e ETA)."""
+        with self._cond:
+            job = self.jobs.get(job_id)
+            if not job or (owner is not None and job['owner'] != owner): return None
+            avg = self._avg_duration()
+            view = {k: job[k] for k in ('progress', 'message', 'result', 'start_time', 'state')}
+            if job['error']: view['error'] = job['error']
+            view['queue_position'] = self._queue_position(job_id) if job['state'] == 'queued' else 0
+            eta = None
+            if avg is not None:
+                if job['state'] == 'queued':
+                    running_left = [max(avg - (time.time() - j['started_at']), 0) for j in self.jobs.values() if j['state'] == 'running']
+                    ahead = view['queue_position'] - 1
+                    eta = (min(running_left) if len(running_left) >= self.workers else 0) + (ahead // self.workers + 1) * avg
+                elif job['state'] == 'running':
+                    eta = max(avg - (time.time() - job['started_at']), 0)
+            view['eta_seconds'] = round(eta, 1) if eta is not None else None
+            return view
+
+    def _finish(self, job, state, result=None, error=None, message=None):
+        job['state'] = state
+        job['finished_at'] = time.time()
+        job['fn'] = None
+        if result is not None: job['result'] = result
+        if error is not None:
+            job['error'] = error
+            job['progress'] = -1
+        if message: job['message'] = message
+
+    def _worker_loop(self):
+        while True:
+            with self._cond:
+                while not self._heap: self._cond.wait()
+                _, _, job_id = heapq.heappop(self._heap)
+                job = self.jobs.get(job_id)
+                if not job or job['state'] != 'queued': continue
+                job['state'] = 'running'
+                job['started_at'] = time.time()
+                job['message'] = 'Inicializando...'
+                fn = job['fn']
+
+            def progress_callback(pct, msg, job=job):
+                if job['cancel']: raise JobCancelled()
+                job['progress'] = pct
+                job['message'] = msg
+
+            try:
+                result = fn(progress_callback)
+                with self._cond:
+                    self._finish(job, 'done', result=result, message="Concluído!")
+                    job['progress'] = 100
+                    self._durations.append(job['finished_at'] - job['started_at'])
+            except JobCancelled:
+                with self._cond: self._finish(job, 'cancelled', message="Cancelado.")
+            except Exception as e:
+                log_error.error(f"Erro Job {job['label']}: {e}")
+                with self._cond: self._finish(job, 'error', error=str(e))
+
+    def _janitor_loop(self):
+        while True:
+            time.sleep(30)
+            now = time.time()
+            with self._cond:
+                expired = [jid for jid, j in self.jobs.items() if j['finished_at'] and now - j['finished_at'] > self.ttl]
+                for jid in expired: self.jobs.pop(jid, None)
@@ -0,0 +1,82 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from logger import log_error
+
+class SymbolState:
+    """Última análise de um ativo monitorado pelo LiveEngine."""
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.d_m5, self.df_m5 = None, None
+        self.d_h1, self.df_h1 = None, None
+        self.m5_updated_at = 0
+        self.h1_updated_at = 0
+        self.failures = 0     # Falhas consecutivas de análise
+        self.fresh = False    # M5 atualizado NESTE tick (só dados frescos podem gerar ordens)
+
+    @property
+    def ready(self):
+        return self.fresh and self.d_m5 is not None and self.df_h1 is not None
+
+
+class LiveEngine:
+    """
+    Motor ao vivo multi-ativo.
+
+    A cada tick todos os ativos monitorados são analisados em paralelo num pool fixo de threads.
+    Cada resultado é entregue assim que fica pronto (as_completed): a latência de entrada de um ativo
+    depende só da sua própria análise, não da quantidade de ativos na lista.
+    O H1 dos ativos em segundo plano é renovado a cada `h1_refresh` segundos (tendência lenta);
+    os ativos em `always_h1` (gráfico/posição) renovam o H1 em todo tick e são os únicos analisados
+    com `focus=True` (montam a lista de candles do gráfico; os demais só os campos da última linha).
+    """
+    def __init__(self, analyze, max_workers=8, h1_refresh=30):
+        self.analyze = analyze  # analyze(symbol, timeframe, focus) -> (dict, DataFrame) ou (None, None)
+        self.h1_refresh = h1_refresh
+        self.states = {}
+        self._lock = threading.Lock()
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="live")
+
+    def get(self, symbol):
+        with self._lock:
+            state = self.states.get(symbol)
+            if state is None:
+                state = SymbolState(symbol)
+                self.states[symbol] = state
+            return state
+
+    def peek(self, symbol):
+        """Estado do ativo sem registrá-lo (None se o motor nunca o analisou)."""
+        return self.states.get(symbol)
+
+    def _refresh(self, state, focus):
+        d_m5, df_m5 = self.analyze(state.symbol, '5m', focus)
+        state.fresh = d_m5 is not None
+        if state.fresh:
+            state.d_m5, state.df_m5 = d_m5, df_m5
+            state.m5_updated_at = time.time()
+            state.failures = 0
+        else:
+            state.failures += 1
+
+        if focus or time.time() - state.h1_updated_at >= self.h1_refresh:
+            d_h1, df_h1 = self.analyze(state.symbol, '1h', focus)
+            if d_h1 is not None:
+                state.d_h1, state.df_h1 = d_h1, df_h1
+                state.h1_updated_at = time.time()
+        return state
+
+    def run_tick(self, symbols, always_h1=()):
+        """Analisa `symbols` em paralelo e gera cada SymbolState conforme termina."""
+        futures = {}
+        for symbol in dict.fromkeys(symbols): # Sem duplicatas, mantendo a ordem (prioridade de envio)
+            state = self.get(symbol)
+            futures[self._pool.submit(self._refresh, state, symbol in always_h1)] = state
+        for fut in as_completed(futures):
+            state = futures[fut]
+            try:
+                yield fut.result()
+            except Exception as e:
+                state.fresh = False
+                state.failures += 1
+                log_error.error(f"Erro análise {state.symbol}: {e}")
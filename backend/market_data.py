@@ -1,94 +1,87 @@
-import ccxt
+import numpy as np
 import pandas as pd
+from datetime import datetime, timezone
 from logger import log_error 
-from indicators import add_indicators
+from indicators import add_indicators, StreamingIndicators, INDICATOR_COLUMNS
+from candle_store import CandleStore
+from metrics import metrics
+from rate_limiter import create_exchange
+from single_flight import SingleFlight
+from btc_regime import BtcRegimeService
+
+# Formato de data das respostas da API (internamente tudo é epoch ms)
+TIMESTAMP_FORMAT = '%Y-%m-%dT%H:%M:%S.000Z'
 
 # --- INSTÂNCIA GLOBAL ---
-exchange = ccxt.binance({
-    'enableRateLimit': True,
-    'options': {'defaultType': 'spot'} 
-})
+exchange = create_exchange(client='market')
+
+# Cache de candles compartilhado pelo loop ao vivo (evita rebaixar 1500 candles por tick)
+# 15m/1h/4h são agregados localmente dos candles de 5m (só o warmup inicial vem da API)
+candle_store = CandleStore(exchange, indicator_factory=StreamingIndicators, base_timeframe='5m')
+
+# Loop ao vivo, scanner e dashboard pedem o mesmo par no mesmo instante: uma busca só (TTL menor que o tick)
+market_flight = SingleFlight('market', ttl=1.0)
+
+# Regime macro do BTC compartilhado (loop ao vivo, scanner)
+btc_regime = BtcRegimeService(candle_store)
 
 def fetch_market_data(symbol, timeframe, limit=1000): 
     """
     Busca dados de mercado (OHLCV) na Binance.
     Suporta paginação automática para limites > 1000 candles (Vital para EMA precisa).
+    Após o primeiro download, o CandleStore busca apenas os candles novos.
+    Chamadas simultâneas para o mesmo (symbol, timeframe, limit) dividem uma única busca;
+    o DataFrame devolvido é compartilhado (somente leitura).
     """
-    try:
-        # 1. Busca os candles mais recentes (Limite API padrão é 1000)
-        fetch_limit = min(limit, 1000)
-        candles = exchange.fetch_ohlcv(symbol, timeframe, limit=fetch_limit)
-        
-        if not candles: return None
+    return market_flight.do((symbol, timeframe, limit), lambda: _fetch_market_data(symbol, timeframe, limit))
 
-        # 2. Se precisarmos de mais de 1000, fazemos paginação para trás
-        # Isso garante histórico suficiente para o Warmup da EMA200
-        if limit > 1000 and len(candles) >= 1000:
-            remaining = limit - len(candles)
-            # Pega o timestamp do candle mais antigo que já temos
-            oldest_timestamp = candles[0][0]
-            
-            # Busca o restante terminando ANTES do candle mais antigo atual
-            # params={'endTime': ...} é específico da Binance para paginação reversa
-            prev_candles = exchange.fetch_ohlcv(
-                symbol, 
-                timeframe, 
-                limit=remaining, 
-                params={'endTime': oldest_timestamp - 1}
-            )
-            
-            if prev_candles:
-                # Concatena: Antigos + Recentes
-                candles = prev_candles + candles
+def _fetch_market_data(symbol, timeframe, limit):
+    try:
+        # Histórico incremental: só os candles novos (ou o candle em formação) vêm da API
+        with metrics.timer('sniper_stage_seconds', stage='fetch', symbol=symbol, timeframe=timeframe):
+            candles, indicators = candle_store.get_candles(symbol, timeframe, limit=limit)
 
         # Proteção mínima
         if not candles or len(candles) < 200: 
             return None
 
-        df = pd.DataFrame(candles, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
-        
-        # --- CORREÇÃO DE FUSO HORÁRIO ---
-        df['timestamp'] = pd.to_datetime(df['timestamp'], unit='ms', utc=True).dt.strftime('%Y-%m-%dT%H:%M:%S.000Z')
-        
-        cols = ['open', 'high', 'low', 'close', 'volume']
-        df[cols] = df[cols].astype(float)
-        
-        # --- APLICAÇÃO DE INDICADORES ---
-        # Calcula indicadores com todo o histórico baixado (ex: 1500)
-        df = add_indicators(df)
+        with metrics.timer('sniper_stage_seconds', stage='indicators', symbol=symbol, timeframe=timeframe):
+            df = pd.DataFrame(candles, columns=['timestamp', 'open', 'high', 'low', 'close', 'volume'])
+            # Timestamp fica em epoch ms (int64, UTC): texto só na borda da API (format_candles)
+            df['timestamp'] = df['timestamp'].astype('int64')
+            
+            cols = ['open', 'high', 'low', 'close', 'volume']
+            df[cols] = df[cols].astype(float)
+            
+            # --- APLICAÇÃO DE INDICADORES ---
+            # O CandleStore já mantém os indicadores incrementais (mesmo resultado do add_indicators)
+            if indicators is not None:
+                df[INDICATOR_COLUMNS] = pd.DataFrame(indicators, columns=INDICATOR_COLUMNS, index=df.index)
+            else:
+                df = add_indicators(df)
         
         if df.empty: return None
         
         return df
 
     except Exception as e:
+        metrics.inc('sniper_stage_errors_total', stage='fetch', symbol=symbol, timeframe=timeframe)
         log_error.error(f"Erro ao buscar dados de {symbol} ({timeframe}): {str(e)}")
         return None
 
+def format_timestamp(ts_ms):
+    """Epoch ms -> texto ISO UTC da API (ex: 2024-01-01T00:05:00.000Z)."""
+    return datetime.fromtimestamp(int(ts_ms) / 1000, tz=timezone.utc).strftime(TIMESTAMP_FORMAT)
+
+def format_candles(candles):
+    """Cópia dos candles com o timestamp em ISO UTC, formatado em lote (uso exclusivo na serialização)."""
+    if not candles: return candles
+    stamps = np.datetime_as_string(np.array([c['timestamp'] for c in candles], dtype='datetime64[ms]'), unit='ms', timezone='UTC')
+    return [{**c, 'timestamp': ts} for c, ts in zip(candles, stamps.tolist())]
+
 def get_bitcoin_health():
     """
     Função 'Sentinela': Verifica a saúde macro do mercado (BTC).
+    Resultado em cache no BtcRegimeService (só recalcula com candle H1 novo ou movimento relevante).
     """
-    try:
-        # Analisa o BTC no H1 para tendência macro
-        df_btc = fetch_market_data("BTC/USDT", "1h", limit=250)
-        
-        if df_btc is None or df_btc.empty:
-            return "NEUTRAL", "BTC Dados Indisponíveis"
-            
-        last = df_btc.iloc[-1]
-        price = float(last['close'])
-        ema200 = float(last.get('ema200', 0))
-        rsi = float(last['rsi'])
-        
-        if rsi < 25:
-            return "CRASH", f"BTC Oversold Extremo ({rsi:.1f})"
-            
-        if price < ema200:
-            return "BEAR", "BTC abaixo da EMA200 (H1)"
-            
-        return "BULL", "BTC Saudável"
-
-    except Exception as e:
-        print(f"Erro ao ler BTC: {e}")
-        return "NEUTRAL", "Erro Leitura"
\ No newline at end of file
+    return btc_regime.get()
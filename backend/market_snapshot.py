@@ -0,0 +1,101 @@
+import gzip
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from metrics import metrics
+
+def encode_json(payload):
+    return json.dumps(payload, separators=(',', ':'), default=str).encode('utf-8')
+
+
+class _Fragment:
+    """Valor imutável publicado pelo worker; os bytes JSON são gerados uma única vez, no primeiro uso."""
+    __slots__ = ("version", "value", "_encoded")
+
+    def __init__(self, version, value):
+        self.version = version
+        self.value = value
+        self._encoded = {}  # variante -> bytes
+
+    def encoded(self, variant, encoder):
+        # Corrida entre dois leitores só gera os mesmos bytes duas vezes (sem lock no caminho da requisição)
+        data = self._encoded.get(variant)
+        if data is None: data = self._encoded[variant] = encoder(self.value)
+        return data
+
+
+class SnapshotStore:
+    """
+    Snapshot do /market em fragmentos versionados (ex: data_5m, data_1h).
+
+    O worker publica objetos novos (nunca muta os já publicados); cada fragmento é codificado
+    em JSON uma vez por versão e reaproveitado por todas as requisições. O corpo final é montado
+    concatenando bytes: só os campos pequenos (status, usuário) são codificados por requisição.
+    Variantes gzip ficam num LRU por ETag.
+    `encoders` = {variante: encoder(valor) -> bytes}: cada formato de resposta (ex: "json", "columnar")
+    formata na borda (timestamps, colunas) junto com a codificação, uma vez por versão.
+    """
+    def __init__(self, encoders=None, gzip_entries=32, gzip_min_size=1024, gzip_level=6):
+        self.encoders = encoders or {"json": encode_json}
+        self._fragments = {}
+        self._version = 0
+        self._epoch = os.urandom(8)  # ETags de outro processo (reinício) nunca coincidem com as atuais
+        self._lock = threading.Lock()
+        self._gzip = OrderedDict()
+        self._gzip_lock = threading.Lock()
+        self.gzip_entries = gzip_entries
+        self.gzip_min_size = gzip_min_size
+        self.gzip_level = gzip_level
+
+    def publish(self, **values):
+        """Substitui os fragmentos informados (None ou o MESMO objeto já publicado = mantém a versão)."""
+        with self._lock:
+            for name, value in values.items():
+                current = self._fragments.get(name)
+                if value is None or (current and current.value is value): continue
+                self._version += 1
+                self._fragments[name] = _Fragment(self._version, value)
+
+    def get(self, name):
+        """Valor atual (somente leitura) do fragmento, ou None."""
+        frag = self._fragments.get(name)
+        return frag.value if frag else None
+
+    def render(self, fields, names, variant="json"):
+        """
+        Retorna (etag, body) do objeto JSON `fields` + fragmentos `names`, onde `body()` monta os bytes.
+        A ETag depende só das versões dos fragmentos e dos bytes de `fields`: um 304 não concatena nada.
+        """
+        with self._lock: frags = [(name, self._fragments.get(name)) for name in names]
+        head = encode_json(fields)
+        encoder = self.encoders[variant]
+        digest = hashlib.blake2b(head, digest_size=8, salt=self._epoch, person=variant.encode()[:16])
+        for name, frag in frags: digest.update(f"|{name}:{frag.version if frag else 0}".encode())
+        etag = digest.hexdigest()
+
+        def body():
+            parts = [f'"{name}":'.encode() + (frag.encoded(variant, encoder) if frag else b'null') for name, frag in frags]
+            if head == b'{}': return b'{' + b','.join(parts) + b'}'
+            return head[:-1] + b''.join(b',' + p for p in parts) + b'}'
+        return etag, body
+
+    def gzipped(self, etag, body):
+        """Corpo comprimido, calculado uma vez por ETag. None quando não compensa comprimir."""
+        if len(body) < self.gzip_min_size: return None
+        with self._gzip_lock:
+            data = self._gzip.get(etag)
+            if data is not None:
+                self._gzip.move_to_end(etag)
+                metrics.inc('sniper_snapshot_gzip_total', result='hit')
+                return data
+        data = gzip.compress(body, compresslevel=self.gzip_level)
+        metrics.inc('sniper_snapshot_gzip_total', result='miss')
+        with self._gzip_lock:
+            self._gzip[etag] = data
+            while len(self._gzip) > self.gzip_entries: self._gzip.popitem(last=False)
+        return data
+
+
+metrics.describe("sniper_snapshot_gzip_total", "counter", "Variantes gzip do /market servidas do cache (hit) ou comprimidas (miss)")
@@ -0,0 +1,77 @@
+import json
+import queue
+import threading
+
+class StreamSubscriber:
+    def __init__(self, max_queue):
+        self.queue = queue.Queue(maxsize=max_queue)
+        self.overflowed = False  # Cliente lento perdeu eventos: precisa de novo snapshot
+
+
+class MarketStreamHub:
+    """
+    Pub/Sub em memória para o stream do dashboard (SSE).
+
+    O worker publica apenas DELTAS (candle atualizado/novos, mudanças de posição e trades);
+    cada cliente recebe um snapshot completo ao conectar e depois só os deltas.
+    """
+    def __init__(self, max_queue=256):
+        self.max_queue = max_queue
+        self.seq = 0
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self):
+        sub = StreamSubscriber(self.max_queue)
+        with self._lock: self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock: self._subscribers.discard(sub)
+
+    @property
+    def has_subscribers(self):
+        return bool(self._subscribers)
+
+    @property
+    def subscriber_count(self):
+        return len(self._subscribers)
+
+    def publish(self, event, payload):
+        with self._lock:
+            if not self._subscribers: return
+            self.seq += 1
+            message = (event, format_sse(event, payload, self.seq))
+            for sub in self._subscribers:
+                try: sub.queue.put_nowait(message)
+                except queue.Full: sub.overflowed = True
+
+
+def format_sse(event, payload, seq=None):
+    return format_sse_data(event, json.dumps(payload, separators=(',', ':'), default=str), seq)
+
+def format_sse_data(event, data, seq=None):
+    """Evento SSE com o JSON já codificado (ex: snapshot pré-codificado do /market)."""
+    head = f"id: {seq}\n" if seq is not None else ""
+    return f"{head}event: {event}\ndata: {data}\n\n"
+
+
+SUMMARY_FIELDS = ('price', 'open_price', 'rsi', 'ema200', 'ema_slope', 'atr', 'fibo_level', 'fibo_high', 'fibo_low', 'bb_upper', 'bb_lower', 'timestamp')
+
+def candle_delta(prev, curr):
+    """
+    Compara duas análises (saída de process_analysis) do MESMO símbolo.
+    Retorna os campos-resumo e os candles a partir do último candle já enviado
+    (o candle em formação atualizado + candles novos). None = exige snapshot.
+    """
+    if not prev or not curr or not prev.get('candles') or not curr.get('candles'): return None
+    last_sent_ts = prev['candles'][-1]['timestamp']
+    candles = curr['candles']
+    start = len(candles)
+    while start > 0 and candles[start - 1]['timestamp'] >= last_sent_ts: start -= 1
+    tail = candles[start:]
+    # Último candle enviado saiu da janela (ou dados regrediram): o cliente não consegue emendar
+    if not tail or tail[0]['timestamp'] != last_sent_ts: return None
+    summary = {k: curr.get(k) for k in SUMMARY_FIELDS}
+    if tail == prev['candles'][-len(tail):] and all(prev.get(k) == summary[k] for k in SUMMARY_FIELDS): return {}
+    return {"summary": summary, "candles": tail, "max_candles": len(candles)}
@@ -0,0 +1,187 @@
+import bisect
+import functools
+import os
+import threading
+import time
+
+# Buckets de latência (segundos): de 1ms (cálculo local) até 10s (Binance engasgada)
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+def _env_enabled():
+    return os.getenv("SNIPER_METRICS", "0").strip().lower() in ("1", "true", "yes", "on")
+
+class _NullTimer:
+    """Timer que não faz nada: usado quando as métricas estão desligadas."""
+    def __enter__(self): return self
+    def __exit__(self, *exc): return False
+
+NULL_TIMER = _NullTimer()
+
+class _Timer:
+    __slots__ = ("registry", "name", "labels", "start")
+
+    def __init__(self, registry, name, labels):
+        self.registry = registry
+        self.name = name
+        self.labels = labels
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.registry.observe(self.name, time.perf_counter() - self.start, **self.labels)
+        return False
+
+
+class MetricsRegistry:
+    """
+    Contadores, gauges e histogramas de latência em memória, exportados no formato texto do Prometheus.
+
+    Desligado (padrão, SNIPER_METRICS != 1) todas as chamadas retornam na primeira linha
+    e `timer()` devolve um objeto compartilhado que não mede nada: custo desprezível no loop ao vivo.
+    """
+    def __init__(self, enabled=None, buckets=DEFAULT_BUCKETS):
+        self.enabled = _env_enabled() if enabled is None else enabled
+        self.buckets = tuple(buckets)
+        self._counters = {}    # (nome, labels) -> valor
+        self._gauges = {}      # (nome, labels) -> valor
+        self._gauge_fns = {}   # nome -> função sem argumentos (avaliada no scrape)
+        self._histograms = {}  # (nome, labels) -> [contagem por bucket..., soma, total]
+        self._help = {}        # nome -> (tipo, descrição)
+        self._lock = threading.Lock()
+
+    def describe(self, name, kind, text):
+        self._help[name] = (kind, text)
+
+    @staticmethod
+    def _key(name, labels):
+        return name, tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        if not self.enabled: return
+        key = self._key(name, labels)
+        with self._lock: self._counters[key] = self._counters.get(key, 0) + value
+
+    def set_gauge(self, name, value, **labels):
+        if not self.enabled: return
+        with self._lock: self._gauges[self._key(name, labels)] = value
+
+    def gauge_callback(self, name, fn):
+        """Gauge calculado na hora do scrape (ex: tamanho de uma fila)."""
+        self._gauge_fns[name] = fn
+
+    def observe(self, name, seconds, **labels):
+        if not self.enabled: return
+        key = self._key(name, labels)
+        idx = bisect.bisect_left(self.buckets, seconds)
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None:
+                hist = [0] * (len(self.buckets) + 2)
+                self._histograms[key] = hist
+            if idx < len(self.buckets): hist[idx] += 1
+            hist[-2] += seconds
+            hist[-1] += 1
+
+    def timer(self, name, **labels):
+        """Context manager que registra a duração do bloco no histograma `name`."""
+        if not self.enabled: return NULL_TIMER
+        return _Timer(self, name, labels)
+
+    # --- EXPORTAÇÃO ---
+    @staticmethod
+    def _fmt_labels(labels, extra=None):
+        items = list(labels) + ([extra] if extra else [])
+        if not items: return ""
+        def esc(v): return str(v).replace("\\", "\\\\").replace("\"", "\\\"").replace("\n", "\\n")
+        return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in items) + "}"
+
+    @staticmethod
+    def _fmt_value(v):
+        if v == float("inf"): return "+Inf"
+        return repr(float(v)) if isinstance(v, float) else str(v)
+
+    def _header(self, lines, name, default_kind):
+        kind, text = self._help.get(name, (default_kind, ""))
+        if text: lines.append(f"# HELP {name} {text}")
+        lines.append(f"# TYPE {name} {kind}")
+
+    def render(self):
+        """Snapshot de todas as séries no formato de exposição do Prometheus (text/plain 0.0.4)."""
+        with self._lock:
+            counters = dict(self._counters)
+            gauges = dict(self._gauges)
+            histograms = {k: list(v) for k, v in self._histograms.items()}
+
+        for name, fn in list(self._gauge_fns.items()):
+            try: gauges[(name, ())] = fn()
+            except Exception: pass
+
+        lines = []
+        for source, kind in ((counters, "counter"), (gauges, "gauge")):
+            by_name = {}
+            for (name, labels), value in source.items(): by_name.setdefault(name, []).append((labels, value))
+            for name in sorted(by_name):
+                self._header(lines, name, kind)
+                for labels, value in sorted(by_name[name]):
+                    lines.append(f"{name}{self._fmt_labels(labels)} {self._fmt_value(value)}")
+
+        by_name = {}
+        for (name, labels), hist in histograms.items(): by_name.setdefault(name, []).append((labels, hist))
+        for name in sorted(by_name):
+            self._header(lines, name, "histogram")
+            for labels, hist in sorted(by_name[name]):
+                cumulative = 0
+                for bound, count in zip(self.buckets, hist):
+                    cumulative += count
+                    lines.append(f"{name}_bucket{self._fmt_labels(labels, ('le', repr(bound)))} {cumulative}")
+                lines.append(f"{name}_bucket{self._fmt_labels(labels, ('le', '+Inf'))} {hist[-1]}")
+                lines.append(f"{name}_sum{self._fmt_labels(labels)} {self._fmt_value(hist[-2])}")
+                lines.append(f"{name}_count{self._fmt_labels(labels)} {hist[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+def timed_stage(stage):
+    """Decorator para métodos (self, symbol, ...): mede a chamada como uma etapa do tick."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(self, symbol, *args, **kwargs):
+            with metrics.timer("sniper_stage_seconds", stage=stage, symbol=symbol, timeframe=""):
+                return fn(self, symbol, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def instrument_exchange(exchange, client):
+    """
+    Mede todas as chamadas HTTP de uma instância ccxt (latência, total e erros por endpoint).
+    `client` identifica a instância (ex: 'market', 'account', 'scanner').
+    Com as métricas desligadas a instância é devolvida intacta.
+    """
+    if not metrics.enabled or exchange is None: return exchange
+    original = exchange.request
+
+    def request(path, *args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return original(path, *args, **kwargs)
+        except Exception as e:
+            metrics.inc("sniper_exchange_errors_total", client=client, endpoint=path, error=type(e).__name__)
+            raise
+        finally:
+            metrics.inc("sniper_exchange_requests_total", client=client, endpoint=path)
+            metrics.observe("sniper_exchange_request_seconds", time.perf_counter() - start, client=client, endpoint=path)
+
+    exchange.request = request
+    return exchange
+
+
+# Instância global
+metrics = MetricsRegistry()
+metrics.describe("sniper_stage_seconds", "histogram", "Latencia de cada etapa do tick ao vivo")
+metrics.describe("sniper_stage_errors_total", "counter", "Etapas que terminaram com erro")
+metrics.describe("sniper_exchange_request_seconds", "histogram", "Latencia das chamadas HTTP a exchange")
+metrics.describe("sniper_exchange_requests_total", "counter", "Chamadas HTTP a exchange")
+metrics.describe("sniper_exchange_errors_total", "counter", "Chamadas HTTP a exchange com erro")
+metrics.describe("sniper_order_ack_seconds", "histogram", "Do inicio do tick ate o ACK da ordem na exchange")
@@ -1,14 +1,43 @@
+import itertools
+import json
+import os
+import sys
 import requests
 import threading
+import time
 from datetime import datetime
+from requests.adapters import HTTPAdapter
+from metrics import metrics
 
 # --- CONFIGURAÇÕES DINÂMICAS ---
 MASTER_TOKEN = None 
+# Base da Bot API (nos testes, aponte para o stub local: python telegram_stub.py + SNIPER_TELEGRAM_API=http://127.0.0.1:8081)
+TELEGRAM_API_BASE = os.getenv("SNIPER_TELEGRAM_API", "https://api.telegram.org")
+COALESCE = os.getenv("SNIPER_TELEGRAM_COALESCE", "0").strip().lower() in ("1", "true", "yes", "on")
 
-def setup_notification_system(token):
+# --- DESPACHO ---
+PRIORITY_CRITICAL = 0  # Entradas, saídas, proteção e falhas de execução
+PRIORITY_NORMAL = 1    # Estado do bot, configuração, testes
+PRIORITY_LOW = 2       # Relatórios (backtest)
+WORKERS = 2            # Um fica sempre livre para alertas críticos
+QUEUE_SIZE = 256
+CHAT_RATE = 1.0        # Telegram: ~1 mensagem/s por chat
+CHAT_BURST = 3
+GLOBAL_RATE = 25.0     # Telegram: ~30 mensagens/s por bot
+MAX_ATTEMPTS = 5
+MAX_TEXT = 4096        # Limite de texto do sendMessage
+
+# Cache de file_id das imagens (arquivo de runtime em data/; no executável, ao lado do .exe)
+if getattr(sys, 'frozen', False):
+    MEDIA_CACHE_FILE = os.path.join(os.path.dirname(sys.executable), "data", "telegram_media.json")
+else:
+    MEDIA_CACHE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "telegram_media.json")
+
+def setup_notification_system(token, api_base=None):
     """Função chamada pelo servidor para ativar as notificações via Banco de Dados"""
     global MASTER_TOKEN
     MASTER_TOKEN = token
+    if api_base: dispatcher.api_base = api_base.rstrip('/')
     if MASTER_TOKEN:
         print(f"✅ Notificações Ativadas via DB | Token final: ...{MASTER_TOKEN[-10:]}")
     else:
@@ -29,51 +58,320 @@ IMAGENS = {
     "BACKTEST": "https://github.com/ResoluteJax/imagensProjetoSniper/blob/main/sniper_backtest.jpg?raw=true" 
 }
 
+IMAGE_KEYS = {}  # URL -> entrada do IMAGENS (URLs repetidas ficam com a primeira entrada)
+for _key, _url in IMAGENS.items(): IMAGE_KEYS.setdefault(_url, _key)
+
 def format_currency(value):
     if value is None: return "$ 0.00"
     try: return f"$ {float(value):,.2f}".replace(",", "X").replace(".", ",").replace("X", ".")
     except: return "$ 0,00"
 
-def _telegram_worker(chat_id, message, image_url):
-    # Debug: Mostra o estado atual das variáveis globais
-    if not MASTER_TOKEN:
-        print(f"❌ FALHA DE ENVIO: MASTER_TOKEN está vazio/None. O server.py não injetou o token!")
-        return
-
-    try:
-        url = ""
-        payload = {}
-        
-        # Montagem da URL
-        if image_url and image_url.startswith("http"):
-            url = f"https://api.telegram.org/bot{MASTER_TOKEN}/sendPhoto"
-            payload = {'chat_id': chat_id, 'photo': image_url, 'caption': message, 'parse_mode': 'Markdown'}
-            print(f"📤 Tentando enviar FOTO para {chat_id}...")
+class TokenBucket:
+    """Ritmo de envio: `rate` fichas por segundo, acumulando até `burst`."""
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.stamp = time.monotonic()
+        self.paused_until = 0.0  # 429 com retry_after
+
+    def _refill(self, now):
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def ready_at(self, now):
+        """Instante (monotonic) em que uma ficha estará disponível."""
+        self._refill(now)
+        ready = now if self.tokens >= 1 else now + (1 - self.tokens) / self.rate
+        return max(ready, self.paused_until)
+
+    def take(self, now):
+        self._refill(now)
+        self.tokens -= 1
+
+    def pause(self, until):
+        self.paused_until = max(self.paused_until, until)
+        self.tokens = 0.0
+
+
+class MediaCache:
+    """
+    file_id do Telegram por entrada do IMAGENS, persistido em JSON.
+
+    A primeira vez que uma imagem vai por URL o Telegram baixa do GitHub e devolve o file_id;
+    dali em diante o envio usa o file_id (sem download, sem depender do GitHub).
+    file_id só vale para o bot que enviou: o cache é separado por bot (id antes do ':' do token).
+    """
+    def __init__(self, path=MEDIA_CACHE_FILE):
+        self.path = path
+        self._lock = threading.Lock()
+        self._data = {}  # bot_id -> {entrada: file_id}
+        try:
+            with open(path, 'r', encoding='utf-8') as f: self._data = json.load(f)
+        except FileNotFoundError: pass
+        except Exception as e: print(f"⚠️ Cache de mídia ignorado ({e})")
+
+    @staticmethod
+    def _bot(token):
+        return str(token).split(':', 1)[0]
+
+    def get(self, token, key):
+        with self._lock: return self._data.get(self._bot(token), {}).get(key)
+
+    def put(self, token, key, file_id):
+        with self._lock:
+            files = self._data.setdefault(self._bot(token), {})
+            if files.get(key) == file_id: return
+            files[key] = file_id
+            self._save()
+
+    def forget(self, token, key):
+        with self._lock:
+            if self._data.get(self._bot(token), {}).pop(key, None) is not None: self._save()
+
+    def _save(self):
+        tmp = f"{self.path}.tmp"
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump(self._data, f)
+                f.flush(); os.fsync(f.fileno())
+            os.replace(tmp, self.path)
+        except Exception as e:
+            print(f"⚠️ Erro ao salvar cache de mídia: {e}")
+
+
+class _Message:
+    __slots__ = ("priority", "seq", "chat_id", "text", "image_url", "enqueued", "attempts", "not_before")
+
+    def __init__(self, priority, seq, chat_id, text, image_url):
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.text = text
+        self.image_url = image_url
+        self.enqueued = [time.monotonic()]  # Um instante por mensagem original (várias quando agrupadas)
+        self.attempts = 0
+        self.not_before = 0.0
+
+
+class NotificationDispatcher:
+    """
+    Fila única de notificações do Telegram, atendida por poucos workers com uma sessão HTTP keep-alive.
+
+    - fila limitada por prioridade: cheia, a mensagem menos prioritária (e mais nova) é descartada;
+      alerta crítico nunca é recusado por causa de relatório;
+    - sai primeiro a mensagem mais prioritária (e mais antiga) cujo chat tem ficha no token bucket;
+      um worker fica sempre reservado para alertas críticos;
+    - no máximo um envio por chat em andamento, e uma retentativa pendente segura as mensagens
+      mais novas do chat (mantém a ordem; só um alerta mais prioritário passa na frente);
+    - 429: respeita `retry_after` pausando o chat; erro de rede/5xx: nova tentativa com backoff;
+    - `coalesce`: textos do mesmo chat e prioridade que se acumularam na fila viram uma mensagem só.
+    """
+    def __init__(self, api_base=TELEGRAM_API_BASE, workers=WORKERS, maxsize=QUEUE_SIZE,
+                 chat_rate=CHAT_RATE, chat_burst=CHAT_BURST, global_rate=GLOBAL_RATE, coalesce=COALESCE):
+        self.api_base = api_base.rstrip('/')
+        self.workers = workers
+        self.maxsize = maxsize
+        self.chat_rate = chat_rate
+        self.chat_burst = chat_burst
+        self.coalesce = coalesce
+        self._global = TokenBucket(global_rate, global_rate)
+        self._chats = {}           # chat_id -> TokenBucket
+        self._queue = []           # _Message (fila pequena: a escolha é uma varredura linear)
+        self._inflight = set()     # Chats com envio em andamento
+        self._busy_background = 0  # Workers ocupados com mensagens não críticas
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+        self._threads = []
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=workers)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def _start(self):
+        if self._threads: return
+        for i in range(self.workers):
+            t = threading.Thread(target=self._run, daemon=True, name=f"telegram-{i}")
+            t.start()
+            self._threads.append(t)
+
+    def _bucket(self, chat_id):
+        bucket = self._chats.get(chat_id)
+        if bucket is None: bucket = self._chats[chat_id] = TokenBucket(self.chat_rate, self.chat_burst)
+        return bucket
+
+    def submit(self, chat_id, text, image_url=None, priority=PRIORITY_NORMAL):
+        """Enfileira (não bloqueia). False quando a fila está cheia de mensagens tão ou mais prioritárias."""
+        with self._cond:
+            self._start()
+            if len(self._queue) >= self.maxsize:
+                victim = max(self._queue, key=lambda m: (m.priority, m.seq))
+                if victim.priority <= priority:
+                    metrics.inc('sniper_notify_messages_total', result='dropped', priority=str(priority))
+                    return False
+                self._queue.remove(victim)
+                metrics.inc('sniper_notify_messages_total', result='dropped', priority=str(victim.priority))
+                print(f"⚠️ Fila de notificações cheia: descartada mensagem de prioridade {victim.priority}")
+            self._queue.append(_Message(priority, next(self._seq), chat_id, text, image_url))
+            self._cond.notify_all()
+            return True
+
+    def _next(self):
+        """Próxima mensagem a enviar (espera até alguma poder sair) e já marca o chat como ocupado."""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                best, wake = None, None
+                background_full = self._busy_background >= max(self.workers - 1, 1)
+                # Retentativa pendente segura as mensagens mais novas do chat (mesma prioridade ou menor):
+                # a ordem por chat vale também depois de um 429/erro
+                retrying = {}
+                for m in self._queue:
+                    if m.attempts and (m.chat_id not in retrying or (m.priority, m.seq) < retrying[m.chat_id]):
+                        retrying[m.chat_id] = (m.priority, m.seq)
+                for m in self._queue:
+                    if m.chat_id in self._inflight: continue
+                    held = retrying.get(m.chat_id)
+                    if held and m.priority >= held[0] and m.seq > held[1]: continue
+                    if m.priority > PRIORITY_CRITICAL and background_full: continue
+                    ready = max(m.not_before, self._bucket(m.chat_id).ready_at(now), self._global.ready_at(now))
+                    if ready > now:
+                        wake = ready if wake is None else min(wake, ready)
+                    elif best is None or (m.priority, m.seq) < (best.priority, best.seq):
+                        best = m
+                if best is not None: break
+                self._cond.wait(None if wake is None else wake - now)
+            self._queue.remove(best)
+            if self.coalesce and not best.image_url: self._merge_into(best)
+            self._bucket(best.chat_id).take(now)
+            self._global.take(now)
+            self._inflight.add(best.chat_id)
+            if best.priority > PRIORITY_CRITICAL: self._busy_background += 1
+            return best
+
+    def _merge_into(self, head):
+        """Junta em `head` os textos pendentes do mesmo chat e prioridade (rajada vira uma mensagem)."""
+        for m in sorted(self._queue, key=lambda m: m.seq):
+            if m.chat_id != head.chat_id or m.priority != head.priority or m.image_url: continue
+            if len(head.text) + len(m.text) + 2 > MAX_TEXT: break
+            head.text += "\n\n" + m.text
+            head.enqueued.extend(m.enqueued)
+            self._queue.remove(m)
+            metrics.inc('sniper_notify_messages_total', result='coalesced', priority=str(m.priority))
+
+    def _release(self, m, retry_at=None):
+        with self._cond:
+            self._inflight.discard(m.chat_id)
+            if m.priority > PRIORITY_CRITICAL: self._busy_background -= 1
+            if retry_at is not None:
+                m.attempts += 1
+                m.not_before = retry_at
+                self._queue.append(m) # Já tinha sido aceita: volta mesmo com a fila cheia
+            self._cond.notify_all()
+
+    def _run(self):
+        while True:
+            m = self._next()
+            retry_at = None
+            try:
+                retry_at = self._deliver(m)
+            except Exception as e:
+                print(f"⚠️ ERRO no envio de notificação: {e}")
+            finally:
+                self._release(m, retry_at)
+
+    def _deliver(self, m):
+        """Envia uma mensagem. Devolve o instante da nova tentativa, ou None (entregue ou desistiu)."""
+        if not MASTER_TOKEN:
+            print(f"❌ FALHA DE ENVIO: MASTER_TOKEN está vazio/None. O server.py não injetou o token!")
+            metrics.inc('sniper_notify_messages_total', result='failed', priority=str(m.priority))
+            return None
+
+        token = MASTER_TOKEN
+        media_key, file_id = None, None
+        if m.image_url and m.image_url.startswith("http"):
+            media_key = IMAGE_KEYS.get(m.image_url)
+            file_id = media_cache.get(token, media_key) if media_key else None
+            metrics.inc('sniper_notify_media_total', result='hit' if file_id else 'miss')
+            method, payload = "sendPhoto", {'chat_id': m.chat_id, 'photo': file_id or m.image_url, 'caption': m.text, 'parse_mode': 'Markdown'}
         else:
-            url = f"https://api.telegram.org/bot{MASTER_TOKEN}/sendMessage"
-            payload = {'chat_id': chat_id, 'text': message, 'parse_mode': 'Markdown'}
-            print(f"📤 Tentando enviar TEXTO para {chat_id}...")
+            method, payload = "sendMessage", {'chat_id': m.chat_id, 'text': m.text, 'parse_mode': 'Markdown'}
+
+        try:
+            response = self.session.post(f"{self.api_base}/bot{token}/{method}", data=payload, timeout=10)
+        except requests.RequestException as e:
+            print(f"⚠️ ERRO DE CONEXÃO (Exception): {e}")
+            return self._backoff(m)
 
-        # Execução
-        response = requests.post(url, data=payload, timeout=10)
-        
         if response.status_code == 200:
-            print("✅ Telegram SUCESSO: Mensagem entregue.")
-        else:
-            # Se der erro, mostra o porquê
-            print(f"⛔ Telegram REJEITOU (Erro {response.status_code}): {response.text}")
-            
-    except Exception as e:
-        print(f"⚠️ ERRO DE CONEXÃO (Exception): {e}")
+            now = time.monotonic()
+            for enqueued in m.enqueued:
+                metrics.observe('sniper_notify_delivery_seconds', now - enqueued, priority=str(m.priority))
+            metrics.inc('sniper_notify_messages_total', result='sent', priority=str(m.priority))
+            if media_key and not file_id: self._remember_photo(token, media_key, response)
+            return None
+        if response.status_code == 429:
+            try: retry_after = float(response.json().get('parameters', {}).get('retry_after', 5))
+            except ValueError: retry_after = 5.0
+            until = time.monotonic() + retry_after
+            with self._cond: self._bucket(m.chat_id).pause(until)
+            metrics.inc('sniper_notify_rate_limited_total')
+            print(f"⏳ Telegram limitou o chat {m.chat_id}: aguardando {retry_after:.0f}s")
+            return until if m.attempts < MAX_ATTEMPTS else self._give_up(m, response)
+        if response.status_code >= 500:
+            return self._backoff(m)
+        if file_id and response.status_code == 400:
+            # file_id recusado (expirou / outro bot): esquece e reenvia já pela URL
+            media_cache.forget(token, media_key)
+            metrics.inc('sniper_notify_media_total', result='stale')
+            print(f"♻️ file_id de {media_key} recusado pelo Telegram: reenviando pela URL")
+            return time.monotonic() if m.attempts < MAX_ATTEMPTS else self._give_up(m, response)
+        # Se der erro, mostra o porquê (4xx não adianta repetir)
+        return self._give_up(m, response)
+
+    @staticmethod
+    def _remember_photo(token, media_key, response):
+        """Guarda o file_id da maior versão da foto que o Telegram acabou de receber."""
+        try:
+            sizes = response.json()['result']['photo']
+            media_cache.put(token, media_key, max(sizes, key=lambda p: p.get('file_size', 0))['file_id'])
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"⚠️ Resposta do sendPhoto sem file_id: {e}")
+
+    def _backoff(self, m):
+        if m.attempts >= MAX_ATTEMPTS: return self._give_up(m)
+        metrics.inc('sniper_notify_messages_total', result='retried', priority=str(m.priority))
+        return time.monotonic() + min(2 ** m.attempts, 60)
+
+    def _give_up(self, m, response=None):
+        detail = f"Erro {response.status_code}: {response.text}" if response is not None else f"{m.attempts + 1} tentativas"
+        print(f"⛔ Telegram REJEITOU ({detail})")
+        metrics.inc('sniper_notify_messages_total', result='failed', priority=str(m.priority))
+        return None
 
-def send_telegram_msg(chat_id, message, image_url=None):
+    @property
+    def queue_depth(self):
+        return len(self._queue)
+
+
+media_cache = MediaCache()
+dispatcher = NotificationDispatcher()
+
+metrics.describe("sniper_notify_delivery_seconds", "histogram", "Tempo entre enfileirar e o Telegram confirmar a notificação")
+metrics.describe("sniper_notify_messages_total", "counter", "Notificações por resultado (sent, retried, coalesced, dropped, failed)")
+metrics.describe("sniper_notify_media_total", "counter", "Envios de imagem por resultado do cache de file_id (hit, miss, stale)")
+metrics.describe("sniper_notify_rate_limited_total", "counter", "Respostas 429 do Telegram")
+metrics.describe("sniper_notify_queue_depth", "gauge", "Notificações aguardando envio")
+metrics.gauge_callback("sniper_notify_queue_depth", lambda: dispatcher.queue_depth)
+
+def send_telegram_msg(chat_id, message, image_url=None, priority=PRIORITY_NORMAL):
     if not chat_id: 
         print("❌ Erro: Chat ID não fornecido para notificação.")
         return False, "Chat ID Ausente"
 
-    t = threading.Thread(target=_telegram_worker, args=(chat_id, message, image_url))
-    t.daemon = True
-    t.start()
+    if not dispatcher.submit(chat_id, message, image_url, priority):
+        return False, "Fila de notificações cheia"
     return True, "Enviado"
 
 # --- NOTIFICAÇÕES (Chat ID agora é Obrigatório) ---
@@ -101,13 +399,13 @@ def notify_environment_change(is_testnet, chat_id):
 def notify_entry(symbol, price, invested, balance, trigger, tp, sl, is_live, chat_id):
     env = "LIVE 🔴" if is_live else "DEMO 🛡️"
     msg = (f"🎯 *ENTRADA* | {env}\n▬▬▬▬▬▬▬▬▬▬▬▬▬▬▬▬▬\n💎 *{symbol}*\n💵 `{format_currency(price)}`\n💰 Margem: `{format_currency(invested)}`\n▬▬▬▬▬▬▬▬▬▬▬▬▬▬▬▬▬\n⚡ {trigger}\n📈 TP: `{format_currency(tp)}`\n🛡️ SL: `{format_currency(sl)}`")
-    send_telegram_msg(chat_id, msg, image_url=IMAGENS["ENTRY"])
+    send_telegram_msg(chat_id, msg, image_url=IMAGENS["ENTRY"], priority=PRIORITY_CRITICAL)
 
 def notify_exit(symbol, exit_price, profit, profit_pct, reason, new_balance, is_live, chat_id):
     header = "✅ GAIN" if profit > 0 else "🔻 LOSS"
     img = IMAGENS["WIN"] if profit > 0 else IMAGENS["LOSS"]
     msg = (f"{header}\n▬▬▬▬▬▬▬▬▬▬▬▬▬▬▬▬▬\n💎 *{symbol}*\n🚪 Saída: `{format_currency(exit_price)}`\n⚖️ {reason}\n▬▬▬▬▬▬▬▬▬▬▬▬▬▬▬▬▬\n📊 *{format_currency(profit)}* ({profit_pct:.2f}%)")
-    send_telegram_msg(chat_id, msg, image_url=img)
+    send_telegram_msg(chat_id, msg, image_url=img, priority=PRIORITY_CRITICAL)
 
 def notify_backtest_report(chat_id, symbol, timeframe, days, stats):
     """Envia relatório consolidado do Backtest"""
@@ -131,4 +429,4 @@ def notify_backtest_report(chat_id, symbol, timeframe, days, stats):
         f"Oportunidades Filtradas: {stats['ignored']}\n"
     )
     # Usa a imagem de SUMMARY ou BACKTEST se tiver
-    return send_telegram_msg(chat_id, msg, image_url=IMAGENS.get("SUMMARY"))
\ No newline at end of file
+    return send_telegram_msg(chat_id, msg, image_url=IMAGENS.get("SUMMARY"), priority=PRIORITY_LOW)
\ No newline at end of file
@@ -0,0 +1,162 @@
+import os
+import threading
+import time
+import numpy as np
+
+ARCHIVE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'ohlcv')
+
+# Registro de largura fixa (48 bytes): cada coluna é uma view sem cópia sobre o memmap
+RECORD_DTYPE = np.dtype([
+    ('timestamp', '<i8'), ('open', '<f8'), ('high', '<f8'),
+    ('low', '<f8'), ('close', '<f8'), ('volume', '<f8')
+])
+
+class OHLCVArchive:
+    """
+    Arquivo local de OHLCV: um arquivo binário por (symbol, timeframe), só com candles FECHADOS.
+
+    Leitura via np.memmap (somente leitura): vários backtests simultâneos compartilham
+    as mesmas páginas do cache do SO em vez de cada um manter sua cópia.
+    Só os trechos que faltam (antes do primeiro ou depois do último candle) são baixados.
+    """
+    def __init__(self, root=ARCHIVE_DIR):
+        self.root = root
+        self._locks = {}
+        self._maps = {}  # path -> (versão do arquivo, memmap)
+        self._lock = threading.Lock()
+
+    def path_for(self, symbol, timeframe):
+        return os.path.join(self.root, f"{symbol.replace('/', '_')}_{timeframe}.bin")
+
+    def _key_lock(self, path):
+        with self._lock:
+            return self._locks.setdefault(path, threading.Lock())
+
+    def load(self, symbol, timeframe):
+        """Retorna o arquivo inteiro como array estruturado (memmap read-only, zero-copy)."""
+        path = self.path_for(symbol, timeframe)
+        try: st = os.stat(path)
+        except OSError: return np.empty(0, dtype=RECORD_DTYPE)
+
+        # Ignora um registro parcial no fim (ex: queda durante um append)
+        count = st.st_size // RECORD_DTYPE.itemsize
+        if count == 0: return np.empty(0, dtype=RECORD_DTYPE)
+
+        version = (st.st_ino, st.st_size, st.st_mtime_ns)
+        with self._lock:
+            cached = self._maps.get(path)
+            if cached and cached[0] == version: return cached[1]
+            mm = np.memmap(path, dtype=RECORD_DTYPE, mode='r', shape=(count,))
+            self._maps[path] = (version, mm)
+            return mm
+
+    @staticmethod
+    def _to_records(candles):
+        recs = np.empty(len(candles), dtype=RECORD_DTYPE)
+        if len(candles):
+            arr = np.asarray(candles, dtype=np.float64)
+            recs['timestamp'] = arr[:, 0].astype(np.int64)
+            for i, col in enumerate(('open', 'high', 'low', 'close', 'volume'), start=1):
+                recs[col] = arr[:, i]
+        return recs
+
+    def write(self, symbol, timeframe, candles):
+        """
+        Grava candles fechados e retorna True se o arquivo foi atualizado.
+        Dados mais novos que o último registro vão por append; qualquer outro caso
+        (ex: histórico mais antigo) reescreve o arquivo de forma atômica.
+        """
+        if not candles: return True
+        path = self.path_for(symbol, timeframe)
+        new = self._to_records(candles)
+
+        try:
+            os.makedirs(self.root, exist_ok=True)
+            with self._key_lock(path):
+                current = self.load(symbol, timeframe)
+                if len(current) and new['timestamp'][0] > current['timestamp'][-1]:
+                    with open(path, 'r+b') as f:
+                        valid_size = len(current) * RECORD_DTYPE.itemsize
+                        # Descarta eventual registro parcial antes de anexar
+                        if os.fstat(f.fileno()).st_size != valid_size: f.truncate(valid_size)
+                        f.seek(valid_size)
+                        f.write(new.tobytes())
+                    return True
+
+                merged = np.concatenate([np.asarray(current), new]) if len(current) else new
+                # np.unique ordena; no array invertido a primeira ocorrência é a mais nova (new vence)
+                _, idx = np.unique(merged['timestamp'][::-1], return_index=True)
+                merged = merged[::-1][idx]
+                tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+                with open(tmp, 'wb') as f:
+                    f.write(merged.tobytes())
+                    f.flush(); os.fsync(f.fileno())
+                try:
+                    # Leitores com memmap aberto continuam vendo o arquivo antigo até recarregar
+                    os.replace(tmp, path)
+                except OSError:
+                    # Windows não deixa substituir arquivo mapeado por outro job: fica para a próxima
+                    os.remove(tmp)
+                    return False
+            return True
+        except OSError as e:
+            print(f"⚠️ Erro ao gravar arquivo OHLCV {path}: {e}")
+            return False
+
+    @staticmethod
+    def download(exchange, symbol, timeframe, since, until):
+        """Baixa candles no intervalo [since, until) com paginação (limite 1000 da Binance)."""
+        all_ohlcv = []
+        while since < until:
+            ohlcv = exchange.fetch_ohlcv(symbol, timeframe, since=since, limit=1000)
+            if not ohlcv: break
+
+            # Evita duplicatas na paginação
+            if all_ohlcv and ohlcv[0][0] == all_ohlcv[-1][0]:
+                ohlcv = ohlcv[1:]
+                if not ohlcv: break
+
+            all_ohlcv.extend(ohlcv)
+
+            # Avança o cursor de tempo
+            since = ohlcv[-1][0] + 1
+
+            # Menos que o limite: chegamos ao fim do que a exchange tem
+            if len(ohlcv) < 1000:
+                time.sleep(0.1)
+                break
+        return [c for c in all_ohlcv if c[0] < until]
+
+    def sync(self, exchange, symbol, timeframe, since, now, ms_per_candle):
+        """
+        Garante o arquivo cobrindo [since, now) e devolve (registros fechados, candles em formação).
+        Só baixa o buraco antes do primeiro registro e o trecho após o último.
+        """
+        data = self.load(symbol, timeframe)
+        closed_until = now - ms_per_candle  # Candles com ts <= closed_until já fecharam
+
+        if len(data) == 0 or since < int(data['timestamp'][0]):
+            head_until = int(data['timestamp'][0]) if len(data) else now
+            head = [c for c in self.download(exchange, symbol, timeframe, since, head_until) if c[0] <= closed_until]
+            if not self.write(symbol, timeframe, head):
+                # Sem persistência (arquivo em uso): segue com a cópia em memória
+                data = np.concatenate([self._to_records(head), np.asarray(data)])
+            else:
+                data = self.load(symbol, timeframe)
+
+        tail_since = int(data['timestamp'][-1]) + ms_per_candle if len(data) else since
+        tail = self.download(exchange, symbol, timeframe, tail_since, now + 1)
+        closed_tail = [c for c in tail if c[0] <= closed_until]
+        forming = [c for c in tail if c[0] > closed_until]
+        if not self.write(symbol, timeframe, closed_tail):
+            data = np.concatenate([np.asarray(data), self._to_records(closed_tail)])
+        else:
+            data = self.load(symbol, timeframe)
+
+        ts = data['timestamp']
+        lo = np.searchsorted(ts, since, side='left')
+        hi = np.searchsorted(ts, now, side='left')
+        return data[lo:hi], forming
+
+# Instância global
+ohlcv_archive = OHLCVArchive()
@@ -1,11 +1,14 @@
 import time
+import threading
+from collections import deque
 from datetime import datetime
 import pytz 
 from database import db, BotState, Trade
-from notification import notify_entry, notify_exit, send_telegram_msg
+from notification import notify_entry, notify_exit, send_telegram_msg, PRIORITY_CRITICAL
 from strategy import check_entry_strategy
-from market_data import get_bitcoin_health
+from market_data import get_bitcoin_health, format_timestamp
 from logger import log_exec, log_error, log_trade_decision
+from trade_history import TradeHistory
 
 # --- GESTÃO DE RISCO INSTITUCIONAL ---
 DAILY_LOSS_LIMIT_PCT = -3.0
@@ -21,6 +24,10 @@ ASSET_PARAMS = {
     "PEPE/USDT": { "rsi_buy": 24, "stop_atr_mult": 2.2, "tp_risk_mult": 4.0 },
 }
 
+def build_entry_row(current_price, current_open, rsi, bb_lower, bb_upper, fibo_high, fibo_low, is_bullish, atr_value):
+    """Linha no formato do check_entry_strategy (a tendência H1 chega via ema200 sintética)."""
+    return {'close': current_price, 'open': current_open, 'rsi': rsi, 'ema200': current_price if is_bullish else current_price*1.01, 'atr': atr_value, 'bb_lower': bb_lower, 'bb_upper': bb_upper, 'fibo_high': fibo_high, 'fibo_low': fibo_low}
+
 def get_br_time_obj():
     tz = pytz.timezone('America/Sao_Paulo')
     return datetime.now(tz)
@@ -51,6 +58,15 @@ class PaperTrader:
         self.last_exit_time = 0 
         self.last_traded_symbol = ""
 
+        # Efeitos colaterais (banco, Telegram) gerados pelas transições de estado: o chamador
+        # executa flush_effects() DEPOIS de soltar o TRADING_LOCK (nenhum I/O na seção crítica)
+        self._outbox = deque()
+        self._flush_lock = threading.Lock()
+        self.journal = None # StateJournal (write-behind); sem ele, save_state grava direto no SQLite
+        self.history = TradeHistory() # Últimos trades + agregados em memória (sem SQLite no polling)
+        self.stats = None # StatsManager global (estatísticas de todas as sessões), opcional
+        self._publish_snapshot()
+
     def load_state(self):
         try:
             state = BotState.query.first()
@@ -63,30 +79,90 @@ class PaperTrader:
                     position_json=None
                 )
                 db.session.add(state); db.session.commit()
+
+            # Journal: estado mais novo que o último checkpoint no SQLite (replay após crash)
+            pending = self.journal.recover() if self.journal else None
+            if pending:
+                for field, value in pending.items(): setattr(state, field, value)
             
             if self.is_testnet: self.balance = state.balance
             self.accumulated_pnl = state.accumulated_pnl
             self.daily_start_balance = state.daily_start_balance
             self.current_day = state.current_day
             self.position = state.position_json 
+            self.history.load()
             
         except Exception as e:
             log_error.error(f"Erro critical DB Load: {e}")
+        self._publish_snapshot()
+
+    def _publish_snapshot(self):
+        """
+        Cópia imutável do estado para leitores (/market, stream, worker) sem TRADING_LOCK.
+        Substituída por inteiro a cada transição: quem leu a anterior nunca vê meio-estado.
+        """
+        self.snapshot = {
+            "balance": self.balance, "accumulated_pnl": self.accumulated_pnl,
+            "position": dict(self.position) if self.position else None,
+        }
+
+    def _defer(self, fn, *args):
+        self._outbox.append((fn, args))
+
+    def flush_effects(self):
+        """Executa o I/O pendente, na ordem em que foi gerado. Chamar FORA do TRADING_LOCK."""
+        with self._flush_lock:
+            while self._outbox:
+                fn, args = self._outbox.popleft()
+                try: fn(*args)
+                except Exception as e: log_error.error(f"Erro efeito pendente ({getattr(fn, '__name__', fn)}): {e}")
+
+    def attach_journal(self, journal):
+        self.journal = journal
+
+    def attach_stats(self, stats):
+        self.stats = stats
 
     def save_state(self):
+        """
+        Publica o snapshot e registra o estado atual. Com journal: append em memória (µs) e
+        flush_effects() espera o fsync em lote; o SQLite recebe checkpoints em segundo plano.
+        """
+        self._publish_snapshot()
+        record = {
+            "balance": self.balance, "accumulated_pnl": self.accumulated_pnl,
+            "daily_start_balance": self.daily_start_balance, "current_day": self.current_day,
+            "position_json": dict(self.position) if self.position else None, "last_update": get_br_time_str(),
+        }
+        if self.journal: self._defer(self.journal.wait, self.journal.append(record))
+        else: self._defer(self.write_state, record)
+
+    @staticmethod
+    def write_state(record):
+        """Grava um registro de estado no BotState (checkpoint do journal ou gravação direta)."""
         try:
             state = BotState.query.first()
             if state:
-                state.balance = self.balance
-                state.accumulated_pnl = self.accumulated_pnl
-                state.daily_start_balance = self.daily_start_balance
-                state.current_day = self.current_day
-                state.position_json = self.position
-                state.last_update = get_br_time_str()
+                for field, value in record.items(): setattr(state, field, value)
                 db.session.commit()
         except Exception as e:
             db.session.rollback()
             log_error.error(f"Erro critical DB Save: {e}")
+            raise # O journal não pode descartar um registro que não chegou ao SQLite
+
+    @staticmethod
+    def _write_trade(fields):
+        try:
+            db.session.add(Trade(**fields)); db.session.commit() # id já atribuído pelo TradeHistory
+        except Exception as e:
+            db.session.rollback()
+            log_error.error(f"Erro ao gravar trade: {e}")
+
+    @staticmethod
+    def _clear_trades():
+        try:
+            db.session.query(Trade).delete(); db.session.commit()
+        except Exception: db.session.rollback()
   
     def set_chat_id(self, chat_id):
         self.telegram_chat_id = chat_id
@@ -131,10 +207,23 @@ class PaperTrader:
         self.daily_start_balance = new_balance
         self.accumulated_pnl = 0.0
         self.position = None
-        try:
-            db.session.query(Trade).delete(); self.save_state()
-            log_exec.info(f"♻️ BANCA RESETADA: ${new_balance}")
-        except: db.session.rollback()
+        self.history.reset()
+        self._defer(self._clear_trades); self.save_state()
+        log_exec.info(f"♻️ BANCA RESETADA: ${new_balance}")
+
+    def apply_real_fill(self, entry_price, amount, balance):
+        """Ajusta a posição simulada ao preço/quantidade reais da Binance."""
+        if not self.position: return
+        self.position['entry_price'] = entry_price
+        self.position['amount'] = amount
+        self.balance = balance
+        self.save_state()
+
+    def revert_entry(self, invested):
+        """Compra real falhou: desfaz a posição simulada e devolve o valor à banca."""
+        self.position = None
+        self.balance += invested
+        self.save_state()
 
     def calculate_position_size(self):
         target = self.balance * self.risk_percentage
@@ -170,7 +259,7 @@ class PaperTrader:
         
         log_msg = f"{trigger_name} | Taxa: ${entry_fee_cost:.2f}"
         log_trade_decision(symbol, "COMPRA", log_msg, {})
-        notify_entry(symbol, price, invested, self.balance, log_msg, tp, sl, not self.is_testnet, self.telegram_chat_id)
+        self._defer(notify_entry, symbol, price, invested, self.balance, log_msg, tp, sl, not self.is_testnet, self.telegram_chat_id)
         return "COMPRA EXECUTADA"
 
     def execute_manual_trade(self, side, current_price, symbol):
@@ -194,7 +283,11 @@ class PaperTrader:
         msg = self.close_position(current_price, "VENDA MANUAL", get_br_time_str())
         return {"success": True, "message": msg}
 
-    def update(self, current_price, current_open, rsi, bb_lower, bb_upper, fibo_high, fibo_low, timestamp, is_bullish, symbol, atr_value, ema_slope=0):
+    def update(self, current_price, current_open, rsi, bb_lower, bb_upper, fibo_high, fibo_low, timestamp, is_bullish, symbol, atr_value, ema_slope=0, btc_status=None):
+        """
+        Transição de estado do tick (só memória). `btc_status` deve vir calculado pelo chamador,
+        fora do TRADING_LOCK; o I/O gerado fica pendente para flush_effects().
+        """
         is_broken, daily_pct = self.check_circuit_breaker()
         if is_broken and not self.position: return f"BLOQUEIO: Perda Diária {daily_pct:.2f}%"
 
@@ -242,18 +335,20 @@ class PaperTrader:
             atr_safe = atr_value if atr_value else (entry * 0.01)
             if current_price > entry + (atr_safe * 1.0):
                 new_sl = current_price - (atr_safe * params['stop_atr_mult'])
-                if new_sl > sl: self.position['sl_price'] = new_sl
+                if new_sl > sl:
+                    self.position['sl_price'] = new_sl
+                    self._publish_snapshot()
             return None
 
         # --- SCANNER DE ENTRADA ---
         time_since_exit = time.time() - self.last_exit_time
         if symbol == self.last_traded_symbol and time_since_exit < COOLDOWN_SECONDS: return None
 
-        btc_status, _ = get_bitcoin_health()
+        if btc_status is None: btc_status, _ = get_bitcoin_health() # Compatibilidade: chamador sem regime pronto
         curr_btc_stat = btc_status if symbol != "BTC/USDT" else "BULL"
         prev_rsi_val = self.prev_rsi_memory.get(symbol, 50.0)
         
-        row = {'close': current_price, 'open': current_open, 'rsi': rsi, 'ema200': current_price if is_bullish else current_price*1.01, 'atr': atr_value, 'bb_lower': bb_lower, 'bb_upper': bb_upper, 'fibo_high': fibo_high, 'fibo_low': fibo_low}
+        row = build_entry_row(current_price, current_open, rsi, bb_lower, bb_upper, fibo_high, fibo_low, is_bullish, atr_value)
         
         should_buy, trigger, meta = check_entry_strategy(row, {'rsi': prev_rsi_val}, params, btc_status=curr_btc_stat, ignore_trend=not is_bullish)
         self.prev_rsi_memory[symbol] = rsi 
@@ -268,6 +363,8 @@ class PaperTrader:
     # --- SIMULAÇÃO DE VENDA COM TAXA DE SAÍDA ---
     def close_position(self, price, reason, ts_str):
         if not self.position: return None
+        # Saída pelo loop chega com o timestamp do candle (epoch ms): formatado só aqui, para o banco
+        if isinstance(ts_str, (int, float)): ts_str = format_timestamp(ts_str)
         
         amt = self.position['amount']
         inv = self.position['invested_value'] # Valor Bruto investido inicialmente
@@ -296,18 +393,18 @@ class PaperTrader:
                 self.cooldown_until = time.time() + (4 * 3600)
                 msg = "❄️ MODO INVERNO: 3 Stops. Pausa de 4h."
                 log_exec.warning(msg)
-                if self.telegram_chat_id: send_telegram_msg(self.telegram_chat_id, msg)
+                if self.telegram_chat_id: self._defer(send_telegram_msg, self.telegram_chat_id, msg, None, PRIORITY_CRITICAL)
                 self.consecutive_losses = 0
 
-        # Salva Trade
-        try:
-            db.session.add(Trade(exit_time=str(ts_str), symbol=symbol, side="LONG", invested=inv, profit_usd=profit, profit_pct=pct, result="WIN" if profit>0 else "LOSS", reason=reason))
-        except: pass
+        # Salva Trade (gravação pendente, fora da seção crítica)
+        trade = self.history.record(dict(exit_time=str(ts_str), symbol=symbol, side="LONG", invested=inv, profit_usd=profit, profit_pct=pct, result="WIN" if profit>0 else "LOSS", reason=reason))
+        self._defer(self._write_trade, trade)
+        if self.stats: self.stats.update_trades(profit) # Só memória; o log é gravado em lote por outro thread
 
         self.last_exit_time = time.time(); self.last_traded_symbol = symbol; self.position = None
         self.save_state()
         
-        notify_exit(symbol, price, profit, pct, reason, self.balance, not self.is_testnet, self.telegram_chat_id)
+        self._defer(notify_exit, symbol, price, profit, pct, reason, self.balance, not self.is_testnet, self.telegram_chat_id)
         return f"VENDA ({reason})"
 
     def panic_sell(self, price):
@@ -315,8 +412,8 @@ class PaperTrader:
         return self.close_position(price, "PÂNICO MANUAL", get_br_time_str())
 
     def get_status(self):
-        trades_db = Trade.query.order_by(Trade.id.desc()).limit(50).all()
-        trades = [{"id":t.id, "exit_time":t.exit_time, "symbol":t.symbol, "side":t.side, "invested":t.invested, "profit_usd":t.profit_usd, "profit_pct":t.profit_pct, "result":t.result, "reason":t.reason} for t in trades_db]
-        wins = sum(1 for t in trades_db if t.profit_usd > 0)
-        total = len(trades_db)
-        return {"balance": self.balance, "accumulated_pnl": self.accumulated_pnl, "position_details": self.position, "trades": trades, "wins": wins, "losses": total-wins, "win_rate": (wins/total*100) if total else 0}
\ No newline at end of file
+        """Estado para o dashboard: snapshot do trader + visão em memória do histórico (sem consulta ao banco)."""
+        snap = self.snapshot
+        trades, agg = self.history.view
+        return {"balance": snap["balance"], "accumulated_pnl": snap["accumulated_pnl"], "position_details": snap["position"], "trades": trades,
+                "wins": agg["wins"], "losses": agg["losses"], "win_rate": agg["win_rate"], "aggregates": agg}
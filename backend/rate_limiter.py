@@ -0,0 +1,168 @@
+import heapq
+import itertools
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+import ccxt
+from metrics import metrics, instrument_exchange
+
+# Classes de prioridade (menor = atendida primeiro)
+PRIORITY_LIVE = 0       # Loop ao vivo, ordens e saldo da conta
+PRIORITY_DASHBOARD = 1  # Scanner e dados exibidos no dashboard
+PRIORITY_BACKTEST = 2   # Downloads de histórico
+
+# Binance: 6000 de peso por minuto por IP. O `cost` que o ccxt passa ao throttle NÃO é o peso:
+# é relativo ao rateLimit da instância (binance: 50ms) e vale peso/5 (ex: klines spot 0.4 = peso 2,
+# /account 4 = peso 20). cost_to_weight converte.
+BINANCE_WEIGHT_PER_MINUTE = 6000
+SAFETY_MARGIN = 0.8  # Folga para requisições fora do nosso controle (outro processo, relógio)
+
+_local = threading.local()
+
+@contextmanager
+def request_priority(priority):
+    """Define a prioridade das chamadas à exchange feitas por este thread dentro do bloco."""
+    previous = getattr(_local, 'priority', None)
+    _local.priority = priority
+    try: yield
+    finally: _local.priority = previous
+
+
+class WeightScheduler:
+    """
+    Orçamento de peso da Binance compartilhado por TODAS as instâncias ccxt do processo.
+
+    Janela deslizante de 60s (mais rígida que a janela fixa da Binance: nunca estoura o limite).
+    Quando falta peso, as requisições esperam numa fila de prioridade: a mais prioritária
+    (e, empatando, a mais antiga) é sempre a próxima a sair.
+    """
+    def __init__(self, limit_per_minute=BINANCE_WEIGHT_PER_MINUTE, safety=SAFETY_MARGIN, window=60.0):
+        self.capacity = limit_per_minute * safety
+        self.window = window
+        self._spent = deque()  # (timestamp, peso) dentro da janela
+        self._used = 0.0
+        self._waiters = []     # heap de (prioridade, seq)
+        self._seq = itertools.count()
+        self._paused_until = 0.0
+        self._cond = threading.Condition()
+
+    def _expire(self, now):
+        while self._spent and now - self._spent[0][0] >= self.window:
+            self._used -= self._spent.popleft()[1]
+
+    def _wait_time(self, weight, now):
+        """Segundos até liberar `weight` (as entradas mais antigas vão saindo da janela)."""
+        if now < self._paused_until: return self._paused_until - now
+        excess = self._used + weight - self.capacity
+        for ts, w in self._spent:
+            excess -= w
+            if excess <= 0: return max(ts + self.window - now, 0.001)
+        return 0.001
+
+    def acquire(self, weight, priority=PRIORITY_LIVE):
+        weight = min(float(weight or 1), self.capacity)  # Requisição maior que o orçamento: espera a janela esvaziar
+        start = time.perf_counter()
+        with self._cond:
+            ticket = (priority, next(self._seq))
+            heapq.heappush(self._waiters, ticket)
+            try:
+                while True:
+                    now = time.time()
+                    self._expire(now)
+                    if self._waiters[0] == ticket and now >= self._paused_until and self._used + weight <= self.capacity:
+                        self._spent.append((now, weight))
+                        self._used += weight
+                        return
+                    timeout = self._wait_time(weight, now) if self._waiters[0] == ticket else None
+                    self._cond.wait(timeout)
+            finally:
+                self._waiters.remove(ticket)
+                heapq.heapify(self._waiters)
+                self._cond.notify_all()
+                metrics.observe('sniper_ratelimit_wait_seconds', time.perf_counter() - start, priority=str(priority))
+
+    def sync(self, used_weight):
+        """Alinha com o peso que a Binance informa (X-MBX-USED-WEIGHT-1M) quando ele é maior que o nosso."""
+        with self._cond:
+            now = time.time()
+            self._expire(now)
+            if used_weight > self._used:
+                self._spent.append((now, used_weight - self._used))
+                self._used = float(used_weight)
+
+    def pause(self, seconds):
+        """Bloqueia todas as requisições (HTTP 429/418 com Retry-After)."""
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.time() + seconds)
+            self._cond.notify_all()
+
+    @property
+    def queue_depth(self):
+        return len(self._waiters)
+
+    @property
+    def used_weight(self):
+        with self._cond:
+            self._expire(time.time())
+            return self._used
+
+
+def _header(headers, name):
+    if not headers: return None
+    for k, v in headers.items():
+        if k.lower() == name: return v
+    return None
+
+
+class ScheduledBinance(ccxt.binance):
+    """ccxt.binance cujo throttle passa pelo WeightScheduler global em vez do limitador próprio da instância."""
+    def __init__(self, config=None, scheduler=None, priority=PRIORITY_LIVE):
+        super().__init__(config or {})
+        self.scheduler = scheduler or weight_scheduler
+        self.default_priority = priority
+
+    def cost_to_weight(self, cost):
+        """
+        Peso da Binance de uma chamada. No ccxt, cost 1 = `rateLimit` ms de espaçamento; a 6000 de peso/min,
+        cada unidade de peso vale 10ms. Binance (rateLimit 50): peso = cost x 5.
+        """
+        return float(cost or 1) * self.rateLimit * BINANCE_WEIGHT_PER_MINUTE / 60000
+
+    def throttle(self, cost=None):
+        priority = getattr(_local, 'priority', None)
+        self.scheduler.acquire(self.cost_to_weight(cost), self.default_priority if priority is None else priority)
+
+    def fetch(self, url, method='GET', headers=None, body=None):
+        try:
+            return super().fetch(url, method, headers, body)
+        except ccxt.DDoSProtection:
+            # 429 (limite) / 418 (ban): respeita o Retry-After para todo o processo
+            retry_after = _header(self.last_response_headers, 'retry-after')
+            self.scheduler.pause(float(retry_after) if retry_after else 60)
+            raise
+        finally:
+            used = _header(self.last_response_headers, 'x-mbx-used-weight-1m')
+            if used:
+                try: self.scheduler.sync(float(used))
+                except ValueError: pass
+
+
+def create_exchange(config=None, priority=PRIORITY_LIVE, client='market'):
+    """
+    Única forma de criar conexões com a Binance no sistema: todas dividem o mesmo orçamento de peso.
+    `client` identifica a instância nas métricas.
+    """
+    settings = {'options': {'defaultType': 'spot'}}
+    settings.update(config or {})
+    settings['enableRateLimit'] = True  # Sem isso o ccxt não chama o throttle
+    return instrument_exchange(ScheduledBinance(settings, priority=priority), client)
+
+
+# Instância global
+weight_scheduler = WeightScheduler()
+metrics.describe("sniper_ratelimit_queue_depth", "gauge", "Requisicoes aguardando peso da Binance")
+metrics.describe("sniper_ratelimit_used_weight", "gauge", "Peso usado na janela de 60s")
+metrics.describe("sniper_ratelimit_wait_seconds", "histogram", "Espera por peso antes de cada requisicao")
+metrics.gauge_callback("sniper_ratelimit_queue_depth", lambda: weight_scheduler.queue_depth)
+metrics.gauge_callback("sniper_ratelimit_used_weight", lambda: weight_scheduler.used_weight)
@@ -0,0 +1,74 @@
+import time
+import numpy as np
+from concurrent.futures import ThreadPoolExecutor
+from logger import log_error
+
+# Pesos da triagem: distância da banda inferior é ~10x menor que a distância do RSI
+BAND_WEIGHT = 10.0
+TREND_PENALTY = 0.25  # Abaixo da EMA200 não elimina (a estratégia pode ignorar tendência), só rebaixa
+
+def screen_candidates(close, rsi, bb_lower, ema200, rsi_buy, top_k=5):
+    """
+    Triagem vetorizada de todos os ativos de uma vez (arrays alinhados, um item por ativo).
+    Score menor = mais perto de um gatilho de compra:
+    - distância relativa do RSI até o rsi_buy do ativo (0 = já na zona)
+    - distância relativa do preço até a banda inferior (0 = tocando/abaixo)
+    - penalidade fixa quando o preço está abaixo da EMA200
+    Retorna [(índice, score)] dos `top_k` melhores, ordenados. Ativos com NaN ficam de fora.
+    """
+    close, rsi, bb_lower, ema200, rsi_buy = (np.asarray(a, dtype=np.float64) for a in (close, rsi, bb_lower, ema200, rsi_buy))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        rsi_gap = np.maximum(rsi - rsi_buy, 0.0) / rsi_buy
+        band_gap = np.maximum(close - bb_lower, 0.0) / close
+        score = rsi_gap + band_gap * BAND_WEIGHT + np.where(close > ema200, 0.0, TREND_PENALTY)
+    score[~np.isfinite(score)] = np.inf
+
+    valid = np.flatnonzero(np.isfinite(score))
+    if len(valid) == 0: return []
+    k = min(top_k, len(valid))
+    best = valid[np.argpartition(score[valid], k - 1)[:k]]
+    best = best[np.argsort(score[best], kind='stable')]
+    return [(int(i), float(score[i])) for i in best]
+
+
+class MarketScanner:
+    """
+    Scanner em duas fases:
+    1. `snapshot(symbol)` -> dict com close/rsi/bb_lower/ema200 (ou None), coletado em paralelo,
+       e triagem vetorizada de todos os ativos;
+    2. `evaluate(symbol)` -> (should_buy, trigger, meta) apenas para os `top_k` melhores, também no pool.
+    """
+    def __init__(self, snapshot, evaluate, params_for, top_k=5, max_workers=8):
+        self.snapshot = snapshot
+        self.evaluate = evaluate
+        self.params_for = params_for
+        self.top_k = top_k
+        self._pool = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="scanner")
+
+    def _safe(self, fn, symbol):
+        try: return fn(symbol)
+        except Exception as e:
+            log_error.error(f"Erro scanner {symbol}: {e}")
+            return None
+
+    def scan(self, symbols):
+        """Retorna {"candidates": [...], "screened": n, "elapsed": s} com os candidatos já avaliados."""
+        start = time.perf_counter()
+        snaps = list(self._pool.map(lambda s: self._safe(self.snapshot, s), symbols))
+        rows = [(sym, snap) for sym, snap in zip(symbols, snaps) if snap]
+
+        ranked = screen_candidates(
+            [r['close'] for _, r in rows], [r['rsi'] for _, r in rows],
+            [r['bb_lower'] for _, r in rows], [r['ema200'] for _, r in rows],
+            [self.params_for(sym)['rsi_buy'] for sym, _ in rows], self.top_k
+        ) if rows else []
+
+        top = [rows[i][0] for i, _ in ranked]
+        verdicts = list(self._pool.map(lambda s: self._safe(self.evaluate, s), top))
+
+        candidates = []
+        for (i, score), verdict in zip(ranked, verdicts):
+            sym, snap = rows[i]
+            should_buy, trigger, _ = verdict if verdict else (False, None, None)
+            candidates.append({"symbol": sym, "score": round(score, 4), "rsi": snap['rsi'], "signal": bool(should_buy), "trigger": trigger if should_buy else None})
+        return {"candidates": candidates, "screened": len(rows), "elapsed": time.perf_counter() - start}
@@ -1,7 +1,7 @@
-from flask import Flask, jsonify, request, send_from_directory
+from flask import Flask, jsonify, request, send_from_directory, Response, stream_with_context
 from flask_cors import CORS
 from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity
-from notification import notify_bot_state, notify_config_saved, notify_environment_change, notify_connection_test, send_telegram_msg, setup_notification_system
+from notification import notify_bot_state, notify_config_saved, notify_environment_change, notify_connection_test, send_telegram_msg, setup_notification_system, PRIORITY_CRITICAL
 from flask_limiter import Limiter
 from flask_limiter.util import get_remote_address
 from dotenv import load_dotenv
@@ -9,15 +9,28 @@ from logger import log_exec, log_error
 from flask_jwt_extended import verify_jwt_in_request
 from execution import ExecutionManager 
 from backtester import BacktesterEngine
+from job_scheduler import JobScheduler, PRIORITY_HIGH, PRIORITY_NORMAL, PRIORITY_LOW
+from state_journal import StateJournal
+from market_stream import MarketStreamHub, format_sse_data, candle_delta
+from market_snapshot import SnapshotStore, encode_json
+from columnar import COLUMNAR_MIME, wants_columnar, to_columns, to_rows, is_columnar
+from equity_curve import EquityCurve, DEFAULT_POINTS
+from trade_history import TRADE_FIELDS
+from metrics import metrics
+from rate_limiter import create_exchange, request_priority, PRIORITY_DASHBOARD
+from live_engine import LiveEngine
+from scanner import MarketScanner
 import sys
 import os
 import numpy as np
 import threading
 import time
-import ccxt
 import traceback
 import webbrowser
 import uuid
+import multiprocessing
+import queue
+from contextlib import contextmanager
 
 # LISTA PREDEFINIDA DE PORTFÓLIO (Top Assets + Voláteis)
 PORTFOLIO_TARGETS = [
@@ -40,10 +53,11 @@ sys.path.append(ROOT_DIR)
 load_dotenv(os.path.join(ROOT_DIR, '.env'))
 
 try:
-    from database import db, User 
-    from market_data import fetch_market_data
+    from database import db, User, ensure_indexes
+    from market_data import fetch_market_data, btc_regime, format_timestamp, format_candles
     from indicators import add_indicators, check_trend_m5
-    from paper_trading import PaperTrader
+    from paper_trading import PaperTrader, ASSET_PARAMS, build_entry_row
+    from strategy import check_entry_strategy
     from notification import notify_bot_state, notify_config_saved, notify_environment_change, notify_connection_test, send_telegram_msg
     try:
         from stats_manager import stats_manager
@@ -61,6 +75,7 @@ app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET', 'sniper_v63_master_key_change_me')
 app.config['JWT_TOKEN_LOCATION'] = ['headers']
+app.config['JWT_QUERY_STRING_NAME'] = 'token' # Só no /market/stream (EventSource não envia headers customizados)
 app.config['JWT_HEADER_NAME'] = 'Authorization'
 app.config['JWT_HEADER_TYPE'] = 'Bearer'
 app.config['JWT_ACCESS_TOKEN_EXPIRES'] = 86400 
@@ -71,10 +86,24 @@ jwt = JWTManager(app)
 limiter = Limiter(get_remote_address, app=app, default_limits=["2000 per hour"], storage_uri="memory://")
 
 
+def checkpoint_state(record):
+    with app.app_context(): PaperTrader.write_state(record)
+
+# Arquivos de runtime (journal etc.) em data/, fora do controle de versão
+DATA_DIR = os.path.join(ROOT_DIR, 'data')
+os.makedirs(DATA_DIR, exist_ok=True)
+journal_path = os.path.join(DATA_DIR, 'bot_state.journal')
+legacy_journal = os.path.join(ROOT_DIR, 'bot_state.journal')
+if os.path.exists(legacy_journal) and not os.path.exists(journal_path): os.replace(legacy_journal, journal_path)
+# Estado do trader: journal com fsync em lote + checkpoint periódico no SQLite (write-behind)
+STATE_JOURNAL = StateJournal(journal_path, checkpoint=checkpoint_state)
 paper_trader = PaperTrader(initial_balance=100.00, live_mode=True)
+paper_trader.attach_journal(STATE_JOURNAL)
+if HAS_STATS: paper_trader.attach_stats(stats_manager)
 
 with app.app_context():
     db.create_all() 
+    ensure_indexes()
     print("📂 Carregando estado do banco de dados...")
     paper_trader.load_state() 
     
@@ -119,10 +148,35 @@ SCAN_CURRENT_LOOK = "..."
 REAL_BALANCE_CACHE = 0.0 
 CACHE_LOCK = threading.Lock()
 GLOBAL_CACHE = {"data_5m": None, "data_1h": None, "last_update": 0}
+# Campos de cada candle enviado ao gráfico
+CANDLE_FIELDS = ('timestamp', 'open', 'high', 'low', 'close', 'bb_upper', 'bb_lower', 'ema200')
 REAL_EXCHANGE_INSTANCE = None 
 SCAN_TARGETS = [ "BTC/USDT", "ETH/USDT", "SOL/USDT", "BNB/USDT", "XRP/USDT", "DOGE/USDT", "SHIB/USDT", "PEPE/USDT", "ADA/USDT", "AVAX/USDT", "DOT/USDT", "LINK/USDT", "LTC/USDT", "MATIC/USDT", "NEAR/USDT", "ATOM/USDT", "UNI/USDT", "APT/USDT" ]
 TRADING_LOCK = threading.Lock() 
-BACKTEST_JOBS = {} 
+
+@contextmanager
+def trading_section():
+    """
+    TRADING_LOCK só cobre transições em memória do PaperTrader. O I/O que elas geram
+    (banco, Telegram) roda depois que o lock é solto: /panic nunca espera rede de outro thread.
+    """
+    try:
+        with TRADING_LOCK: yield paper_trader
+    finally:
+        paper_trader.flush_effects()
+
+STREAM_HUB = MarketStreamHub()
+# Estado por ativo + pool de análise do loop ao vivo (ver active_symbol_worker)
+LIVE_ENGINE = LiveEngine(lambda symbol, timeframe, focus: process_analysis(symbol, timeframe, with_candles=focus), max_workers=8)
+metrics.gauge_callback("sniper_stream_subscribers", lambda: STREAM_HUB.subscriber_count)
+# Snapshot pré-codificado do /market (data_5m/data_1h): JSON gerado uma vez por atualização
+MARKET_SNAPSHOT = SnapshotStore(encoders={
+    "json": lambda data: encode_json(format_analysis(data)),
+    "columnar": lambda data: encode_json(columnar_analysis(data)),
+})
+STREAM_STATE = {"symbol": None, "5m": None, "1h": None, "status": None, "trade_ids": None}
+# Pool fixo para backtests: não compete sem limite com o active_symbol_worker (dinheiro real)
+BACKTEST_SCHEDULER = JobScheduler(workers=1, max_per_user=2, ttl=600)
 
 # --- AUXILIARES ---
 
@@ -140,15 +194,14 @@ def get_exchange_connection(user_obj):
     api_key, secret = user_obj.get_binance_keys()
     if not api_key or not secret: return None 
     try:
-        exchange = ccxt.binance({ 
+        exchange = create_exchange({ 
             'apiKey': api_key, 
             'secret': secret, 
-            'enableRateLimit': True, 
             'options': { 
                 'defaultType': 'spot',
                 'adjustForTimeDifference': True 
             } 
-        })
+        }, client='account')
         exchange.load_time_difference()
         return exchange
     except: return None
@@ -157,11 +210,12 @@ def update_real_balance():
     global REAL_BALANCE_CACHE
     if not paper_trader.is_testnet and REAL_EXCHANGE_INSTANCE:
         try:
-            bal = REAL_EXCHANGE_INSTANCE.fetch_balance()
+            # Saldo é só exibição: não passa na frente de análise/ordens do loop ao vivo
+            with request_priority(PRIORITY_DASHBOARD): bal = REAL_EXCHANGE_INSTANCE.fetch_balance()
             REAL_BALANCE_CACHE = float(bal['total']['USDT'])
         except Exception as e: log_error.error(f"Erro saldo: {e}")
 
-def process_analysis(symbol, timeframe):
+def process_analysis(symbol, timeframe, with_candles=True):
     try:
         # --- CORREÇÃO VITAL DE RENDERIZAÇÃO ---
         # Pedimos 1500 candles. 
@@ -171,40 +225,186 @@ def process_analysis(symbol, timeframe):
         df = fetch_market_data(symbol=symbol, timeframe=timeframe, limit=limit_fetch) 
         if df is None or df.empty: return None, None
         
-        df = df.replace({np.nan: None})
+        serialize_start = time.perf_counter()
         
         # --- CORTE DE WARMUP ---
         # Mantemos apenas os últimos 1000 candles para exibição.
         # Como a EMA foi calculada sobre 1500, o candle 0 deste recorte já terá a EMA precisa.
         if len(df) > 1000:
             df = df.iloc[-1000:]
+        
+        # Ativos em segundo plano: a estratégia só lê as duas últimas linhas; o gráfico
+        # (1000 candles -> dicts) só é montado para o ativo em foco
+        rows = df if with_candles else df.iloc[-2:]
+        rows = rows.replace({np.nan: None})
             
-        last = df.iloc[-1]
+        last = rows.iloc[-1]
         
-        prev_ema = df['ema200'].iloc[-2] if len(df) > 1 else last.get('ema200')
+        prev_ema = rows['ema200'].iloc[-2] if len(rows) > 1 else last.get('ema200')
         current_ema = last.get('ema200')
         ema_slope = (current_ema - prev_ema) if (current_ema and prev_ema) else 0
         
-        # Lista para o gráfico (Agora contém exatamente 1000 candles perfeitos)
-        candles_list = df[['timestamp', 'open', 'high', 'low', 'close', 'bb_upper', 'bb_lower', 'ema200']].to_dict(orient='records')
         
         # Dados Fibo (da última linha)
         high_50 = last.get('fibo_high') if last.get('fibo_high') else 0
         low_50 = last.get('fibo_low') if last.get('fibo_low') else 0
         fibo_50 = high_50 - ((high_50 - low_50) * 0.5) if high_50 and low_50 else 0
         
-        return {
+        analysis = {
             "price": last['close'], "open_price": last['open'], "rsi": last['rsi'], 
             "ema200": last.get('ema200'), "ema_slope": ema_slope, "atr": last.get('atr', 0),
             "fibo_level": fibo_50, "fibo_high": high_50, "fibo_low": low_50,
             "bb_upper": last['bb_upper'], "bb_lower": last['bb_lower'],
-            "timestamp": str(last['timestamp']), "candles": candles_list 
-        }, df
+            "timestamp": int(last['timestamp'])
+        }
+        # Lista para o gráfico (Agora contém exatamente 1000 candles perfeitos)
+        if with_candles: analysis["candles"] = rows[list(CANDLE_FIELDS)].to_dict(orient='records')
+        metrics.observe('sniper_stage_seconds', time.perf_counter() - serialize_start, stage='serialize', symbol=symbol, timeframe=timeframe)
+        return analysis, df
     except Exception as e: 
+        metrics.inc('sniper_stage_errors_total', stage='serialize', symbol=symbol, timeframe=timeframe)
         log_error.error(f"Erro process_analysis: {e}")
         return None, None
 
+def trader_status_fields():
+    """Campos globais (iguais para todos os usuários) do payload do /market."""
+    ts = paper_trader.get_status() # Lê o snapshot do trader (sem TRADING_LOCK)
+    g_stats = stats_manager.get_stats() if HAS_STATS else {}
+    position = ts['position_details']
+    fields = {
+        "symbol": position['symbol'] if position else CURRENT_SYMBOL,
+        "is_running": BOT_ACTIVE, "is_testnet": paper_trader.is_testnet,
+        "paper_balance": ts['balance'], "accumulated_pnl": ts['accumulated_pnl'],
+        "active_trade": ts['position_details'], "risk_pct": int(paper_trader.risk_percentage*100),
+        "wins": g_stats.get('wins',0), "losses": g_stats.get('losses',0), "win_rate": g_stats.get('win_rate',0),
+        "total_trades": g_stats.get('total_trades',0), "is_scanning": IS_SCANNING, "scanning_look": SCAN_CURRENT_LOOK,
+        "real_balance": REAL_BALANCE_CACHE,
+    }
+    return fields, ts['trades']
+
+def format_analysis(data):
+    """Borda da API: converte os timestamps (epoch ms) da análise para texto ISO."""
+    if not data: return data
+    out = {**data, "timestamp": format_timestamp(data["timestamp"])}
+    if "candles" in data: out["candles"] = format_candles(data["candles"])
+    return out
+
+def columnar_analysis(data):
+    """Borda da API (formato colunar): candles em arrays paralelos, timestamps em epoch ms."""
+    if not data or "candles" not in data: return data
+    return {**data, "candles": to_columns(data["candles"], CANDLE_FIELDS)}
+
+def publish_market_updates(symbol, d_m5, d_h1):
+    """Publica no stream apenas o que mudou desde o último tick."""
+    if STREAM_STATE["symbol"] != symbol:
+        # Troca de ativo: os clientes precisam de um snapshot novo
+        STREAM_STATE.update({"symbol": symbol, "5m": d_m5, "1h": d_h1})
+        STREAM_HUB.publish("resync", {"symbol": symbol})
+    else:
+        for tf, data in (("5m", d_m5), ("1h", d_h1)):
+            if not data: continue
+            delta = candle_delta(STREAM_STATE[tf], data)
+            if delta is None: STREAM_HUB.publish("resync", {"symbol": symbol})
+            elif delta: STREAM_HUB.publish("candles", {"tf": tf, "symbol": symbol, **delta, "summary": format_analysis(delta["summary"]), "candles": format_candles(delta["candles"])})
+            STREAM_STATE[tf] = data
+
+    fields, trades = trader_status_fields()
+    prev = STREAM_STATE["status"] or {}
+    changed = {k: v for k, v in fields.items() if prev.get(k) != v}
+    trade_ids = [t['id'] for t in trades]
+    prev_ids = STREAM_STATE["trade_ids"]
+    if prev_ids is not None and trade_ids != prev_ids:
+        new_trades = [t for t in trades if not prev_ids or t['id'] > prev_ids[0]]
+        # Lista é limitada aos 50 mais recentes: o caso normal é "novos no topo, antigos saem do fim"
+        if trade_ids[len(new_trades):] == prev_ids[:len(trade_ids) - len(new_trades)]:
+            changed["new_trades"] = new_trades
+        else:
+            changed["trade_history"] = trades # Histórico resetado: envia a lista inteira
+    if changed and STREAM_STATE["status"] is not None: STREAM_HUB.publish("status", changed)
+    STREAM_STATE["status"] = fields # active_trade vem do snapshot imutável do trader
+    STREAM_STATE["trade_ids"] = trade_ids
+
+def execute_real_orders(symbol, result_msg, d_m5, exec_manager, tick_start):
+    """Espelha na Binance (modo real) a decisão que o PaperTrader acabou de tomar."""
+    if paper_trader.is_testnet or not result_msg: return
+    if not exec_manager:
+        log_error.error(f"❌ Sem conexão com a Binance para executar: {result_msg} ({symbol})")
+        return
+    if "COMPRA EXECUTADA" in result_msg:
+        fake_position = paper_trader.snapshot['position']
+        amount_to_invest = fake_position['invested_value']
+        stop_loss_price = fake_position['sl_price'] 
+        
+        log_exec.info(f"⚡ Sinal de Compra! Executando MARKET BUY de ${amount_to_invest}...")
+        
+        # 1. Compra a Mercado (Garantia de Execução)
+        real_result = exec_manager.place_market_buy(symbol, amount_to_invest, ref_price=d_m5['price'], tick_start=tick_start)
+        
+        if real_result['success']:
+            # 2. Hard Stop (Redundância na Exchange) — primeira coisa após o ACK da compra
+            stop_res = exec_manager.place_hard_stop(symbol, real_result['amount'], stop_loss_price)
+            log_exec.info(f"🔒 Hard Stop na Binance: {'OK' if stop_res['success'] else 'FALHOU'}")
+            
+            # --- NOTIFICAÇÃO DE PROTEÇÃO ---
+            msg_protect = (f"🛡️ *PROTEÇÃO ARMADA*\nHard Stop posicionado na Binance: `{stop_loss_price}`")
+            # Usamos o ID do chat salvo no paper_trader
+            send_telegram_msg(paper_trader.telegram_chat_id, msg_protect, priority=PRIORITY_CRITICAL)
+            # --------------------------------------
+
+            with trading_section() as trader:
+                trader.apply_real_fill(real_result['price'], real_result['amount'], REAL_BALANCE_CACHE - real_result['cost'])
+            log_exec.info(f"✅ Compra e Proteção confirmadas: {real_result['amount']} a ${real_result['price']}")
+        else:
+            # --- NOTIFICAÇÃO DE ERRO CRÍTICO ---
+            err_msg = (f"⛔ *FALHA CRÍTICA DE EXECUÇÃO*\nA ordem de compra falhou na Binance!\n\nMotivo: `{real_result['message']}`\n\n⚠️ *Verifique sua conta imediatamente.*")
+            send_telegram_msg(paper_trader.telegram_chat_id, err_msg, priority=PRIORITY_CRITICAL)
+            # ------------------------------------------
+
+            log_exec.error(f"❌ Falha Compra Real: {real_result['message']}. Revertendo posição.")
+            with trading_section() as trader: trader.revert_entry(amount_to_invest)
+    elif "PARCIAL EXECUTADA" in result_msg:
+        log_exec.info(f"💰 Executando PARCIAL Real em {symbol}...")
+        coin = symbol.split('/')[0]
+        try:
+            bal = REAL_EXCHANGE_INSTANCE.fetch_balance()
+            total_coin = float(bal['total'].get(coin, 0))
+            amount_to_sell = total_coin * 0.5 
+            if amount_to_sell > 0:
+                exec_manager.place_market_sell(symbol, amount_to_sell, tick_start=tick_start)
+                log_exec.info(f"✅ Parcial Real executada: {amount_to_sell} {coin}")
+        except Exception as e: log_error.error(f"❌ Erro na Parcial Real: {e}")
+    elif "VENDA" in result_msg:
+        coin = symbol.split('/')[0]
+        try:
+            bal = REAL_EXCHANGE_INSTANCE.fetch_balance()
+            coin_amount = float(bal['total'].get(coin, 0))
+            if coin_amount > 0:
+                log_exec.info(f"🔻 Venda Final Real: {coin_amount} {coin}")
+                exec_manager.place_market_sell(symbol, coin_amount, tick_start=tick_start)
+        except Exception as e: log_error.error(f"Erro crítica venda real: {e}")
+
+def evaluate_symbol(state, exec_manager, tick_start):
+    """Passa a análise fresca de um ativo pelo PaperTrader (regra de posição única fica no trader)."""
+    symbol, d_m5 = state.symbol, state.d_m5
+    with metrics.timer('sniper_stage_seconds', stage='trend', symbol=symbol, timeframe='1h'):
+        is_bullish, reason = check_trend_m5(state.df_h1)
+    # Regime do BTC (pode consultar a exchange) ANTES da seção crítica
+    btc_status, _ = btc_regime.get()
+    with TRADING_LOCK, metrics.timer('sniper_stage_seconds', stage='trader_update', symbol=symbol, timeframe='5m'): 
+        result_msg = paper_trader.update(
+            d_m5['price'], d_m5['open_price'], d_m5['rsi'], d_m5['bb_lower'], d_m5['bb_upper'], 
+            d_m5['fibo_high'], d_m5['fibo_low'], d_m5['timestamp'], is_bullish, symbol, 
+            d_m5['atr'], d_m5.get('ema_slope', 0), btc_status=btc_status
+        )
+    # Ordem real primeiro: banco/Telegram pendentes não atrasam o tick -> ACK
+    try: execute_real_orders(symbol, result_msg, d_m5, exec_manager, tick_start)
+    finally: paper_trader.flush_effects()
+
 def active_symbol_worker():
+    """
+    Loop ao vivo: analisa TODOS os SCAN_TARGETS em paralelo (LiveEngine) e avalia cada ativo
+    assim que sua análise termina. O ativo em foco (posição aberta ou CURRENT_SYMBOL) alimenta o dashboard.
+    """
     global GLOBAL_CACHE
     tick_count = 0
     exec_manager = None
@@ -213,96 +413,102 @@ def active_symbol_worker():
             try:
                 if REAL_EXCHANGE_INSTANCE and not exec_manager:
                     exec_manager = ExecutionManager(REAL_EXCHANGE_INSTANCE)
-                target_symbol = paper_trader.position['symbol'] if paper_trader.position else CURRENT_SYMBOL
-                d_m5, df_m5 = process_analysis(target_symbol, '5m')
-                d_h1, df_h1 = process_analysis(target_symbol, '1h')
-                with CACHE_LOCK:
-                    if d_m5: GLOBAL_CACHE["data_5m"] = d_m5
-                    if d_h1: GLOBAL_CACHE["data_1h"] = d_h1
-                    GLOBAL_CACHE["last_update"] = time.time()
+                position = paper_trader.snapshot['position']
+                target_symbol = position['symbol'] if position else CURRENT_SYMBOL
+                tick_start = time.perf_counter()
                 if not paper_trader.is_testnet and tick_count % 10 == 0: update_real_balance()
                 tick_count += 1
-                if BOT_ACTIVE and d_m5 and df_h1 is not None:
-                    is_bullish, reason = check_trend_m5(df_h1)
-                    with TRADING_LOCK: 
-                        result_msg = paper_trader.update(
-                            d_m5['price'], d_m5['open_price'], d_m5['rsi'], d_m5['bb_lower'], d_m5['bb_upper'], 
-                            d_m5['fibo_high'], d_m5['fibo_low'], d_m5['timestamp'], is_bullish, target_symbol, 
-                            d_m5['atr'], d_m5.get('ema_slope', 0)
-                        )
-                    if not paper_trader.is_testnet and result_msg:
-                       if "COMPRA EXECUTADA" in result_msg:
-                            fake_position = paper_trader.position 
-                            amount_to_invest = fake_position['invested_value']
-                            stop_loss_price = fake_position['sl_price'] 
-                            
-                            log_exec.info(f"⚡ Sinal de Compra! Executando MARKET BUY de ${amount_to_invest}...")
-                            
-                            # 1. Compra a Mercado (Garantia de Execução)
-                            real_result = exec_manager.place_market_buy(target_symbol, amount_to_invest)
-                            
-                            if real_result['success']:
-                                # 2. Hard Stop (Redundância na Exchange)
-                                log_exec.info("🔒 Colocando Hard Stop na Binance...")
-                                stop_res = exec_manager.place_hard_stop(target_symbol, real_result['amount'], stop_loss_price)
-                                
-                                # --- NOTIFICAÇÃO DE PROTEÇÃO ---
-                                msg_protect = (f"🛡️ *PROTEÇÃO ARMADA*\nHard Stop posicionado na Binance: `{stop_loss_price}`")
-                                # Usamos o ID do chat salvo no paper_trader
-                                send_telegram_msg(paper_trader.chat_id, msg_protect)
-                                # --------------------------------------
-
-                                with TRADING_LOCK:
-                                    if paper_trader.position: 
-                                        paper_trader.position['entry_price'] = real_result['price']
-                                        paper_trader.position['amount'] = real_result['amount']
-                                        paper_trader.balance = REAL_BALANCE_CACHE - real_result['cost'] 
-                                        paper_trader.save_state()
-                                log_exec.info(f"✅ Compra e Proteção confirmadas: {real_result['amount']} a ${real_result['price']}")
-                            else:
-                                # --- NOTIFICAÇÃO DE ERRO CRÍTICO ---
-                                err_msg = (f"⛔ *FALHA CRÍTICA DE EXECUÇÃO*\nA ordem de compra falhou na Binance!\n\nMotivo: `{real_result['message']}`\n\n⚠️ *Verifique sua conta imediatamente.*")
-                                send_telegram_msg(paper_trader.chat_id, err_msg)
-                                # ------------------------------------------
-
-                                log_exec.error(f"❌ Falha Compra Real: {real_result['message']}. Revertendo posição.")
-                                with TRADING_LOCK:
-                                    paper_trader.position = None
-                                    paper_trader.balance += amount_to_invest
-                                    paper_trader.save_state()
-                    elif "PARCIAL EXECUTADA" in result_msg:
-                            log_exec.info(f"💰 Executando PARCIAL Real em {target_symbol}...")
-                            coin = target_symbol.split('/')[0]
-                            try:
-                                bal = REAL_EXCHANGE_INSTANCE.fetch_balance()
-                                total_coin = float(bal['total'].get(coin, 0))
-                                amount_to_sell = total_coin * 0.5 
-                                if amount_to_sell > 0:
-                                    exec_manager.place_market_sell(target_symbol, amount_to_sell)
-                                    log_exec.info(f"✅ Parcial Real executada: {amount_to_sell} {coin}")
-                            except Exception as e: log_error.error(f"❌ Erro na Parcial Real: {e}")
-                    elif "VENDA" in result_msg:
-                            coin = target_symbol.split('/')[0]
-                            try:
-                                bal = REAL_EXCHANGE_INSTANCE.fetch_balance()
-                                coin_amount = float(bal['total'].get(coin, 0))
-                                if coin_amount > 0:
-                                    log_exec.info(f"🔻 Venda Final Real: {coin_amount} {coin}")
-                                    exec_manager.place_market_sell(target_symbol, coin_amount)
-                            except Exception as e: log_error.error(f"Erro crítica venda real: {e}")
-            except Exception as e: time.sleep(5)
+
+                # Foco primeiro na fila; ele renova o H1 em todo tick (gráfico + gestão da posição)
+                for state in LIVE_ENGINE.run_tick([target_symbol] + SCAN_TARGETS, always_h1=(target_symbol,)):
+                    if state.symbol == "BTC/USDT" and state.fresh: btc_regime.observe_price(state.d_m5['price'])
+                    if state.symbol == target_symbol:
+                        # Só análises com gráfico (feitas com o ativo em foco) vão para o dashboard
+                        d_m5 = state.d_m5 if state.fresh and "candles" in state.d_m5 else None
+                        d_h1 = state.d_h1 if state.d_h1 and "candles" in state.d_h1 else None
+                        with CACHE_LOCK:
+                            if d_m5: GLOBAL_CACHE["data_5m"] = d_m5
+                            if d_h1: GLOBAL_CACHE["data_1h"] = d_h1
+                            GLOBAL_CACHE["last_update"] = time.time()
+                        MARKET_SNAPSHOT.publish(data_5m=d_m5, data_1h=d_h1)
+                        if STREAM_HUB.has_subscribers: publish_market_updates(target_symbol, d_m5, d_h1)
+                        else: STREAM_STATE["symbol"] = None # Sem ouvintes: próximo cliente parte de um snapshot
+                    if BOT_ACTIVE and state.ready:
+                        try: evaluate_symbol(state, exec_manager, tick_start)
+                        except Exception as e: log_error.error(f"Erro avaliação {state.symbol}: {e}")
+                metrics.observe('sniper_stage_seconds', time.perf_counter() - tick_start, stage='tick', symbol=target_symbol, timeframe='')
+            except Exception as e:
+                metrics.inc('sniper_stage_errors_total', stage='tick', symbol='', timeframe='')
+                time.sleep(5)
             time.sleep(2)
 
 
+SCAN_INTERVAL = 15   # Segundos entre varreduras
+SCAN_MAX_AGE = 60    # Análise do motor ao vivo mais velha que isso é refeita pelo scanner
+
+def params_for(symbol):
+    return ASSET_PARAMS.get(symbol, ASSET_PARAMS.get("DEFAULT"))
+
+def scanner_analysis(symbol, with_h1=False):
+    """Análise recente do LiveEngine; ativos fora dele (ou atrasados) são analisados aqui (CandleStore incremental)."""
+    state = LIVE_ENGINE.peek(symbol)
+    if state and state.d_m5 and time.time() - state.m5_updated_at <= SCAN_MAX_AGE:
+        return state.d_m5, state.df_h1
+    with request_priority(PRIORITY_DASHBOARD):
+        d_m5, _ = process_analysis(symbol, '5m', with_candles=False)
+        df_h1 = process_analysis(symbol, '1h', with_candles=False)[1] if (with_h1 and d_m5) else None
+    return d_m5, df_h1
+
+def scanner_snapshot(symbol):
+    d_m5, _ = scanner_analysis(symbol)
+    if not d_m5: return None
+    return {"close": d_m5['price'], "rsi": d_m5['rsi'], "bb_lower": d_m5['bb_lower'], "ema200": d_m5['ema200']}
+
+def scanner_evaluate(symbol):
+    """Mesma decisão de entrada do PaperTrader.update, sem abrir posição."""
+    d_m5, df_h1 = scanner_analysis(symbol, with_h1=True)
+    if not d_m5: return None
+    is_bullish, _ = check_trend_m5(df_h1)
+    btc_status, _ = btc_regime.get()
+    row = build_entry_row(d_m5['price'], d_m5['open_price'], d_m5['rsi'], d_m5['bb_lower'], d_m5['bb_upper'],
+                          d_m5['fibo_high'], d_m5['fibo_low'], is_bullish, d_m5['atr'])
+    prev = {'rsi': paper_trader.prev_rsi_memory.get(symbol, 50.0)}
+    return check_entry_strategy(row, prev, params_for(symbol), btc_status=btc_status if symbol != "BTC/USDT" else "BULL", ignore_trend=not is_bullish)
+
 def scanner_job():
+    """
+    Varre SCAN_TARGETS enquanto não há posição: triagem vetorizada de todos os ativos e
+    check_entry_strategy só nos melhores. Com sinal e bot ligado, o dashboard passa a focar o ativo.
+    """
     global CURRENT_SYMBOL, IS_SCANNING, SCAN_CURRENT_LOOK
-    
-    # Instância dedicada para o Scanner (não conflita com a trade)
-    scanner_exchange = ccxt.binance({'enableRateLimit': True, 'options': {'defaultType': 'spot'}})
-    
+    scanner = MarketScanner(scanner_snapshot, scanner_evaluate, params_for, top_k=5)
+    time.sleep(10) # Deixa o primeiro tick do motor ao vivo aquecer o CandleStore
+    while True:
+        try:
+            position = paper_trader.snapshot['position']
+            if position:
+                IS_SCANNING = False
+                SCAN_CURRENT_LOOK = f"Em operação: {position['symbol']}"
+            else:
+                IS_SCANNING = True
+                result = scanner.scan(SCAN_TARGETS)
+                metrics.observe('sniper_stage_seconds', result['elapsed'], stage='scan', symbol='', timeframe='5m')
+                candidates = result['candidates']
+                if candidates:
+                    best = next((c for c in candidates if c['signal']), candidates[0])
+                    rsi_txt = f" (RSI {best['rsi']:.1f})" if best['rsi'] is not None else ""
+                    SCAN_CURRENT_LOOK = f"{best['symbol']}{rsi_txt}" + (f" 🎯 {best['trigger']}" if best['signal'] else "")
+                    if best['signal'] and BOT_ACTIVE and not paper_trader.snapshot['position']: CURRENT_SYMBOL = best['symbol']
+                else:
+                    SCAN_CURRENT_LOOK = "..."
+        except Exception as e:
+            log_error.error(f"Erro scanner: {e}")
+        time.sleep(SCAN_INTERVAL)
+
 
 with app.app_context():
     db.create_all() 
+    ensure_indexes()
     print("📂 Carregando estado do banco de dados...")
     paper_trader.load_state() 
     
@@ -322,38 +528,39 @@ with app.app_context():
         print(f"❌ Erro ao vincular usuário admin: {e}")
     # ==========================================
 
+STATE_JOURNAL.start() # Depois do load_state: o replay do journal já foi aplicado
 threading.Thread(target=active_symbol_worker, daemon=True).start()
 threading.Thread(target=scanner_job, daemon=True).start()
 
 # --- BACKTEST WORKER (ASYNC JOBS) ---
-def backtest_worker(job_id, data, user_chat_id):
-    def update_progress(pct, msg):
-        if job_id in BACKTEST_JOBS:
-            BACKTEST_JOBS[job_id]['progress'] = pct
-            BACKTEST_JOBS[job_id]['message'] = msg
-    try:
-        timeframe = data.get('timeframe', '5m')
-        days = int(data.get('days', 7))
-        initial_balance = float(data.get('balance', 1000))
-        risk_pct = float(data.get('risk', 10))
-        ignore_trend = data.get('ignore_trend', False)
-        mode = data.get('mode', 'single')
-        symbol = data.get('symbol', 'BTC/USDT')
-        target_list = PORTFOLIO_TARGETS if mode == 'portfolio' else [symbol]
-        
-        result = BacktesterEngine.run_portfolio(
-            symbols_list=target_list, timeframe=timeframe, days=days,
-            initial_balance=initial_balance, risk_pct=risk_pct,
-            chat_id=user_chat_id, ignore_trend=ignore_trend,
-            progress_callback=update_progress
-        )
-        BACKTEST_JOBS[job_id]['result'] = result
-        BACKTEST_JOBS[job_id]['progress'] = 100
-        BACKTEST_JOBS[job_id]['message'] = "Concluído!"
-    except Exception as e:
-        log_error.error(f"Erro Backtest Worker: {e}")
-        BACKTEST_JOBS[job_id]['error'] = str(e)
-        BACKTEST_JOBS[job_id]['progress'] = -1
+def backtest_worker(data, user_chat_id, progress_callback):
+    timeframe = data.get('timeframe', '5m')
+    days = int(data.get('days', 7))
+    initial_balance = float(data.get('balance', 1000))
+    risk_pct = float(data.get('risk', 10))
+    ignore_trend = data.get('ignore_trend', False)
+    mode = data.get('mode', 'single')
+    symbol = data.get('symbol', 'BTC/USDT')
+    target_list = PORTFOLIO_TARGETS if mode == 'portfolio' else [symbol]
+    
+    return BacktesterEngine.run_portfolio(
+        symbols_list=target_list, timeframe=timeframe, days=days,
+        initial_balance=initial_balance, risk_pct=risk_pct,
+        chat_id=user_chat_id, ignore_trend=ignore_trend,
+        progress_callback=progress_callback
+    )
+
+def sweep_worker(data, progress_callback):
+    mode = data.get('mode', 'single')
+    symbol = data.get('symbol', 'BTC/USDT')
+    target_list = PORTFOLIO_TARGETS if mode == 'portfolio' else [symbol]
+    
+    return BacktesterEngine.run_sweep(
+        symbols_list=target_list, grid=data.get('grid', {}),
+        timeframe=data.get('timeframe', '5m'), days=int(data.get('days', 7)),
+        initial_balance=float(data.get('balance', 1000)), risk_pct=float(data.get('risk', 10)),
+        ignore_trend=data.get('ignore_trend', False), progress_callback=progress_callback
+    )
 
 # --- ROTAS ---
 
@@ -444,24 +651,72 @@ def update_profile():
         return jsonify({"success": True, "message": "Perfil atualizado", "new_token": new_token})
     except Exception as e: return jsonify({"success": False, "message": str(e)}), 500
 
+MARKET_FRAGMENTS = ("data_5m", "data_1h")
+
+def market_user_fields(user):
+    """Parte do /market calculada por requisição (status do trader + dados do usuário)."""
+    fields, trades = trader_status_fields()
+    auth_s = {"has_name": bool(user.username), "has_telegram": bool(user.telegram_chat_id), "has_real": bool(user._real_key_enc)}
+    return {**fields, "trader_name": user.username, "trade_history": trades, "auth_status": auth_s}
+
 @app.route('/market')
 @jwt_required()
 def market():
-    global BOT_ACTIVE, REAL_BALANCE_CACHE
     user = User.query.filter_by(username=get_jwt_identity()).first()
-    processing_symbol = paper_trader.position['symbol'] if paper_trader.position else CURRENT_SYMBOL
-    with CACHE_LOCK: cache_m5 = GLOBAL_CACHE["data_5m"]; cache_h1 = GLOBAL_CACHE["data_1h"]
-    ts = paper_trader.get_status()
-    auth_s = {"has_name": bool(user.username), "has_telegram": bool(user.telegram_chat_id), "has_real": bool(user._real_key_enc)}
-    g_stats = stats_manager.get_stats() if HAS_STATS else {}
-    return jsonify({
-        "symbol": processing_symbol, "is_running": BOT_ACTIVE, "is_testnet": paper_trader.is_testnet,
-        "trader_name": user.username, "paper_balance": ts['balance'], "accumulated_pnl": ts['accumulated_pnl'],
-        "active_trade": ts['position_details'], "trade_history": ts['trades'], "risk_pct": int(paper_trader.risk_percentage*100), 
-        "wins": g_stats.get('wins',0), "losses": g_stats.get('losses',0), "win_rate": g_stats.get('win_rate',0),
-        "total_trades": g_stats.get('total_trades',0), "is_scanning": IS_SCANNING, "scanning_look": SCAN_CURRENT_LOOK,
-        "auth_status": auth_s, "real_balance": REAL_BALANCE_CACHE, "data_5m": cache_m5, "data_1h": cache_h1,
-    })
+    columnar = wants_columnar(request)
+    etag, body = MARKET_SNAPSHOT.render(market_user_fields(user), MARKET_FRAGMENTS, "columnar" if columnar else "json")
+    headers = {'ETag': f'"{etag}"', 'Cache-Control': 'private, no-cache', 'Vary': 'Accept, Accept-Encoding, Authorization'}
+    # Nada mudou desde a última consulta deste cliente: sem corpo, sem serialização dos candles
+    if etag in request.if_none_match: return Response(status=304, headers=headers)
+
+    data = body()
+    if request.accept_encodings['gzip']:
+        compressed = MARKET_SNAPSHOT.gzipped(etag, data)
+        if compressed is not None: data, headers['Content-Encoding'] = compressed, 'gzip'
+    return Response(data, mimetype=COLUMNAR_MIME if columnar else 'application/json', headers=headers)
+
+@app.route('/market/stream')
+@jwt_required(locations=['query_string']) # Token na URL só aqui: nas demais rotas ele iria parar em logs/histórico
+def market_stream():
+    """
+    Stream SSE do dashboard: um snapshot completo ao conectar e depois só deltas
+    (candles, posição, trades) conforme o active_symbol_worker produz.
+    """
+    username = get_jwt_identity()
+    variant = "columnar" if wants_columnar(request) else "json" # Só o snapshot; deltas seguem em linhas (poucos candles)
+    sub = STREAM_HUB.subscribe() # Inscreve ANTES do snapshot para não perder deltas
+
+    def snapshot():
+        user = User.query.filter_by(username=username).first()
+        _, body = MARKET_SNAPSHOT.render(market_user_fields(user), MARKET_FRAGMENTS, variant)
+        return format_sse_data("snapshot", body().decode('utf-8'), STREAM_HUB.seq)
+
+    def generate():
+        try:
+            yield snapshot()
+            while True:
+                if sub.overflowed:
+                    # Cliente lento: descarta a fila e reenvia o estado completo
+                    sub.overflowed = False
+                    while not sub.queue.empty(): sub.queue.get_nowait()
+                    yield snapshot()
+                try: event, message = sub.queue.get(timeout=15)
+                except queue.Empty:
+                    yield ": ping\n\n" # Keep-alive
+                    continue
+                yield snapshot() if event == "resync" else message
+        finally:
+            STREAM_HUB.unsubscribe(sub)
+
+    return Response(stream_with_context(generate()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+@app.route('/metrics')
+@limiter.exempt
+def metrics_endpoint():
+    """Exposição no formato do Prometheus (só com SNIPER_METRICS=1)."""
+    if not metrics.enabled: return jsonify({"success": False, "message": "Métricas desativadas (SNIPER_METRICS=1)"}), 404
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4; charset=utf-8')
 
 @app.route('/start', methods=['POST'])
 @jwt_required()
@@ -475,6 +730,7 @@ def start_bot():
         if not exch: return jsonify({"is_running": False, "message": "Erro Chaves"}), 400
         REAL_EXCHANGE_INSTANCE = exch
         sync_msg = paper_trader.sync_with_exchange(REAL_EXCHANGE_INSTANCE)
+        paper_trader.flush_effects()
         log_exec.info(f"Startup Sync: {sync_msg}")
     global BOT_ACTIVE; BOT_ACTIVE = True; notify_bot_state(True, user.telegram_chat_id); log_exec.info(f"START {user.username}")
     return jsonify({"is_running": True})
@@ -486,45 +742,62 @@ def stop_bot():
     global BOT_ACTIVE; BOT_ACTIVE = False; notify_bot_state(False, user.telegram_chat_id if user else None); log_exec.info("STOP"); 
     return jsonify({"is_running": False})
 
+def position_price(symbol):
+    """Último preço M5 do ativo pelo LiveEngine; sem análise dele, cai no cache do ativo em foco."""
+    state = LIVE_ENGINE.peek(symbol)
+    if state and state.d_m5: return state.d_m5['price']
+    with CACHE_LOCK: return (GLOBAL_CACHE.get("data_5m") or {}).get("price", 0)
+
 @app.route('/manual_trade', methods=['POST'])
 @jwt_required()
 def manual_trade():
     try: 
         side = request.json.get('side')
-        with CACHE_LOCK: 
-            data_m5 = GLOBAL_CACHE.get("data_5m") or {}
-            price = data_m5.get("price", 0)
-        with TRADING_LOCK:
+        if side not in ('SELL', 'BUY'): return jsonify({"success": False, "message": "Lado inválido"}), 400
+        symbol = CURRENT_SYMBOL
+        with trading_section() as trader:
             if side == 'SELL':
-                res = paper_trader.execute_manual_close(float(price))
-                if res['success'] and not paper_trader.is_testnet and REAL_EXCHANGE_INSTANCE:
-                    try:
-                        coin = CURRENT_SYMBOL.split('/')[0]
-                        bal = REAL_EXCHANGE_INSTANCE.fetch_balance()
-                        amount = float(bal['total'].get(coin, 0))
-                        if amount > 0:
-                            exec_manager = ExecutionManager(REAL_EXCHANGE_INSTANCE)
-                            exec_manager.place_market_sell(CURRENT_SYMBOL, amount)
-                            log_exec.info(f"🔻 Venda Manual Real executada: {amount} {coin}")
-                    except Exception as e: log_error.error(f"Erro Venda Manual Real: {e}")
-            elif side == 'BUY':
-                res = paper_trader.execute_manual_trade(side, float(price), CURRENT_SYMBOL)
-            else: return jsonify({"success": False, "message": "Lado inválido"}), 400
+                # A posição pode estar em outro ativo que não o foco do scanner (LiveEngine multi-ativo)
+                position = trader.snapshot['position']
+                if position: symbol = position['symbol']
+                res = trader.execute_manual_close(float(position_price(symbol)))
+            else:
+                # O scanner troca CURRENT_SYMBOL a qualquer momento e o GLOBAL_CACHE só acompanha no próximo
+                # tick: a compra usa a cotação do próprio ativo no LiveEngine, nunca a do ativo anterior
+                state = LIVE_ENGINE.peek(symbol)
+                if not (state and state.d_m5):
+                    return jsonify({"success": False, "message": f"Sem cotação de {symbol} ainda. Tente novamente."}), 409
+                res = trader.execute_manual_trade(side, float(state.d_m5['price']), symbol)
+        # Venda real só depois de soltar o lock (a posição simulada já está fechada)
+        if side == 'SELL' and res['success'] and not paper_trader.is_testnet and REAL_EXCHANGE_INSTANCE:
+            try:
+                coin = symbol.split('/')[0]
+                bal = REAL_EXCHANGE_INSTANCE.fetch_balance()
+                amount = float(bal['total'].get(coin, 0))
+                if amount > 0:
+                    exec_manager = ExecutionManager(REAL_EXCHANGE_INSTANCE)
+                    exec_manager.place_market_sell(symbol, amount)
+                    log_exec.info(f"🔻 Venda Manual Real executada: {amount} {coin}")
+            except Exception as e: log_error.error(f"Erro Venda Manual Real: {e}")
         return jsonify(res)
     except Exception as e: return jsonify({"success": False, "message": str(e)}), 500
 
 @app.route('/panic', methods=['POST'])
 @jwt_required()
 def panic_action():
-    with CACHE_LOCK: price = GLOBAL_CACHE["data_5m"].get("price", 0)
-    with TRADING_LOCK: res_msg = paper_trader.panic_sell(float(price))
+    with trading_section() as trader:
+        # Preço do ativo da posição (o LiveEngine pode ter aberto posição fora do ativo em foco)
+        position = trader.snapshot['position']
+        res_msg = trader.panic_sell(float(position_price(position['symbol']))) if position else "Sem posição"
     if REAL_EXCHANGE_INSTANCE and not paper_trader.is_testnet: pass 
     return jsonify({"success": True, "message": res_msg})
 
 @app.route('/reset', methods=['POST'])
 @jwt_required()
 def reset_bot():
-    if paper_trader.is_testnet: paper_trader.start_new_day(100.00); return jsonify({"success": True, "new_balance": 100.00})
+    if paper_trader.is_testnet:
+        with trading_section() as trader: trader.start_new_day(100.00)
+        return jsonify({"success": True, "new_balance": 100.00})
     return jsonify({"success": False})
 
 @app.route('/config', methods=['POST'])
@@ -559,19 +832,83 @@ def switch_mode():
 @jwt_required()
 def start_backtest():
     user = User.query.filter_by(username=get_jwt_identity()).first()
-    job_id = uuid.uuid4().hex
-    BACKTEST_JOBS[job_id] = {'progress': 0, 'message': 'Inicializando...', 'result': None, 'start_time': time.time()}
-    threading.Thread(target=backtest_worker, args=(job_id, request.json, user.telegram_chat_id)).start()
-    return jsonify({"success": True, "job_id": job_id})
+    data = request.json or {}
+    priority = PRIORITY_NORMAL if data.get('mode') == 'portfolio' else PRIORITY_HIGH
+    chat_id = user.telegram_chat_id
+    job_id, error = BACKTEST_SCHEDULER.submit(
+        user.username, lambda progress: backtest_worker(data, chat_id, progress),
+        priority=priority, label=f"backtest {data.get('mode', 'single')}"
+    )
+    if error: return jsonify({"success": False, "message": error}), 429
+    return jsonify({"success": True, "job_id": job_id, **BACKTEST_SCHEDULER.status(job_id)})
+
+@app.route('/backtest/sweep', methods=['POST'])
+@jwt_required()
+def start_sweep():
+    data = request.json or {}
+    try: BacktesterEngine.build_sweep_grid(data.get('grid'))
+    except ValueError as e: return jsonify({"success": False, "message": str(e)}), 400
+    job_id, error = BACKTEST_SCHEDULER.submit(
+        get_jwt_identity(), lambda progress: sweep_worker(data, progress),
+        priority=PRIORITY_LOW, label="sweep"
+    )
+    if error: return jsonify({"success": False, "message": error}), 429
+    return jsonify({"success": True, "job_id": job_id, **BACKTEST_SCHEDULER.status(job_id)})
+
+def backtest_result_view(result, columnar, points=DEFAULT_POINTS):
+    """
+    Curva de patrimônio fica guardada completa (EquityCurve): o status leva a versão LTTB com `points` pontos.
+    Trades ficam em linhas. Converte tudo para o formato pedido.
+    """
+    view = dict(result)
+    curve = view.get('equity_curve')
+    if isinstance(curve, EquityCurve):
+        view['equity_curve'] = curve.downsample(points)
+        view['equity_points'] = len(curve) # Total em resolução cheia (ver /backtest/equity)
+    if columnar:
+        if isinstance(view.get('trades'), list): view['trades'] = to_columns(view['trades'])
+    elif is_columnar(view.get('equity_curve')):
+        view['equity_curve'] = to_rows(view['equity_curve'])
+    return view
 
 @app.route('/backtest/status/<job_id>', methods=['GET'])
 @jwt_required()
 def check_backtest_status(job_id):
-    job = BACKTEST_JOBS.get(job_id)
+    job = BACKTEST_SCHEDULER.status(job_id, owner=get_jwt_identity())
     if not job: return jsonify({"success": False, "message": "Job não encontrado"}), 404
-    if time.time() - job.get('start_time', 0) > 600: BACKTEST_JOBS.pop(job_id, None)
+    if isinstance(job.get('result'), dict):
+        job['result'] = backtest_result_view(job['result'], wants_columnar(request), request.args.get('points', DEFAULT_POINTS, type=int))
     return jsonify(job)
 
+@app.route('/backtest/equity/<job_id>', methods=['GET'])
+@jwt_required()
+def backtest_equity(job_id):
+    """Janela da curva de patrimônio em resolução total (zoom). `start`/`end` em epoch ms, ambos opcionais."""
+    job = BACKTEST_SCHEDULER.status(job_id, owner=get_jwt_identity())
+    result = job.get('result') if job else None
+    curve = result.get('equity_curve') if isinstance(result, dict) else None
+    if not isinstance(curve, EquityCurve): return jsonify({"success": False, "message": "Curva não encontrada"}), 404
+    table = curve.window(request.args.get('start', type=int), request.args.get('end', type=int))
+    return jsonify({"success": True, "equity_curve": table if wants_columnar(request) else to_rows(table)})
+
+@app.route('/backtest/cancel/<job_id>', methods=['POST'])
+@jwt_required()
+def cancel_backtest(job_id):
+    ok, msg = BACKTEST_SCHEDULER.cancel(job_id, get_jwt_identity())
+    return jsonify({"success": ok, "message": msg}), (200 if ok else 404)
+
+@app.route('/trades', methods=['GET'])
+@jwt_required()
+def list_trades():
+    """Histórico paginado por cursor: `before` (id do último trade recebido), `limit` e `symbol` opcionais."""
+    try:
+        trades, next_cursor = paper_trader.history.page(request.args.get('before', type=int), request.args.get('limit', 50, type=int), request.args.get('symbol') or None)
+    except Exception as e:
+        log_error.error(f"Erro /trades: {e}")
+        return jsonify({"success": False, "message": "Erro ao consultar histórico"}), 500
+    if wants_columnar(request): trades = to_columns(trades, TRADE_FIELDS)
+    return jsonify({"success": True, "trades": trades, "next_cursor": next_cursor, "aggregates": paper_trader.history.aggregates()})
+
 @app.route('/logout', methods=['POST'])
 @jwt_required()
 def logout_system(): return jsonify({"success": True}) 
@@ -582,7 +919,9 @@ def get_global_stats(): return jsonify(stats_manager.get_stats()) if HAS_STATS e
 
 @app.route('/liquidate', methods=['POST'])
 @jwt_required()
-def liquidate_assets(): paper_trader.position = None; return jsonify({"success": True})
+def liquidate_assets():
+    with trading_section() as trader: trader.position = None; trader.save_state()
+    return jsonify({"success": True})
 
 @app.route('/')
 def serve_react():
@@ -592,6 +931,8 @@ def serve_react():
 def open_browser(): time.sleep(1.5); webbrowser.open("http://127.0.0.1:5000")
 
 if __name__ == '__main__':
+    # Necessário para o pool de processos do Sweep no executável congelado (PyInstaller/Windows)
+    multiprocessing.freeze_support()
     print(f"🚀 SniperBot Pro [DB + ASYNC] -> http://127.0.0.1:5000")
     threading.Thread(target=open_browser, daemon=True).start()
     app.run(debug=False, port=5000, threaded=True, use_reloader=False)
\ No newline at end of file
@@ -0,0 +1,69 @@
+import threading
+import time
+from collections import OrderedDict
+from metrics import metrics
+
+class _Call:
+    __slots__ = ("event", "result", "error")
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Agrupa chamadas concorrentes com a mesma chave: só a primeira executa, as demais
+    esperam e recebem o MESMO resultado (que deve ser tratado como somente leitura).
+    Resultados válidos (não None) ficam num cache curto de `ttl` segundos.
+    """
+    def __init__(self, name, ttl=0.0, max_entries=256):
+        self.name = name
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._inflight = {}
+        self._cache = OrderedDict()  # chave -> (instante, resultado), em ordem de inserção
+        self._lock = threading.Lock()
+
+    def do(self, key, fn):
+        with self._lock:
+            cached = self._cache.get(key)
+            if cached and time.time() - cached[0] < self.ttl:
+                metrics.inc('sniper_singleflight_total', group=self.name, result='cache')
+                return cached[1]
+            call = self._inflight.get(key)
+            leader = call is None
+            if leader:
+                call = _Call()
+                self._inflight[key] = call
+
+        if not leader:
+            metrics.inc('sniper_singleflight_total', group=self.name, result='shared')
+            call.event.wait()
+            if call.error is not None: raise call.error
+            return call.result
+
+        metrics.inc('sniper_singleflight_total', group=self.name, result='miss')
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                self._inflight.pop(key, None)
+                if call.error is None and call.result is not None and self.ttl > 0:
+                    self._cache.pop(key, None)
+                    self._cache[key] = (time.time(), call.result)
+                    while len(self._cache) > self.max_entries: self._cache.popitem(last=False)
+            call.event.set()
+
+    def invalidate(self, key=None):
+        with self._lock:
+            if key is None: self._cache.clear()
+            else: self._cache.pop(key, None)
+
+
+metrics.describe("sniper_singleflight_total", "counter", "Chamadas de dados por resultado (miss = executou, shared/cache = reaproveitou)")
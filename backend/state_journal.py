@@ -0,0 +1,126 @@
+import json
+import os
+import threading
+import time
+from logger import log_error
+from metrics import metrics
+
+class StateJournal:
+    """
+    Persistência write-behind do estado do PaperTrader.
+
+    - `append(registro)`: só memória (microssegundos), pode ser chamado dentro do TRADING_LOCK;
+    - um thread grava os registros pendentes no journal (uma linha JSON cada) e faz UM fsync
+      por lote (group commit): vários save_state seguidos custam um único fsync;
+    - `wait(seq)`: bloqueia até o registro estar no disco (chamado fora da seção crítica);
+    - a cada `checkpoint_interval` o último registro durável vai para o SQLite e o journal é zerado;
+    - `recover()`: no load_state, devolve o estado mais novo que o SQLite (sobra de um crash
+      ou, com o journal rodando, o último registro recebido).
+
+    Cada registro é o estado COMPLETO: no replay só a última linha íntegra importa.
+    """
+    def __init__(self, path, checkpoint, checkpoint_interval=5.0):
+        self.path = path
+        self.checkpoint_fn = checkpoint  # checkpoint(registro) -> grava no SQLite
+        self.checkpoint_interval = checkpoint_interval
+        self._pending = []          # (seq, registro, linha JSON)
+        self._seq = 0
+        self._durable_seq = 0
+        self._durable_record = None # (seq, registro) mais novo já no disco
+        self._latest = None         # Registro mais novo recebido (mesmo ainda não durável)
+        self._checkpoint_seq = 0
+        self._cond = threading.Condition()
+        self._file = None
+        self._thread = None
+
+    def start(self):
+        if self._thread: return
+        self._file = open(self.path, 'a', encoding='utf-8')
+        self._thread = threading.Thread(target=self._run, daemon=True, name="state-journal")
+        self._thread.start()
+
+    def append(self, record):
+        line = json.dumps(record, separators=(',', ':'), default=str)
+        with self._cond:
+            self._seq += 1
+            self._pending.append((self._seq, record, line))
+            self._latest = record
+            self._cond.notify_all()
+            return self._seq
+
+    def wait(self, seq, timeout=5.0):
+        """True quando `seq` já está no disco."""
+        with self._cond:
+            ok = self._cond.wait_for(lambda: self._durable_seq >= seq, timeout)
+        if not ok: log_error.error(f"⚠️ Journal de estado atrasado (seq {seq})")
+        return ok
+
+    def _run(self):
+        last_checkpoint = time.time()
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending, timeout=self.checkpoint_interval)
+                batch, self._pending = self._pending, []
+            if batch:
+                try:
+                    start = time.perf_counter()
+                    self._file.write(''.join(line + '\n' for _, _, line in batch))
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+                    metrics.observe('sniper_state_journal_fsync_seconds', time.perf_counter() - start)
+                    metrics.inc('sniper_state_journal_records_total', value=len(batch))
+                    with self._cond:
+                        self._durable_seq = batch[-1][0]
+                        self._durable_record = (batch[-1][0], batch[-1][1])
+                        self._cond.notify_all()
+                except Exception as e:
+                    log_error.error(f"Erro journal de estado: {e}")
+                    with self._cond: # Devolve o lote para a próxima tentativa
+                        self._pending[:0] = batch
+                    time.sleep(1)
+                    continue
+            if time.time() - last_checkpoint >= self.checkpoint_interval:
+                self.checkpoint()
+                last_checkpoint = time.time()
+
+    def checkpoint(self):
+        """Grava no SQLite o último registro durável e zera o journal (só roda no thread de escrita)."""
+        durable = self._durable_record
+        if not durable or durable[0] <= self._checkpoint_seq: return
+        try:
+            self.checkpoint_fn(durable[1])
+            self._checkpoint_seq = durable[0]
+            # Mesmo thread que escreve: o arquivo contém exatamente até `durable`, tudo já no SQLite
+            self._file.truncate(0)
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        except Exception as e:
+            log_error.error(f"Erro checkpoint do estado: {e}")
+
+    def recover(self):
+        """
+        Estado mais novo que o SQLite, ou None.
+        Antes de start(): última linha íntegra do arquivo (crash sem checkpoint), já aplicada no SQLite
+        via checkpoint (chamar dentro do app context). Depois: o último registro recebido em memória.
+        """
+        if self._thread:
+            with self._cond: return self._latest
+        if not os.path.exists(self.path): return None
+        record = None
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try: record = json.loads(line)
+                except ValueError: break # Linha cortada pelo crash: as anteriores valem
+        if record is None: return None
+        log_error.warning("♻️ Estado recuperado do journal (encerramento sem checkpoint)")
+        try: self.checkpoint_fn(record)
+        except Exception as e:
+            log_error.error(f"Erro checkpoint do estado recuperado: {e}")
+            return record # Journal fica intacto até um checkpoint dar certo
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.flush(); os.fsync(f.fileno())
+        return record
+
+
+metrics.describe("sniper_state_journal_fsync_seconds", "histogram", "Duração de cada fsync em lote do journal de estado")
+metrics.describe("sniper_state_journal_records_total", "counter", "Registros de estado gravados no journal")
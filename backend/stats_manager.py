@@ -1,69 +1,211 @@
+import atexit
 import json
 import os
+import sys
+import threading
 import time
+from logger import log_error
+from metrics import metrics
+
+# Arquivos de runtime em data/ ao lado do código (no executável, ao lado do .exe), fora do controle de versão
+if getattr(sys, 'frozen', False):
+    BASE_DIR = os.path.dirname(sys.executable)
+else:
+    BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+STATS_DIR = os.path.join(BASE_DIR, "data")
+
+STATS_FILE = os.path.join(STATS_DIR, "trade_stats.json")  # Snapshot (agregados + seq do último evento)
+STATS_LOG = os.path.join(STATS_DIR, "trade_stats.log")    # Eventos depois do snapshot, uma linha JSON cada
+# Versões antigas: snapshot ao lado do código ou relativo ao cwd (migrado no primeiro load)
+LEGACY_STATS_FILES = (os.path.join(BASE_DIR, "trade_stats.json"), "trade_stats.json")
+SNAPSHOT_INTERVAL = 60.0
+
+def empty_stats():
+    return {
+        "seq": 0,
+        "total_trades": 0, "wins": 0, "losses": 0,
+        "gross_profit": 0.0, "gross_loss": 0.0,   # gross_loss negativo (soma dos prejuízos)
+        "best_trade": 0.0, "worst_trade": 0.0,
+        "current_streak": 0,                       # > 0 vitórias seguidas, < 0 derrotas seguidas
+        "max_win_streak": 0, "max_loss_streak": 0,
+        "accumulated_uptime": 0,                   # Segundos acumulados de sessões anteriores
+    }
+
+def apply_trade(data, trade_result):
+    """Atualiza os agregados com um trade (O(1)). trade_result > 0 é win, senão loss."""
+    data["total_trades"] += 1
+    if trade_result > 0:
+        data["wins"] += 1
+        data["gross_profit"] += trade_result
+        data["current_streak"] = max(data["current_streak"], 0) + 1
+        data["max_win_streak"] = max(data["max_win_streak"], data["current_streak"])
+    else:
+        data["losses"] += 1
+        data["gross_loss"] += trade_result
+        data["current_streak"] = min(data["current_streak"], 0) - 1
+        data["max_loss_streak"] = max(data["max_loss_streak"], -data["current_streak"])
+    if data["total_trades"] == 1:
+        data["best_trade"] = data["worst_trade"] = trade_result
+    else:
+        data["best_trade"] = max(data["best_trade"], trade_result)
+        data["worst_trade"] = min(data["worst_trade"], trade_result)
 
-STATS_FILE = "trade_stats.json"
 
 class StatsManager:
-    def __init__(self):
+    """
+    Estatísticas globais do bot (todas as sessões).
+
+    - `update_trades(resultado)`: atualiza os agregados em memória e enfileira o evento (sem I/O);
+    - um thread grava os eventos pendentes no log append-only com UM fsync por lote;
+    - a cada `snapshot_interval` os agregados vão para o snapshot (arquivo temporário + os.replace,
+      nunca fica meio escrito) e o log é zerado;
+    - no startup: snapshot + eventos do log com seq maior que o do snapshot.
+    """
+    def __init__(self, path=STATS_FILE, log_path=STATS_LOG, snapshot_interval=SNAPSHOT_INTERVAL):
+        self.path = path
+        self.log_path = log_path
+        self.snapshot_interval = snapshot_interval
+        self._cond = threading.Condition()
+        self._io_lock = threading.Lock()  # Snapshot/log: thread de escrita e persist_uptime
+        self._pending = []
+        self._file = None
         self.start_time = time.time()
+        os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
         self.load_stats()
+        self._thread = threading.Thread(target=self._run, daemon=True, name="stats-log")
+        self._thread.start()
+        atexit.register(self.persist_uptime)
 
     def load_stats(self):
-        if os.path.exists(STATS_FILE):
+        data = empty_stats()
+        source = next((p for p in (self.path,) + LEGACY_STATS_FILES if os.path.exists(p)), None)
+        if source:
             try:
-                with open(STATS_FILE, 'r') as f:
-                    self.data = json.load(f)
-            except:
-                self.reset_data()
-        else:
-            self.reset_data()
+                with open(source, 'r') as f:
+                    data.update(json.load(f))
+            except Exception as e:
+                log_error.error(f"Erro ao ler snapshot de estatísticas: {e}")
+        replayed = 0
+        if os.path.exists(self.log_path):
+            with open(self.log_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    try: event = json.loads(line)
+                    except ValueError: break # Linha cortada por um crash: as anteriores valem
+                    if event["seq"] <= data["seq"]: continue # Já está no snapshot
+                    apply_trade(data, event["result"])
+                    data["seq"] = event["seq"]
+                    replayed += 1
+        with self._cond:
+            self.data = data
+        if replayed: log_error.warning(f"♻️ Estatísticas: {replayed} trade(s) recuperados do log")
+        if (source and source != self.path) or replayed: self._write_snapshot() # Migra o arquivo antigo / absorve o log
 
     def reset_data(self):
-        self.data = {
-            "total_trades": 0,
-            "wins": 0,
-            "losses": 0,
-            "accumulated_uptime": 0  # Segundos acumulados de sessões anteriores
-        }
-        self.save_stats()
-        self.start_time = time.time() # Reinicia contagem de tempo da sessão
+        with self._cond:
+            self._pending.clear()
+            seq = self.data["seq"] # seq nunca volta: linhas antigas no log continuam ignoradas
+            self.data = empty_stats()
+            self.data["seq"] = seq
+            self.start_time = time.time() # Reinicia contagem de tempo da sessão
+        self._write_snapshot()
 
     def save_stats(self):
-        with open(STATS_FILE, 'w') as f:
-            json.dump(self.data, f)
+        self._write_snapshot()
 
     def update_trades(self, trade_result):
         # trade_result deve ser > 0 para win, < 0 para loss
-        self.data["total_trades"] += 1
-        if trade_result > 0:
-            self.data["wins"] += 1
-        else:
-            self.data["losses"] += 1
-        self.save_stats()
+        with self._cond:
+            apply_trade(self.data, trade_result)
+            self.data["seq"] += 1
+            self._pending.append(json.dumps({"seq": self.data["seq"], "t": int(time.time()), "result": trade_result}))
+            self._cond.notify_all()
 
     def get_stats(self):
-        current_session_time = time.time() - self.start_time
-        total_time = self.data.get("accumulated_uptime", 0) + current_session_time
-        
-        total = self.data["total_trades"]
-        wins = self.data["wins"]
+        with self._cond:
+            d = dict(self.data)
+            total_time = d["accumulated_uptime"] + (time.time() - self.start_time)
+
+        total = d["total_trades"]
+        wins, losses = d["wins"], d["losses"]
         winrate = (wins / total * 100) if total > 0 else 0
+        avg_win = d["gross_profit"] / wins if wins else 0
+        avg_loss = d["gross_loss"] / losses if losses else 0
 
         return {
             "total_trades": total,
             "win_rate": round(winrate, 1),
             "uptime_seconds": int(total_time),
             "wins": wins,
-            "losses": self.data["losses"]
+            "losses": losses,
+            "pnl": round(d["gross_profit"] + d["gross_loss"], 4),
+            "expectancy": round((d["gross_profit"] + d["gross_loss"]) / total, 4) if total else 0,
+            "avg_win": round(avg_win, 4), "avg_loss": round(avg_loss, 4),
+            "profit_factor": round(d["gross_profit"] / -d["gross_loss"], 2) if d["gross_loss"] else None,
+            "best_trade": d["best_trade"], "worst_trade": d["worst_trade"],
+            "current_streak": d["current_streak"],
+            "max_win_streak": d["max_win_streak"], "max_loss_streak": d["max_loss_streak"],
         }
-    
+
     def persist_uptime(self):
-        # Chama isso ao desligar ou periodicamente para salvar o tempo
-        current_session_time = time.time() - self.start_time
-        self.data["accumulated_uptime"] += current_session_time
-        self.start_time = time.time() # Reseta o marco para não duplicar
-        self.save_stats()
+        # Chamado no desligamento (atexit); o snapshot periódico já guarda o tempo de sessão
+        self._flush_log()
+        self._write_snapshot()
+
+    def _run(self):
+        last_snapshot = time.time()
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending, timeout=self.snapshot_interval)
+            self._flush_log()
+            if time.time() - last_snapshot >= self.snapshot_interval:
+                self._write_snapshot()
+                last_snapshot = time.time()
+
+    def _flush_log(self):
+        with self._io_lock:
+            with self._cond:
+                batch, self._pending = self._pending, []
+            if not batch: return
+            try:
+                start = time.perf_counter()
+                if self._file is None: self._file = open(self.log_path, 'a', encoding='utf-8')
+                self._file.write(''.join(line + '\n' for line in batch))
+                self._file.flush()
+                os.fsync(self._file.fileno())
+                metrics.observe('sniper_stats_log_fsync_seconds', time.perf_counter() - start)
+            except Exception as e:
+                log_error.error(f"Erro log de estatísticas: {e}")
+                with self._cond: # Devolve o lote para a próxima tentativa
+                    self._pending[:0] = batch
+
+    def _write_snapshot(self):
+        """
+        Grava os agregados atuais (com o tempo da sessão somado) e zera o log.
+        Eventos ainda pendentes já estão nos agregados; quando forem gravados no log novo,
+        o replay os ignora pelo seq.
+        """
+        with self._io_lock:
+            with self._cond:
+                now = time.time()
+                self.data["accumulated_uptime"] += now - self.start_time
+                self.start_time = now # Reseta o marco para não duplicar
+                data = dict(self.data)
+            tmp = f"{self.path}.tmp"
+            try:
+                with open(tmp, 'w') as f:
+                    json.dump(data, f)
+                    f.flush(); os.fsync(f.fileno())
+                os.replace(tmp, self.path)
+                if self._file is None: self._file = open(self.log_path, 'a', encoding='utf-8')
+                self._file.truncate(0)
+                self._file.flush(); os.fsync(self._file.fileno())
+                metrics.inc('sniper_stats_snapshots_total')
+            except Exception as e:
+                log_error.error(f"Erro snapshot de estatísticas: {e}")
+
+
+metrics.describe("sniper_stats_log_fsync_seconds", "histogram", "Duração de cada fsync em lote do log de estatísticas")
+metrics.describe("sniper_stats_snapshots_total", "counter", "Snapshots atômicos das estatísticas globais")
 
 # Instância global
-stats_manager = StatsManager()
\ No newline at end of file
+stats_manager = StatsManager()
@@ -0,0 +1,99 @@
+import argparse
+import hashlib
+import itertools
+import json
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from urllib.parse import parse_qs
+
+# Stub local da Bot API do Telegram (sendMessage / sendPhoto) para testar as notificações sem
+# mandar nada de verdade. Uso:
+#   python telegram_stub.py --port 8081 [--rate-limit-every 5] [--retry-after 2] [--latency 0.2]
+#   SNIPER_TELEGRAM_API=http://127.0.0.1:8081 python server.py
+# Fotos enviadas por URL recebem um file_id; file_ids desconhecidos (ex: stub reiniciado) voltam 400,
+# como o Telegram faz com file_id de outro bot.
+
+class TelegramStub:
+    def __init__(self, rate_limit_every=0, retry_after=1, latency=0.0):
+        self.rate_limit_every = rate_limit_every  # A cada N requisições, responde 429
+        self.retry_after = retry_after
+        self.latency = latency
+        self.messages = []  # (instante, chat_id, método, texto, foto) entregues
+        self.file_ids = set()
+        self._count = itertools.count(1)
+        self._message_id = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def handle(self, method, fields):
+        """Retorna (status HTTP, corpo JSON) no formato da Bot API."""
+        if self.latency: time.sleep(self.latency)
+        if method not in ("sendMessage", "sendPhoto"):
+            return 404, {"ok": False, "error_code": 404, "description": "Not Found"}
+        if self.rate_limit_every and next(self._count) % self.rate_limit_every == 0:
+            return 429, {"ok": False, "error_code": 429, "description": f"Too Many Requests: retry after {self.retry_after}",
+                         "parameters": {"retry_after": self.retry_after}}
+
+        chat_id = fields.get("chat_id")
+        if not chat_id: return 400, {"ok": False, "error_code": 400, "description": "Bad Request: chat not found"}
+        result = {"message_id": next(self._message_id), "chat": {"id": chat_id}, "date": int(time.time())}
+        photo = fields.get("photo")
+        if method == "sendPhoto":
+            if not photo.startswith("http") and photo not in self.file_ids:
+                return 400, {"ok": False, "error_code": 400, "description": "Bad Request: wrong file identifier/HTTP URL specified"}
+            file_id = photo if not photo.startswith("http") else "stub-" + hashlib.sha1(photo.encode()).hexdigest()[:16]
+            self.file_ids.add(file_id)
+            result["photo"] = [{"file_id": file_id + "-thumb", "file_size": 1000}, {"file_id": file_id, "file_size": 50000}]
+            result["caption"] = fields.get("caption")
+        else:
+            result["text"] = fields.get("text")
+        with self._lock:
+            self.messages.append((time.time(), chat_id, method, fields.get("text") or fields.get("caption"), photo))
+        return 200, {"ok": True, "result": result}
+
+
+def make_handler(stub, verbose=True):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # Keep-alive, como o api.telegram.org
+
+        def log_message(self, *args): pass
+
+        def do_POST(self):
+            # /bot<token>/<método>
+            parts = self.path.strip("/").split("/")
+            method = parts[1] if len(parts) == 2 and parts[0].startswith("bot") else ""
+            raw = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8")
+            if "json" in (self.headers.get("Content-Type") or ""): fields = json.loads(raw or "{}")
+            else: fields = {k: v[0] for k, v in parse_qs(raw).items()}
+            status, body = stub.handle(method, fields)
+            if verbose:
+                text = (fields.get("text") or fields.get("caption") or "").split("\n")[0]
+                print(f"{'✅' if status == 200 else '⛔'} {status} {method} chat={fields.get('chat_id')} | {text}")
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+    return Handler
+
+
+def serve(port=8081, stub=None, verbose=True):
+    """Sobe o stub em 127.0.0.1:`port` (port=0 escolhe uma porta livre). Retorna o servidor."""
+    stub = stub or TelegramStub()
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(stub, verbose))
+    server.stub = stub
+    return server
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stub local da Bot API do Telegram")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--rate-limit-every", type=int, default=0, help="Responde 429 a cada N requisições")
+    parser.add_argument("--retry-after", type=int, default=1)
+    parser.add_argument("--latency", type=float, default=0.0, help="Atraso artificial por requisição (s)")
+    args = parser.parse_args()
+    server = serve(args.port, TelegramStub(args.rate_limit_every, args.retry_after, args.latency))
+    print(f"🧪 Stub do Telegram em http://127.0.0.1:{server.server_port} (SNIPER_TELEGRAM_API)")
+    try: server.serve_forever()
+    except KeyboardInterrupt: pass
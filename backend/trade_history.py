@@ -0,0 +1,111 @@
+import threading
+from collections import deque
+from sqlalchemy import func, case
+from database import db, Trade
+
+RECENT_LIMIT = 50
+MAX_PAGE_SIZE = 200
+TRADE_FIELDS = ("id", "exit_time", "symbol", "side", "invested", "profit_usd", "profit_pct", "result", "reason")
+
+def trade_to_dict(trade):
+    return {f: getattr(trade, f) for f in TRADE_FIELDS}
+
+
+class TradeHistory:
+    """
+    Visão em memória da tabela Trade (o PaperTrader é o único que escreve nela).
+
+    Carregada uma vez do SQLite; depois cada trade fechado atualiza os últimos N trades e os
+    agregados (win rate, PnL, contagem por ativo) de forma incremental. Os ids são atribuídos
+    aqui, então o trade já tem id antes da gravação (que fica para fora da seção crítica).
+    Leitores recebem uma visão publicada por inteiro a cada mudança: o polling não toca no banco.
+    """
+    def __init__(self, limit=RECENT_LIMIT):
+        self.limit = limit
+        self._lock = threading.Lock()
+        self._clear()
+
+    def _clear(self):
+        self._recent = deque(maxlen=self.limit)  # Mais recente primeiro
+        self._next_id = 1
+        self._totals = {"total_trades": 0, "wins": 0, "pnl": 0.0}
+        self._by_symbol = {}
+        self._publish()
+
+    def _publish(self):
+        total, wins = self._totals["total_trades"], self._totals["wins"]
+        aggregates = {
+            "total_trades": total, "wins": wins, "losses": total - wins,
+            "win_rate": (wins / total * 100) if total else 0, "pnl": self._totals["pnl"],
+            "by_symbol": {sym: dict(v) for sym, v in self._by_symbol.items()},
+        }
+        self.view = (list(self._recent), aggregates)
+
+    def _apply(self, symbol, profit):
+        win = profit > 0
+        self._totals["total_trades"] += 1
+        self._totals["wins"] += win
+        self._totals["pnl"] += profit
+        sym = self._by_symbol.setdefault(symbol, {"trades": 0, "wins": 0, "pnl": 0.0})
+        sym["trades"] += 1; sym["wins"] += win; sym["pnl"] += profit
+
+    def load(self):
+        """Carga inicial do SQLite (startup / troca de ambiente). Chamar dentro do app context."""
+        rows = Trade.query.order_by(Trade.id.desc()).limit(self.limit).all()
+        per_symbol = db.session.query(
+            Trade.symbol, func.count(Trade.id),
+            func.sum(case((Trade.profit_usd > 0, 1), else_=0)), func.coalesce(func.sum(Trade.profit_usd), 0.0)
+        ).group_by(Trade.symbol).all()
+        max_id = db.session.query(func.max(Trade.id)).scalar() or 0
+        with self._lock:
+            self._clear()
+            self._recent.extend(trade_to_dict(t) for t in rows)
+            self._next_id = max_id + 1
+            for symbol, count, wins, pnl in per_symbol:
+                self._by_symbol[symbol] = {"trades": count, "wins": int(wins or 0), "pnl": float(pnl or 0)}
+                self._totals["total_trades"] += count
+                self._totals["wins"] += int(wins or 0)
+                self._totals["pnl"] += float(pnl or 0)
+            self._publish()
+
+    def record(self, fields):
+        """Registra um trade fechado (só memória) e devolve o dict com o id atribuído, pronto para gravar."""
+        with self._lock:
+            trade = {"id": self._next_id, **fields}
+            self._next_id += 1
+            self._recent.appendleft(trade)
+            self._apply(trade["symbol"], trade["profit_usd"] or 0.0)
+            self._publish()
+            return dict(trade)
+
+    def reset(self):
+        """Banca resetada: histórico apagado (a exclusão no banco é feita pelo chamador)."""
+        with self._lock:
+            next_id = self._next_id # Ids não são reaproveitados (o stream compara ids)
+            self._clear()
+            self._next_id = next_id
+
+    def recent(self):
+        return self.view[0]
+
+    def aggregates(self):
+        return self.view[1]
+
+    def page(self, before=None, limit=RECENT_LIMIT, symbol=None):
+        """
+        Página do histórico completo por cursor (id decrescente). Retorna (trades, próximo cursor ou None).
+        A primeira página sem filtro sai da memória; as demais usam o índice (symbol, id).
+        """
+        limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+        if before is None and symbol is None and limit <= self.limit:
+            recent = self.recent()
+            if len(recent) < self.limit or limit < len(recent):
+                items = recent[:limit]
+                more = len(recent) > limit
+                return items, (items[-1]["id"] if more and items else None)
+        query = Trade.query
+        if symbol: query = query.filter(Trade.symbol == symbol)
+        if before is not None: query = query.filter(Trade.id < before)
+        rows = query.order_by(Trade.id.desc()).limit(limit + 1).all()
+        items = [trade_to_dict(t) for t in rows[:limit]]
+        return items, (items[-1]["id"] if len(rows) > limit else None)
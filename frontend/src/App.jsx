@@ -13,6 +13,7 @@ import { LineChart, Line, XAxis, YAxis, Tooltip, ResponsiveContainer, CartesianG
 import TVChart from './components/TVChart';
 import TradeStats from './components/TradeStats';
 import Auth from './components/Auth';
+import { fromColumns, mergeCandles } from './columnar';
 
 // --- UTILITÁRIOS ---
 const playAudio = (type) => {
@@ -685,7 +686,7 @@ export default function App() {
       return ( <> <Toaster position="top-right" toastOptions={{ style: { background: '#1e293b', color: '#fff' } }} /> <Auth onLoginSuccess={(t) => setToken(t)} /> </> );
   }
 
-  return <Dashboard authFetch={authFetch} onLogout={handleLogout} />;
+  return <Dashboard authFetch={authFetch} onLogout={handleLogout} token={token} />;
 }
 
 
@@ -702,6 +703,8 @@ const BacktestModal = ({ isOpen, onClose, authFetch }) => {
     // Estados do Polling
     const [progress, setProgress] = useState(0);
     const [loadingText, setLoadingText] = useState("PRONTO");
+    const [jobId, setJobId] = useState(null);
+    const [cancelling, setCancelling] = useState(false);
 
     const PERIOD_OPTIONS = [
         { label: "1 Semana (Teste Rápido)", value: 7 },
@@ -713,6 +716,28 @@ const BacktestModal = ({ isOpen, onClose, authFetch }) => {
 
     if (!isOpen) return null;
 
+    // Cancelamento cooperativo: o servidor interrompe o job no próximo checkpoint (download ou simulação)
+    // e o polling recebe state === 'cancelled'
+    const cancelBacktest = async () => {
+        if (!jobId || cancelling) return;
+        setCancelling(true);
+        try {
+            const res = await authFetch(`http://127.0.0.1:5000/backtest/cancel/${jobId}`, { method: 'POST' });
+            const data = await res.json();
+            if (!data.success) { toast.error(data.message || "Não foi possível cancelar."); setCancelling(false); }
+            else setLoadingText("CANCELANDO...");
+        } catch (e) {
+            toast.error("Erro de conexão.");
+            setCancelling(false);
+        }
+    };
+
+    const finishJob = () => {
+        setLoading(false);
+        setJobId(null);
+        setCancelling(false);
+    };
+
     const runBacktest = async () => {
         setLoading(true);
         setResults(null);
@@ -728,34 +753,51 @@ const BacktestModal = ({ isOpen, onClose, authFetch }) => {
             const startData = await startRes.json();
 
             if (!startData.success || !startData.job_id) {
-                throw new Error("Falha ao iniciar Job.");
+                throw new Error(startData.message || "Falha ao iniciar Job.");
             }
 
             const jobId = startData.job_id;
+            setJobId(jobId);
 
             // 2. POLLING LOOP (Pergunta a cada 1s)
             const intervalId = setInterval(async () => {
                 try {
-                    const statusRes = await authFetch(`http://127.0.0.1:5000/backtest/status/${jobId}`);
+                    // Curva reduzida (LTTB) com ~1 ponto por pixel do gráfico
+                    const points = Math.min(Math.round(window.innerWidth), 2000);
+                    const statusRes = await authFetch(`http://127.0.0.1:5000/backtest/status/${jobId}?format=columnar&points=${points}`);
                     const statusData = await statusRes.json();
 
                     if (statusData.error) {
                         clearInterval(intervalId);
                         toast.error(`Erro no Backtest: ${statusData.error}`);
-                        setLoading(false);
+                        finishJob();
+                        return;
+                    }
+
+                    if (statusData.state === 'cancelled') {
+                        clearInterval(intervalId);
+                        toast("Backtest cancelado.");
+                        finishJob();
                         return;
                     }
 
                     // Atualiza Visual
                     setProgress(statusData.progress);
-                    setLoadingText(statusData.message || "PROCESSANDO...");
+                    if (statusData.state === 'queued') {
+                        const eta = statusData.eta_seconds != null ? ` (~${Math.ceil(statusData.eta_seconds)}s)` : "";
+                        setLoadingText(`NA FILA: POSIÇÃO ${statusData.queue_position}${eta}`);
+                    } else {
+                        setLoadingText(statusData.message || "PROCESSANDO...");
+                    }
 
                     // Verifica se acabou
                     if (statusData.progress >= 100 && statusData.result) {
                         clearInterval(intervalId);
-                        setResults(statusData.result); // Carrega o resultado final
+                        const result = statusData.result;
+                        // Colunas -> linhas uma única vez (recharts e a tabela trabalham com objetos)
+                        setResults({ ...result, equity_curve: fromColumns(result.equity_curve), trades: fromColumns(result.trades) }); // Carrega o resultado final
                         toast.success("Backtest Concluído!");
-                        setLoading(false);
+                        finishJob();
                     }
                 } catch (pollErr) {
                     // Se falhar o poll, não para tudo, tenta de novo
@@ -764,8 +806,8 @@ const BacktestModal = ({ isOpen, onClose, authFetch }) => {
             }, 1000); // 1 segundo de intervalo
 
         } catch (e) { 
-            toast.error("Erro de conexão."); 
-            setLoading(false);
+            toast.error(e.message || "Erro de conexão."); 
+            finishJob();
         }
     };
 
@@ -855,6 +897,9 @@ const BacktestModal = ({ isOpen, onClose, authFetch }) => {
                                         Isso pode demorar alguns minutos dependendo do período.<br/>
                                         Não feche a janela.
                                     </p>
+                                    <button onClick={cancelBacktest} disabled={!jobId || cancelling} className="mx-auto flex items-center gap-2 px-4 py-2 text-[10px] font-bold rounded-lg border border-rose-500/40 text-rose-400 hover:bg-rose-500 hover:text-white transition-all disabled:opacity-40 disabled:cursor-not-allowed">
+                                        <X className="w-3 h-3"/> {cancelling ? "CANCELANDO..." : "CANCELAR"}
+                                    </button>
                                 </div>
                             </div>
                         )}
@@ -1031,7 +1076,7 @@ const BacktestModal = ({ isOpen, onClose, authFetch }) => {
 };
 
 
-function Dashboard({ authFetch, onLogout }) {
+function Dashboard({ authFetch, onLogout, token }) {
   const [isRunning, setIsRunning] = useState(false);
   const [isTestnet, setIsTestnet] = useState(true);
   const [error, setError] = useState(null);
@@ -1044,6 +1089,7 @@ function Dashboard({ authFetch, onLogout }) {
   const [showBacktest, setShowBacktest] = useState(false); 
   const [authStatus, setAuthStatus] = useState({ has_name: false, has_real: false, has_telegram: false });
   const isFirstLoad = useRef(true);
+  const lastPayload = useRef(null); // Último estado completo do backend (base para aplicar os deltas do stream)
 
   const [marketData, setMarketData] = useState(() => {
     const saved = localStorage.getItem('sniper_last_market_data');
@@ -1142,13 +1188,8 @@ function Dashboard({ authFetch, onLogout }) {
 
   const handleRiskChange = (newVal) => { setRiskPct(newVal); authFetch('http://127.0.0.1:5000/config', { method: 'POST', body: JSON.stringify({ risk_percentage: newVal }) }).catch(console.error); };
 
-  const fetchMarketData = async (forceUpdate = false) => {
-    try {
-      // AGORA USAMOS authFetch
-      const response = await authFetch('http://127.0.0.1:5000/market');
-      if (!response.ok) throw new Error('Falha');
-      const data = await response.json();
-      
+  const applyMarketPayload = (data, forceUpdate = false) => {
+      lastPayload.current = data;
       const isImmune = (Date.now() - lastToggleTime.current) < 5000; 
       if (!isImmune || forceUpdate) { if (data.is_running !== undefined) setIsRunning(data.is_running); }
       if (data.symbol && data.symbol !== "" && !isCommandPending.current) { setCurrentSymbol(data.symbol); }
@@ -1170,9 +1211,35 @@ function Dashboard({ authFetch, onLogout }) {
           isFirstLoad.current = false;
       }
       setError(null);
+  };
+
+  const fetchMarketData = async (forceUpdate = false) => {
+    try {
+      // AGORA USAMOS authFetch
+      const response = await authFetch('http://127.0.0.1:5000/market?format=columnar');
+      if (!response.ok) throw new Error('Falha');
+      applyMarketPayload(await response.json(), forceUpdate);
     } catch (err) { if(!error) setError("Backend Offline"); setMarketData(prev => ({...prev, connectionStatus: 'offline'})); }
   };
 
+  // --- DELTAS DO STREAM (/market/stream) ---
+  const applyCandleDelta = (delta) => {
+      const base = lastPayload.current;
+      const key = delta.tf === '5m' ? 'data_5m' : 'data_1h';
+      if (!base || !base[key] || base.symbol !== delta.symbol) return;
+      const candles = mergeCandles(base[key].candles, delta.candles, delta.max_candles);
+      applyMarketPayload({ ...base, [key]: { ...base[key], ...delta.summary, candles } });
+  };
+
+  const applyStatusDelta = (delta) => {
+      const base = lastPayload.current;
+      if (!base) return;
+      const { new_trades, ...fields } = delta;
+      const next = { ...base, ...fields };
+      if (new_trades) next.trade_history = [...new_trades, ...(base.trade_history || [])].slice(0, 50);
+      applyMarketPayload(next);
+  };
+
   useEffect(() => {
       if (!prevActiveTrade.current && marketData.activeTrade) { playAudio('ENTRY'); toast.success(`Entrada: ${marketData.activeTrade.symbol}`, { style: { background: '#064e3b', color: '#fff' } }); }
       if (prevActiveTrade.current && !marketData.activeTrade && marketData.tradeHistory.length > prevHistoryLength.current) {
@@ -1186,22 +1253,37 @@ function Dashboard({ authFetch, onLogout }) {
   
 useEffect(() => {
     let isMounted = true; // Flag para saber se o componente ainda existe
+    let pollTimer = null;
 
+    // Polling antigo: só roda enquanto o stream está fora do ar
     const loop = async () => {
-        if (!isMounted) return; // Se desmontou (logout), para tudo
+        if (!isMounted || !pollTimer) return; // Se desmontou (logout) ou o stream voltou, para tudo
         
         await fetchMarketData();
         
         // Só agenda o próximo se ainda estiver montado e autenticado
-        if (isMounted) {
-            setTimeout(loop, 2000);
+        if (isMounted && pollTimer) {
+            pollTimer = setTimeout(loop, 2000);
         }
     };
+    const startPolling = () => { if (!pollTimer) pollTimer = setTimeout(loop, 0); };
+    const stopPolling = () => { if (pollTimer) { clearTimeout(pollTimer); pollTimer = null; } };
+
+    if (typeof EventSource === 'undefined') {
+        startPolling();
+        return () => { isMounted = false; stopPolling(); };
+    }
 
-    loop();
+    // Stream SSE: snapshot ao conectar + deltas (o navegador reconecta sozinho)
+    const stream = new EventSource(`http://127.0.0.1:5000/market/stream?format=columnar&token=${encodeURIComponent(token)}`);
+    const parse = (handler) => (e) => { if (isMounted) handler(JSON.parse(e.data)); };
+    stream.addEventListener('snapshot', parse((data) => { stopPolling(); applyMarketPayload(data); }));
+    stream.addEventListener('candles', parse(applyCandleDelta));
+    stream.addEventListener('status', parse(applyStatusDelta));
+    stream.onerror = () => { if (isMounted) startPolling(); };
 
     // Função de limpeza: roda quando o componente é destruído (ex: ao fazer logout)
-    return () => { isMounted = false; };
+    return () => { isMounted = false; stopPolling(); stream.close(); };
 }, []);
   const getStatusCardProps = () => {
     if (marketData.activeTrade) {
@@ -0,0 +1,52 @@
+// Formato colunar das respostas (?format=columnar): { length, columns: { campo: [valores] } }
+// No formato colunar os timestamps chegam em epoch ms; nos deltas do stream chegam em texto ISO.
+
+export const isColumnar = (value) => !!value && !Array.isArray(value) && value.columns !== undefined && value.length !== undefined;
+
+export const toMs = (t) => (typeof t === 'number' ? t : Date.parse(t));
+
+// Colunas -> lista de objetos (para componentes que só aceitam linhas, ex: recharts)
+export const fromColumns = (table) => {
+    if (!isColumnar(table)) return table || [];
+    const fields = Object.keys(table.columns);
+    const rows = new Array(table.length);
+    for (let i = 0; i < table.length; i++) {
+        const row = {};
+        fields.forEach(f => { row[f] = table.columns[f][i]; });
+        rows[i] = row;
+    }
+    return rows;
+};
+
+// Emenda candles do delta (linhas) no final da lista, substituindo o candle em formação.
+// Funciona com a lista em linhas ou em colunas e mantém no máximo `maxCandles`.
+export const mergeCandles = (candles, rows, maxCandles) => {
+    if (!isColumnar(candles)) {
+        const merged = candles.slice();
+        rows.forEach(c => {
+            const last = merged[merged.length - 1];
+            if (last && toMs(last.timestamp) === toMs(c.timestamp)) merged[merged.length - 1] = c; // Candle em formação
+            else if (!last || toMs(c.timestamp) > toMs(last.timestamp)) merged.push(c);
+        });
+        return merged.length > maxCandles ? merged.slice(merged.length - maxCandles) : merged;
+    }
+
+    const fields = Object.keys(candles.columns);
+    const columns = {};
+    fields.forEach(f => { columns[f] = candles.columns[f].slice(); });
+    const times = columns.timestamp;
+    rows.forEach(c => {
+        const ts = toMs(c.timestamp);
+        const lastTs = times.length ? times[times.length - 1] : null;
+        if (lastTs !== null && ts < lastTs) return;
+        const replace = lastTs === ts;
+        fields.forEach(f => {
+            const value = f === 'timestamp' ? ts : c[f];
+            if (replace) columns[f][columns[f].length - 1] = value;
+            else columns[f].push(value);
+        });
+    });
+    const excess = Math.max(times.length - maxCandles, 0);
+    if (excess) fields.forEach(f => { columns[f] = columns[f].slice(excess); });
+    return { length: columns.timestamp.length, columns };
+};
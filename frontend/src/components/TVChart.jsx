@@ -1,5 +1,6 @@
 import React, { useEffect, useRef } from 'react';
 import { createChart, ColorType, CrosshairMode, LineStyle } from 'lightweight-charts';
+import { isColumnar } from '../columnar';
 
 export default function TVChart({ data, levels, trades = [], activeTrade = null, panorama = false, symbol }) {
     const chartContainerRef = useRef();
@@ -75,8 +76,11 @@ export default function TVChart({ data, levels, trades = [], activeTrade = null,
     useEffect(() => {
         if (!chartInstance.current || !seriesRef.current || !data) return;
 
+        // Candles em linhas (lista de objetos) ou em colunas (?format=columnar: arrays paralelos, tempo em ms)
         const candlesList = Array.isArray(data) ? data : data.candles;
         if (!candlesList || candlesList.length === 0) return;
+        const columns = isColumnar(candlesList) ? candlesList.columns : null;
+        const get = columns ? (i, f) => columns[f][i] : (i, f) => candlesList[i][f];
         const formatTime = (tStr) => new Date(tStr).getTime() / 1000;
         
         const candlesData = []; const emaData = []; const bbU = []; const bbL = []; const fibo50Data = []; const fibo618Data = [];
@@ -84,15 +88,16 @@ export default function TVChart({ data, levels, trades = [], activeTrade = null,
         let fiboLow = levels?.fibo_low ? parseFloat(levels.fibo_low) : 0;
         const dataMap = new Map();
 
-        candlesList.forEach(d => {
-            if(!d.open) return;
-            const time = formatTime(d.timestamp);
-            if(dataMap.has(time)) return;
+        for (let i = 0; i < candlesList.length; i++) {
+            if(!get(i, 'open')) continue;
+            const time = formatTime(get(i, 'timestamp'));
+            if(dataMap.has(time)) continue;
             dataMap.set(time, true);
-            candlesData.push({ time, open: parseFloat(d.open), high: parseFloat(d.high), low: parseFloat(d.low), close: parseFloat(d.close) });
-            if (d.bb_upper) bbU.push({ time, value: parseFloat(d.bb_upper) });
-            if (d.bb_lower) bbL.push({ time, value: parseFloat(d.bb_lower) });
-            if (d.ema200) emaData.push({ time, value: parseFloat(d.ema200) });
+            candlesData.push({ time, open: parseFloat(get(i, 'open')), high: parseFloat(get(i, 'high')), low: parseFloat(get(i, 'low')), close: parseFloat(get(i, 'close')) });
+            const bbUpper = get(i, 'bb_upper'), bbLower = get(i, 'bb_lower'), ema200 = get(i, 'ema200');
+            if (bbUpper) bbU.push({ time, value: parseFloat(bbUpper) });
+            if (bbLower) bbL.push({ time, value: parseFloat(bbLower) });
+            if (ema200) emaData.push({ time, value: parseFloat(ema200) });
             
             // Lógica Fibbo: Só desenha se houver um topo/fundo válido detectado nos ultimos 50 candles
             if(fiboHigh > 0 && fiboLow > 0 && fiboHigh > fiboLow) {
@@ -100,7 +105,7 @@ export default function TVChart({ data, levels, trades = [], activeTrade = null,
                 fibo50Data.push({ time, value: fiboHigh - (range * 0.5) });
                 fibo618Data.push({ time, value: fiboHigh - (range * 0.618) });
             }
-        });
+        }
 
         const sortByTime = (arr) => arr.sort((a, b) => a.time - b.time);
         sortByTime(candlesData); sortByTime(emaData); sortByTime(bbU); sortByTime(bbL);